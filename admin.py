@@ -1,10 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import get_async_session, User
+from models import get_async_session
+from schemas import DailySales, ProductSales, CategorySales, CitySales, AdminOrderPage, CompleteOrders, CompletedOrders
+from users import CachedUser
+import analytics
+import order_export
 import requests as rq
 
 router = APIRouter(prefix="/admin")
 
+
+async def require_admin(tg_id: int) -> CachedUser:
+    user = await rq.add_user(tg_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not an admin")
+    return user
+
+
 @router.get("/check-admin/{tg_id}")
 async def check_admin(
     tg_id: int,
@@ -14,3 +30,92 @@ async def check_admin(
     if not user or user.role != "admin":
         raise HTTPException(status_code=403, detail="Not an admin")
     return {"isAdmin": True}
+
+
+# Аналитика: читает только дневные агрегаты (см. analytics.py); по умолчанию — последние 30 дней
+@router.get("/analytics/daily", response_model=List[DailySales])
+async def analytics_daily(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    city: Optional[str] = None,
+    admin: CachedUser = Depends(require_admin)
+):
+    return await analytics.daily_sales(date_from, date_to, city)
+
+
+@router.get("/analytics/products", response_model=List[ProductSales])
+async def analytics_products(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    admin: CachedUser = Depends(require_admin)
+):
+    return await analytics.product_sales(date_from, date_to, category, city, limit)
+
+
+@router.get("/analytics/categories", response_model=List[CategorySales])
+async def analytics_categories(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    city: Optional[str] = None,
+    admin: CachedUser = Depends(require_admin)
+):
+    return await analytics.category_sales(date_from, date_to, city)
+
+
+@router.get("/analytics/cities", response_model=List[CitySales])
+async def analytics_cities(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    admin: CachedUser = Depends(require_admin)
+):
+    return await analytics.city_sales(date_from, date_to)
+
+
+# Очередь заказов: фильтры и keyset-пагинация по id (см. requests.list_orders); id_desc — новые первыми
+@router.get("/orders", response_model=AdminOrderPage)
+async def list_orders(
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sort: str = "id_desc",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    admin: CachedUser = Depends(require_admin)
+):
+    return await rq.list_orders(completed, city, payment_method, date_from, date_to, sort, cursor, limit)
+
+
+# Закрытие пачки заказов одним UPDATE; в ответе id закрытых (уже закрытые и чужие фильтру не попадут)
+@router.post("/orders/complete", response_model=CompletedOrders)
+async def complete_orders(
+    body: CompleteOrders,
+    admin: CachedUser = Depends(require_admin)
+):
+    ids = await rq.complete_orders(
+        body.ids, body.city, body.payment_method, body.date_from, body.date_to,
+        limit=None if body.ids is not None else body.limit,
+    )
+    return CompletedOrders(completed=ids)
+
+
+# Выгрузка заказов со строками потоком (см. order_export.py); completed — только закрытые/открытые
+@router.get("/orders/export")
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+    admin: CachedUser = Depends(require_admin)
+):
+    filename = f"orders-{date.today().isoformat()}.{format}"
+    return StreamingResponse(
+        order_export.stream_orders(format, date_from, date_to, completed, city),
+        media_type=order_export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,315 @@
+"""Дневные агрегаты продаж для админской аналитики.
+
+sales_daily (день × товар × город) и orders_daily (день × город) пополняются
+в той же транзакции, что создаёт заказ (record_orders) или закрывает его
+(record_completions). Эндпоинты /admin/analytics/* читают только агрегаты,
+поэтому их время не зависит от объёма истории заказов.
+
+Пересчёт агрегатов с нуля по orders/order_products и их архиву:
+
+    python analytics.py rebuild
+
+Выручка строк при пересчёте считается по текущим ценам товаров — цены на
+момент заказа в order_products не хранятся.
+"""
+import asyncio
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from fastapi import HTTPException
+from sqlalchemy import Float, cast, delete, desc, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from models import engine, read_session, Order, OrderProducts, OrdersDaily, Product, SalesDaily
+from order_archive import ORDER_TABLES
+from schemas import OrderItem, DailySales, ProductSales, CategorySales, CitySales
+
+Executor = Union[AsyncSession, AsyncConnection]
+
+SALES_KEYS = ("day", "product_id", "city")
+SALES_COUNTERS = ("units", "revenue", "completed_units")
+ORDER_KEYS = ("day", "city")
+ORDER_COUNTERS = ("orders", "revenue", "completed_orders", "completed_revenue")
+
+# Заказов за один проход пересчёта
+REBUILD_CHUNK_SIZE = 50_000
+INSERT_CHUNK_SIZE = 5_000
+DEFAULT_PERIOD_DAYS = 30
+
+
+def _upsert(model, keys: Sequence[str], counters: Sequence[str]):
+    """INSERT ... ON CONFLICT (ключ) DO UPDATE SET счётчик = счётчик + excluded.счётчик"""
+    insert_ = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_(model)
+    columns = model.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: columns[name] + stmt.excluded[name] for name in counters},
+    )
+
+
+async def _accumulate(executor: Executor, model, keys, counters, rows: Dict[tuple, dict]) -> None:
+    if not rows:
+        return
+    await executor.execute(
+        _upsert(model, keys, counters),
+        [{**dict(zip(keys, key)), **values} for key, values in sorted(rows.items())],
+    )
+
+
+def _zero(counters: Sequence[str]) -> dict:
+    return {name: 0 for name in counters}
+
+
+async def record_orders(executor: Executor, orders: Iterable[tuple[dict, Dict[int, Product], List[OrderItem]]]) -> None:
+    """Добавляет новые заказы в агрегаты; orders — (поля строки orders, списанные товары, позиции)"""
+    sales: Dict[tuple, dict] = {}
+    daily: Dict[tuple, dict] = {}
+    for values, products, items in orders:
+        day, city = values["timestamp"], values["city"]
+        totals = daily.setdefault((day, city), _zero(ORDER_COUNTERS))
+        totals["orders"] += 1
+        totals["revenue"] += values["order_sum"]
+        for it in items:
+            product = products[it.id]
+            line = sales.setdefault((day, it.id, city), {"category": product.category, **_zero(SALES_COUNTERS)})
+            line["units"] += it.quantity
+            line["revenue"] += product.price * it.quantity
+
+    # Ключи по возрастанию: одинаковый порядок захвата строк у параллельных транзакций
+    await _accumulate(executor, OrdersDaily, ORDER_KEYS, ORDER_COUNTERS, daily)
+    await _accumulate(executor, SalesDaily, SALES_KEYS, SALES_COUNTERS, sales)
+
+
+async def record_completions(executor: Executor, orders: Sequence) -> None:
+    """Учитывает закрытые заказы; orders — строки с id, timestamp, city, order_sum"""
+    if not orders:
+        return
+    daily: Dict[tuple, dict] = {}
+    for order in orders:
+        totals = daily.setdefault((order.timestamp, order.city), _zero(ORDER_COUNTERS))
+        totals["completed_orders"] += 1
+        totals["completed_revenue"] += order.order_sum
+
+    sales: Dict[tuple, dict] = {}
+    ids = [order.id for order in orders]
+    for start in range(0, len(ids), INSERT_CHUNK_SIZE):
+        lines = await executor.execute(
+            select(Order.timestamp, Order.city, OrderProducts.product_id, OrderProducts.quantity, Product.category)
+            .join(OrderProducts, OrderProducts.order_id == Order.id)
+            .join(Product, Product.id == OrderProducts.product_id)
+            .where(Order.id.in_(ids[start:start + INSERT_CHUNK_SIZE]))
+        )
+        for line in lines:
+            totals = sales.setdefault(
+                (line.timestamp, line.product_id, line.city),
+                {"category": line.category, **_zero(SALES_COUNTERS)},
+            )
+            totals["completed_units"] += line.quantity
+
+    await _accumulate(executor, OrdersDaily, ORDER_KEYS, ORDER_COUNTERS, daily)
+    await _accumulate(executor, SalesDaily, SALES_KEYS, SALES_COUNTERS, sales)
+
+
+# Пересчёт
+def _read_frame(sync_conn, stmt):
+    import pandas as pd
+    return pd.read_sql(stmt, sync_conn)
+
+
+def _order_rollup(orders):
+    completed = orders["completed"].astype(bool)
+    frame = orders.assign(
+        orders=1,
+        completed_orders=completed.astype(int),
+        completed_revenue=orders["revenue"].where(completed, 0.0),
+    )
+    return frame.groupby(list(ORDER_KEYS), as_index=False)[list(ORDER_COUNTERS)].sum()
+
+
+def _sales_rollup(orders, lines):
+    frame = lines.merge(orders[["id", "day", "city", "completed"]], left_on="order_id", right_on="id")
+    frame["revenue"] = frame["price"] * frame["quantity"]
+    frame["completed_units"] = frame["quantity"].where(frame["completed"].astype(bool), 0)
+    return frame.groupby(list(SALES_KEYS), as_index=False).agg(
+        category=("category", "first"),
+        units=("quantity", "sum"),
+        revenue=("revenue", "sum"),
+        completed_units=("completed_units", "sum"),
+    )
+
+
+async def _insert_frame(conn: AsyncConnection, model, frame) -> None:
+    frame = frame.assign(**{c: frame[c].round(2) for c in frame.columns if "revenue" in c})
+    records = frame.to_dict("records")
+    for start in range(0, len(records), INSERT_CHUNK_SIZE):
+        await conn.execute(insert(model), records[start:start + INSERT_CHUNK_SIZE])
+
+
+async def rebuild_rollups(chunk_size: int = REBUILD_CHUNK_SIZE) -> dict:
+    """Пересчитывает агрегаты по всей истории заказов пачками по chunk_size заказов"""
+    import pandas as pd
+
+    order_parts, sales_parts = [], []
+    async with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # Новые заказы ждут конца пересчёта, иначе они попали бы в агрегаты дважды или ни разу
+            await conn.execute(text("LOCK TABLE orders IN SHARE MODE"))
+        await conn.execute(delete(SalesDaily))
+        await conn.execute(delete(OrdersDaily))
+
+        # Живые и архивные заказы (order_archive.py) по очереди: агрегатам порядок не важен
+        for order_table, line_table in ORDER_TABLES:
+            last_id = 0
+            while True:
+                orders = await conn.run_sync(_read_frame, (
+                    select(
+                        order_table.c.id, order_table.c.timestamp.label("day"), order_table.c.city,
+                        order_table.c.completed, cast(order_table.c.order_sum, Float).label("revenue"),
+                    )
+                    .where(order_table.c.id > last_id)
+                    .order_by(order_table.c.id)
+                    .limit(chunk_size)
+                ))
+                if orders.empty:
+                    break
+                first_id, last_id = int(orders["id"].iloc[0]), int(orders["id"].iloc[-1])
+                lines = await conn.run_sync(_read_frame, (
+                    select(
+                        line_table.c.order_id, line_table.c.product_id, line_table.c.quantity,
+                        Product.category, cast(Product.price, Float).label("price"),
+                    )
+                    .join(Product, Product.id == line_table.c.product_id)
+                    .where(line_table.c.order_id.between(first_id, last_id))
+                ))
+                order_parts.append(_order_rollup(orders))
+                sales_parts.append(_sales_rollup(orders, lines))
+
+        # Частичные агрегаты соседних пачек могут делить день — сводим их ещё раз
+        daily = pd.concat(order_parts).groupby(list(ORDER_KEYS), as_index=False).sum() if order_parts else None
+        sales = pd.concat(sales_parts).groupby(list(SALES_KEYS), as_index=False).agg(
+            category=("category", "first"),
+            units=("units", "sum"),
+            revenue=("revenue", "sum"),
+            completed_units=("completed_units", "sum"),
+        ) if sales_parts else None
+        if daily is not None:
+            await _insert_frame(conn, OrdersDaily, daily)
+        if sales is not None and not sales.empty:
+            await _insert_frame(conn, SalesDaily, sales)
+
+    return {
+        "orders_daily": 0 if daily is None else len(daily),
+        "sales_daily": 0 if sales is None else len(sales),
+    }
+
+
+# Чтение
+def _period(date_from: Optional[date], date_to: Optional[date]) -> tuple[date, date]:
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(400, "date_from must not be after date_to")
+    return date_from, date_to
+
+
+async def daily_sales(date_from: Optional[date], date_to: Optional[date], city: Optional[str] = None) -> List[DailySales]:
+    date_from, date_to = _period(date_from, date_to)
+    stmt = (
+        select(
+            OrdersDaily.day,
+            func.sum(OrdersDaily.orders).label("orders"),
+            func.sum(OrdersDaily.revenue).label("revenue"),
+            func.sum(OrdersDaily.completed_orders).label("completed_orders"),
+            func.sum(OrdersDaily.completed_revenue).label("completed_revenue"),
+        )
+        .where(OrdersDaily.day.between(date_from, date_to))
+        .group_by(OrdersDaily.day)
+        .order_by(OrdersDaily.day)
+    )
+    if city is not None:
+        stmt = stmt.where(OrdersDaily.city == city)
+    async with read_session() as session:
+        rows = await session.execute(stmt)
+        return [DailySales.model_validate(row._asdict()) for row in rows]
+
+
+async def city_sales(date_from: Optional[date], date_to: Optional[date]) -> List[CitySales]:
+    date_from, date_to = _period(date_from, date_to)
+    revenue = func.sum(OrdersDaily.revenue).label("revenue")
+    stmt = (
+        select(
+            OrdersDaily.city,
+            func.sum(OrdersDaily.orders).label("orders"),
+            revenue,
+            func.sum(OrdersDaily.completed_orders).label("completed_orders"),
+            func.sum(OrdersDaily.completed_revenue).label("completed_revenue"),
+        )
+        .where(OrdersDaily.day.between(date_from, date_to))
+        .group_by(OrdersDaily.city)
+        .order_by(desc(revenue))
+    )
+    async with read_session() as session:
+        rows = await session.execute(stmt)
+        return [CitySales.model_validate(row._asdict()) for row in rows]
+
+
+def _sales_totals(*group_by):
+    revenue = func.sum(SalesDaily.revenue).label("revenue")
+    return select(
+        *group_by,
+        func.sum(SalesDaily.units).label("units"),
+        revenue,
+        func.sum(SalesDaily.completed_units).label("completed_units"),
+    ).group_by(*group_by).order_by(desc(revenue))
+
+
+async def product_sales(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    limit: int = 50,
+) -> List[ProductSales]:
+    """Товары по убыванию выручки за период"""
+    date_from, date_to = _period(date_from, date_to)
+    stmt = _sales_totals(SalesDaily.product_id)
+    # Категория товара может меняться — берём любую из его строк за период
+    stmt = stmt.add_columns(func.max(SalesDaily.category).label("category"))
+    stmt = stmt.where(SalesDaily.day.between(date_from, date_to)).limit(limit)
+    if category is not None:
+        stmt = stmt.where(SalesDaily.category == category)
+    if city is not None:
+        stmt = stmt.where(SalesDaily.city == city)
+    async with read_session() as session:
+        rows = await session.execute(stmt)
+        return [ProductSales.model_validate(row._asdict()) for row in rows]
+
+
+async def category_sales(date_from: Optional[date], date_to: Optional[date], city: Optional[str] = None) -> List[CategorySales]:
+    date_from, date_to = _period(date_from, date_to)
+    stmt = _sales_totals(SalesDaily.category)
+    stmt = stmt.where(SalesDaily.day.between(date_from, date_to))
+    if city is not None:
+        stmt = stmt.where(SalesDaily.city == city)
+    async with read_session() as session:
+        rows = await session.execute(stmt)
+        return [CategorySales.model_validate(row._asdict()) for row in rows]
+
+
+async def _main(argv: List[str]) -> None:
+    if argv[1:] != ["rebuild"]:
+        print("usage: python analytics.py rebuild")
+        sys.exit(2)
+    from models import init_db
+    await init_db()
+    counts = await rebuild_rollups()
+    await engine.dispose()
+    print(f"rollups rebuilt: {counts['orders_daily']} day×city rows, {counts['sales_daily']} day×product×city rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
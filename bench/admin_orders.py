@@ -0,0 +1,144 @@
+"""Очередь заказов для админов: страница с фильтрами без индексов и с ними, закрытие пачкой.
+
+    python -m bench.admin_orders [orders]
+
+Заводит orders заказов с разными городами, способами оплаты и датами;
+седьмая часть открыта. Для каждого фильтра меряет первую страницу и 20-ю (по
+курсору) без индексов ix_orders_admin_* и с ними, и печатает план запроса.
+Затем закрывает BATCH заказов по одному (update_order) и одним
+complete_orders по списку id и по фильтру, проверяя, что агрегаты
+completed_orders выросли ровно на число закрытых.
+"""
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+
+from bench.common import use_temp_database, seed_orders, seed_products
+
+use_temp_database("admin-orders")
+
+from sqlalchemy import case, func, select, text, update
+
+from models import async_session, engine, init_db, Order, OrdersDaily
+import analytics
+import requests as rq
+
+USERS = 100
+SEED_CHUNK = 50_000
+BATCH = 500
+PAGES = 20
+INDEXES = {
+    "ix_orders_admin_queue": "orders (completed, id, city, payment_method, timestamp)",
+    "ix_orders_admin_city": "orders (city, completed, id, payment_method, timestamp)",
+}
+TODAY = date.today()
+FILTERS = {
+    "open queue": {"completed": False},
+    "open, city": {"completed": False, "city": "city-7"},
+    "open, payment": {"completed": False, "payment_method": "cash"},
+    "open, last 30 days": {"completed": False, "date_from": TODAY - timedelta(days=30)},
+    "completed, city, payment": {"completed": True, "city": "city-3", "payment_method": "card"},
+    # Редкий фильтр: без индекса страница дочитывается по всей таблице
+    "open, one day": {"completed": False, "date_from": TODAY - timedelta(days=200), "date_to": TODAY - timedelta(days=200)},
+}
+
+
+async def seed(count: int) -> None:
+    users = [await rq.add_user(1_000 + i) for i in range(USERS)]
+    seeded = 0
+    while seeded < count:
+        step = min(SEED_CHUNK, count - seeded)
+        for i in range(USERS):
+            await seed_orders(users[i].id, step // USERS, 1)
+        seeded += step
+    async with engine.begin() as conn:
+        await conn.execute(update(Order).values(
+            city=func.printf("city-%d", Order.id % 20),
+            payment_method=case((Order.id % 3 == 0, "cash"), (Order.id % 3 == 1, "card"), else_="sbp"),
+            timestamp=func.date(TODAY.isoformat(), func.printf("-%d days", Order.id % 365)),
+            completed=Order.id % 7 != 0,
+        ))
+    await analytics.rebuild_rollups()
+
+
+async def completed_total() -> int:
+    async with async_session() as session:
+        return await session.scalar(select(func.sum(OrdersDaily.completed_orders)))
+
+
+async def page_latency(filters: dict) -> tuple[float, float]:
+    started = time.perf_counter()
+    page = await rq.list_orders(**filters)
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(PAGES - 1):
+        if page.next_cursor is None:
+            break
+        page = await rq.list_orders(**filters, cursor=page.next_cursor)
+    deep = (time.perf_counter() - started) / (PAGES - 1)
+    return first, deep
+
+
+async def plan(filters: dict) -> str:
+    stmt = rq._order_filters(select(Order), **filters).order_by(Order.id.desc()).limit(51)
+    compiled = stmt.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))).all()
+    return "; ".join(r[-1] for r in rows)
+
+
+async def main(count: int) -> None:
+    await init_db()
+    await seed_products(500)
+    await seed(count)
+
+    results = {}
+    for indexed in (False, True):
+        async with engine.begin() as conn:
+            for name, columns in INDEXES.items():
+                if indexed:
+                    await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}"))
+                else:
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            await conn.execute(text("ANALYZE"))
+        for label, filters in FILTERS.items():
+            results[label, indexed] = await page_latency(filters)
+            if indexed:
+                print(f"  plan {label}: {await plan(filters)}")
+    for label in FILTERS:
+        (f0, d0), (f1, d1) = results[label, False], results[label, True]
+        print(f"{label:<26} first page {f0 * 1000:7.1f}ms -> {f1 * 1000:6.1f}ms, "
+              f"page {PAGES} {d0 * 1000:7.1f}ms -> {d1 * 1000:6.1f}ms")
+
+    # Закрытие: BATCH заказов по одному, затем пачкой по id и по фильтру
+    before = await completed_total()
+    open_page = await rq.list_orders(completed=False, sort="id", limit=3 * BATCH)
+    ids = [o.id for o in open_page.items]
+    one_by_one, by_ids = ids[:BATCH], ids[BATCH:2 * BATCH]
+
+    started = time.perf_counter()
+    for order_id in one_by_one:
+        await rq.update_order(order_id)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    closed = await rq.complete_orders(ids=by_ids)
+    bulk = time.perf_counter() - started
+    assert closed == sorted(by_ids)
+    # Повторное закрытие ничего не меняет
+    assert await rq.complete_orders(ids=by_ids) == []
+
+    started = time.perf_counter()
+    filtered = await rq.complete_orders(city="city-5", limit=BATCH)
+    bulk_filter = time.perf_counter() - started
+    assert len(filtered) == BATCH
+
+    assert await completed_total() == before + 3 * BATCH
+    print(f"complete {BATCH}: one by one {single * 1000:.0f}ms, by ids {bulk * 1000:.0f}ms, "
+          f"by filter {bulk_filter * 1000:.0f}ms; rollups +{3 * BATCH} completed")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
@@ -0,0 +1,136 @@
+"""Открытие мини-приложения: четыре запроса по очереди против одного /api/bootstrap.
+
+    python -m bench.bootstrap [products] [opens]
+
+Клиент ходит в приложение in-process через транспорт, который добавляет к
+каждому запросу задержку мобильной сети: RTT и время передачи тела на
+BANDWIDTH байт/с (соединение уже открыто, TLS-рукопожатие не считаем).
+Для каждого RTT из NETWORKS меряет opens открытий:
+
+- cold: у клиента ничего нет — /api/users, /api/is-admin, /api/products,
+  /api/orders по очереди против одного /api/bootstrap;
+- warm: каталог и заказы у клиента уже есть — те же четыре запроса с
+  If-None-Match на каталог против /api/bootstrap с версиями частей.
+
+Каждое открытие — от своего пользователя, как у разных людей. Перед
+замерами проверяет, что части bootstrap совпадают с ответами отдельных
+эндпоинтов.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from bench.common import use_temp_database, seed_orders, seed_products, summarize
+
+use_temp_database("bootstrap")
+# Все открытия идут с одного адреса и упёрлись бы в лимиты rate_limit
+os.environ["RATE_LIMIT"] = "false"
+
+import httpx
+
+from main import app
+from models import engine, init_db
+import requests as rq
+
+USERS = 200
+ORDERS_PER_USER = 5
+# RTT в секундах: локально, хороший LTE, средний 4G, 3G
+NETWORKS = (0.0, 0.05, 0.15, 0.3)
+BANDWIDTH = 1_000_000
+
+
+class MobileTransport(httpx.AsyncBaseTransport):
+    """ASGI-транспорт с задержкой сети: RTT на запрос и передача тела на BANDWIDTH"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, rtt: float):
+        self.inner = inner
+        self.rtt = rtt
+        self.received = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.rtt)
+        response = await self.inner.handle_async_request(request)
+        # Сырые байты, как по сети: gzip раскроет уже клиент
+        body = b"".join([chunk async for chunk in response.aiter_raw()])
+        self.received += len(body)
+        if self.rtt:
+            await asyncio.sleep(len(body) / BANDWIDTH)
+        return httpx.Response(response.status_code, headers=response.headers, content=body)
+
+
+async def four_calls(client, tg_id: int, catalog_etag: str | None = None) -> None:
+    for path in (f"/api/users/{tg_id}", f"/api/is-admin/{tg_id}"):
+        (await client.get(path)).raise_for_status()
+    headers = {"If-None-Match": catalog_etag} if catalog_etag else {}
+    await client.get("/api/products", headers=headers)
+    (await client.get(f"/api/orders/{tg_id}")).raise_for_status()
+
+
+async def one_call(client, tg_id: int, versions: dict | None = None) -> None:
+    (await client.get(f"/api/bootstrap/{tg_id}", params=versions or {})).raise_for_status()
+
+
+async def check(client, tg_id: int) -> tuple[dict, str]:
+    boot = (await client.get(f"/api/bootstrap/{tg_id}")).json()
+    products = await client.get("/api/products")
+    assert boot["catalog"] == products.json()
+    assert boot["orders"] == (await client.get(f"/api/orders/{tg_id}")).json()
+    assert boot["user"] == (await client.get(f"/api/users/{tg_id}")).json()
+    assert boot["isAdmin"] == (await client.get(f"/api/is-admin/{tg_id}")).json()["isAdmin"]
+    cached = (await client.get(f"/api/bootstrap/{tg_id}", params=boot["versions"])).json()
+    assert cached["catalog"] is None and cached["orders"] is None
+    return boot["versions"], products.headers["etag"]
+
+
+async def measure(client, transport: MobileTransport, opens: int, tg_ids: list, open_app) -> tuple[dict, float]:
+    """Задержки открытия и байт по сети на одно открытие"""
+    samples = []
+    received = transport.received
+    for i in range(opens):
+        tg_id = tg_ids[i % len(tg_ids)]
+        started = time.perf_counter()
+        await open_app(client, tg_id)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples), (transport.received - received) / opens
+
+
+async def main(products: int, opens: int) -> None:
+    await init_db()
+    await seed_products(products)
+    tg_ids = [2_000_000 + i for i in range(USERS)]
+    for tg_id in tg_ids:
+        await seed_orders((await rq.add_user(tg_id)).id, ORDERS_PER_USER, 2)
+
+    asgi = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=asgi, base_url="http://bench") as client:
+        per_user = {tg_id: await check(client, tg_id) for tg_id in tg_ids}
+    print(f"{products} products, {ORDERS_PER_USER} open orders per user: bootstrap sections match the four endpoints")
+
+    scenarios = {
+        "cold": (
+            lambda c, t: four_calls(c, t),
+            lambda c, t: one_call(c, t),
+        ),
+        "warm": (
+            lambda c, t: four_calls(c, t, per_user[t][1]),
+            lambda c, t: one_call(c, t, per_user[t][0]),
+        ),
+    }
+    for rtt in NETWORKS:
+        transport = MobileTransport(asgi, rtt)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, (sequential, bootstrap) in scenarios.items():
+                four, four_bytes = await measure(client, transport, opens, tg_ids, sequential)
+                one, one_bytes = await measure(client, transport, opens, tg_ids, bootstrap)
+                print(f"rtt={rtt * 1000:3.0f}ms {name}  4 calls p50={four['p50_ms']:7.1f}ms p95={four['p95_ms']:7.1f}ms "
+                      f"({four_bytes / 1024:6.1f}KB)  bootstrap p50={one['p50_ms']:7.1f}ms p95={one['p95_ms']:7.1f}ms "
+                      f"({one_bytes / 1024:6.1f}KB)  {four['p50_ms'] / one['p50_ms']:.1f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    ))
@@ -0,0 +1,55 @@
+"""Массовое изменение остатков: цикл session.get по строке против условных UPDATE пачкой.
+
+    python -m bench.bulk_quantities [products] [deltas ...]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from bench.common import use_temp_database, seed_products
+
+use_temp_database("bulk")
+
+from models import async_session, engine, init_db, Product
+from schemas import QuantityDelta
+import inventory
+
+
+async def per_row_loop(updates: list[QuantityDelta]) -> None:
+    """Прежняя реализация /api/products/update-quantities"""
+    async with async_session() as session:
+        for update in updates:
+            product = await session.get(Product, update.product_id)
+            product.quantity += update.change
+        await session.commit()
+
+
+async def set_based(updates: list[QuantityDelta]) -> None:
+    async with async_session() as session:
+        result = await inventory.apply_bulk_deltas(session, updates)
+        assert result.applied, result.rejections[:3]
+        await session.commit()
+
+
+async def main() -> None:
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    sizes = [int(a) for a in sys.argv[2:]] or [100, 1_000, 5_000]
+    await init_db()
+    await seed_products(products)
+
+    rnd = random.Random(1)
+    for size in sizes:
+        ids = rnd.sample(range(1, products + 1), size)
+        # Только приходы, чтобы обе реализации применяли одно и то же
+        updates = [QuantityDelta(product_id=i, change=rnd.randint(1, 20)) for i in ids]
+        for impl in (per_row_loop, set_based):
+            started = time.perf_counter()
+            await impl(updates)
+            elapsed = time.perf_counter() - started
+            print(f"deltas={size:<6} {impl.__name__:<13} {elapsed * 1000:9.1f}ms  {size / elapsed:9.0f} deltas/s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
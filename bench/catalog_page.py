@@ -0,0 +1,65 @@
+"""Задержка страницы каталога в зависимости от размера таблицы products.
+
+    python -m bench.catalog_page 1000 100000 1000000
+
+Для каждого размера создаётся отдельная БД, поэтому размеры гоняются
+в дочерних процессах.
+"""
+import asyncio
+import json
+import subprocess
+import sys
+
+from bench.common import use_temp_database, seed_products, summarize, timer
+
+PAGES = 200
+QUERIES = [
+    {"sort": "id"},
+    {"category": "boots", "sort": "price_asc"},
+    {"category": "sneakers", "min_price": 100, "max_price": 200, "sort": "price_desc"},
+    {"color": "red", "sort": "id"},
+    {"size": 40, "sort": "id"},
+]
+
+
+async def run(size: int) -> dict:
+    use_temp_database("catalog")
+    from models import init_db, engine
+    import requests as rq
+
+    await init_db()
+    await seed_products(size)
+
+    results = {}
+    for query in QUERIES:
+        samples = []
+        cursor = None
+        for _ in range(PAGES):
+            with timer(samples):
+                page = await rq.query_products(cursor=cursor, limit=50, **query)
+            # Уходим вглубь каталога, а не читаем всё время первую страницу
+            cursor = page.next_cursor
+        results[json.dumps(query)] = summarize(samples)
+    await engine.dispose()
+    return results
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--size":
+        print(json.dumps(asyncio.run(run(int(sys.argv[2])))))
+        return
+
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    for size in sizes:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.catalog_page", "--size", str(size)],
+            check=True, capture_output=True, text=True,
+        )
+        results = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"products={size}")
+        for query, stats in results.items():
+            print(f"  {query:<75} p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
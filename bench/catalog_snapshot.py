@@ -0,0 +1,242 @@
+"""Общий снимок каталога: те же байты, что у catalog_cache, память на воркер и отсутствие рваных чтений.
+
+    python -m bench.catalog_snapshot [products] [seconds]
+
+1. Снимок из catalog_snapshot отдаёт ровно то же тело, ETag и карточки, что
+   и catalog_cache.
+2. Память: 1, 2 и 4 процесса-«воркера» одновременно отдают весь каталог и
+   каждую карточку — из своего catalog_cache или из общего снимка. Печатает
+   приватную память процесса (Private_*) и PSS из /proc/self/smaps_rollup:
+   у снимка она в разы меньше и не растёт с числом воркеров.
+3. Рваные чтения: один процесс seconds секунд подряд публикует новые
+   поколения (во всех товарах quantity = номер сборки), читатели в других
+   процессах непрерывно разбирают весь каталог. В каждом прочитанном теле
+   количество у всех товаров одно, ETag совпадает с хешем тела, а поколение
+   у читателя не убывает.
+4. Пересборка не держит event loop: пока идут REBUILDS пересборок, тикер
+   меряет, на сколько опаздывают его сны по 1 мс.
+"""
+import asyncio
+import gc
+import gzip
+import hashlib
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench.common import use_temp_database, seed_products
+
+use_temp_database("catalog-snapshot")
+
+import orjson
+
+from catalog_cache import CatalogCache, catalog_cache
+from catalog_snapshot import CatalogSnapshot, build
+from models import engine, init_db, read_engine
+import requests as rq
+
+WORKERS = (1, 2, 4)
+READERS = 3
+REBUILDS = 5
+
+
+def memory_kb() -> dict:
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if line.endswith("kB\n"))
+    kb = {name: int(value.split()[0]) for name, value in fields.items()}
+    return {"private": kb["Private_Clean"] + kb["Private_Dirty"], "pss": kb["Pss"]}
+
+
+def serve_everything(mode: str, directory: str, ids: list) -> None:
+    """Что делает воркер: отдаёт весь каталог (в том числе gzip) и каждую карточку"""
+    if mode == "cache":
+        cache = CatalogCache(ttl=0)
+
+        async def work():
+            all_body = await cache.render_all(rq.load_all_products)
+            all_body.gzipped()
+            for product_id in ids:
+                await cache.render_one(product_id, rq.load_all_products)
+            await engine.dispose()
+            await read_engine.dispose()
+
+        asyncio.run(work())
+    else:
+        snapshot = CatalogSnapshot(directory, delay=0)
+        snapshot.open()
+        all_body = snapshot.render_all()
+        hashlib.blake2b(all_body.body).digest()
+        hashlib.blake2b(all_body.gzipped()).digest()
+        for product_id in ids:
+            snapshot.render_one(product_id)
+
+
+def worker(mode: str, directory: str, ids: list, barrier, results) -> None:
+    before = memory_kb()
+    serve_everything(mode, directory, ids)
+    # Меряем, когда все воркеры держат каталог одновременно: так PSS делит общие страницы
+    barrier.wait()
+    after = memory_kb()
+    results.put({"private": after["private"] - before["private"], "pss": after["pss"]})
+    barrier.wait()
+
+
+def measure_memory(mode: str, directory: str, ids: list, count: int) -> dict:
+    barrier = multiprocessing.Barrier(count)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(mode, directory, ids, barrier, results)) for _ in range(count)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {
+        "private_mb": max(r["private"] for r in rows) / 1024,
+        "pss_mb": sum(r["pss"] for r in rows) / 1024,
+    }
+
+
+def publisher(directory: str, seconds: float, done) -> None:
+    async def run():
+        base = await rq.load_all_products()
+        await engine.dispose()
+        await read_engine.dispose()
+        builds = 0
+
+        async def loader():
+            return [p.model_copy(update={"quantity": builds}) for p in base]
+
+        snapshot = CatalogSnapshot(directory, delay=0)
+        snapshot.open()
+        snapshot._loader = loader
+        until = time.perf_counter() + seconds
+        while time.perf_counter() < until:
+            builds += 1
+            await snapshot.rebuild()
+        await snapshot.stop()
+        return builds
+
+    done.put(asyncio.run(run()))
+
+
+def reader(directory: str, ids: list, seeded: int, stop, results) -> None:
+    snapshot = CatalogSnapshot(directory, delay=0)
+    snapshot.open()
+    rnd = random.Random()
+    reads = 0
+    generations = set()
+    last = 0
+    try:
+        while not stop.is_set():
+            rendered = snapshot.render_all()
+            generation = snapshot.stats()["mapped_generation"]
+            assert generation >= last, (generation, last)
+            last = generation
+            generations.add(generation)
+            assert rendered.etag.strip('"') == hashlib.blake2b(rendered.body, digest_size=16).hexdigest()
+            # Поколение seeded собрано из БД, где количества разные
+            if generation > seeded:
+                quantities = {p["quantity"] for p in orjson.loads(rendered.body)}
+                assert len(quantities) == 1, f"torn snapshot: quantities {sorted(quantities)[:5]}"
+            product_id = rnd.choice(ids)
+            assert orjson.loads(snapshot.render_one(product_id).body)["id"] == product_id
+            reads += 1
+    except AssertionError as e:
+        results.put({"error": str(e)})
+        return
+    results.put({"reads": reads, "generations": len(generations)})
+
+
+def torn_reads(directory: str, ids: list, seeded: int, seconds: float) -> None:
+    stop = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=publisher, args=(directory, seconds, done))
+    readers = [multiprocessing.Process(target=reader, args=(directory, ids, seeded, stop, results)) for _ in range(READERS)]
+    writer.start()
+    for p in readers:
+        p.start()
+    builds = done.get()
+    writer.join()
+    stop.set()
+    rows = [results.get() for _ in readers]
+    for p in readers:
+        p.join()
+    errors = [r["error"] for r in rows if "error" in r]
+    assert not errors, errors
+    print(f"torn-read check: {builds} generations published in {seconds:.0f}s, "
+          f"{sum(r['reads'] for r in rows)} full reads by {READERS} readers "
+          f"saw {max(r['generations'] for r in rows)} generations, no torn snapshots")
+
+
+async def prepare(products: int, directory: str) -> tuple[list, int]:
+    await init_db()
+    await seed_products(products)
+    snapshot = CatalogSnapshot(directory, delay=0)
+    await snapshot.start(rq.load_all_products)
+
+    cached = await catalog_cache.render_all(rq.load_all_products)
+    mapped = snapshot.render_all()
+    assert bytes(mapped.body) == cached.body and mapped.etag == cached.etag
+    assert gzip.decompress(mapped.gzipped()) == cached.body
+    ids = [p.id for p in await rq.load_all_products()]
+    for product_id in random.sample(ids, 100):
+        assert bytes(snapshot.render_one(product_id).body) == (await catalog_cache.render_one(product_id, rq.load_all_products)).body
+    assert snapshot.render_one(max(ids) + 1) is None
+    print(f"{products} products: snapshot body {len(cached.body) / 2**20:.1f}MB identical to catalog_cache")
+
+    products_list = await rq.load_all_products()
+    started = time.perf_counter()
+    build(products_list, 0)
+    build_ms = (time.perf_counter() - started) * 1000
+    lags = []
+    rebuilding = True
+
+    async def ticker():
+        while rebuilding:
+            tick = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - tick - 0.001)
+
+    # Полная сборка мусора после десятков тысяч новых объектов — своя пауза, к пересборке не относится
+    gc.disable()
+    ticking = asyncio.create_task(ticker())
+    for _ in range(REBUILDS):
+        await snapshot.rebuild()
+    rebuilding = False
+    await ticking
+    gc.enable()
+    lags.sort()
+    print(f"rebuild (build {build_ms:.0f}ms) x{REBUILDS}: loop lag p50={lags[len(lags) // 2] * 1000:.1f}ms "
+          f"max={lags[-1] * 1000:.1f}ms")
+    assert lags[-1] * 1000 < build_ms / 2, (lags[-1], build_ms)
+
+    seeded = snapshot.generation()
+    await snapshot.stop()
+    # Воркеры — форки этого процесса: соединения aiosqlite без своих потоков им не годятся
+    await engine.dispose()
+    await read_engine.dispose()
+    return ids, seeded
+
+
+def main(products: int, seconds: float) -> None:
+    directory = tempfile.mkdtemp(prefix="botshop-snapshot-")
+    ids, seeded = asyncio.run(prepare(products, directory))
+
+    for mode in ("cache", "snapshot"):
+        for count in WORKERS:
+            r = measure_memory(mode, directory, ids, count)
+            print(f"{mode:<8} workers={count} private per worker={r['private_mb']:6.1f}MB total pss={r['pss_mb']:6.1f}MB")
+
+    torn_reads(directory, ids, seeded, seconds)
+    assert not [n for n in os.listdir(directory) if n.endswith(".tmp")]
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 10.0,
+    )
@@ -0,0 +1,92 @@
+"""Общие помощники для бенчмарков: временная БД, генерация данных, статистика.
+
+Модули приложения читают DATABASE_URL при импорте, поэтому use_temp_database()
+нужно вызывать до импорта models/requests/main.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+CATEGORIES = ["shoes", "boots", "sneakers", "sandals", "slippers", "loafers", "heels", "flats"]
+COLORS = ["black", "white", "red", "blue", "green", "brown", "beige", "grey"]
+SIZES = list(range(35, 47))
+
+
+def use_temp_database(name: str = "bench") -> str:
+    """Направляет приложение на свежий SQLite-файл во временном каталоге"""
+    path = os.path.join(tempfile.mkdtemp(prefix=f"botshop-{name}-"), "db.sqlite3")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    return path
+
+
+def product_rows(count: int, start: int = 0, seed: int = 42):
+    rnd = random.Random(seed + start)
+    for i in range(start, start + count):
+        yield {
+            "title": f"Product {i}",
+            "category": rnd.choice(CATEGORIES),
+            "price": round(rnd.uniform(10, 500), 2),
+            "size": rnd.choice(SIZES),
+            "color": rnd.choice(COLORS),
+            "quantity": rnd.randint(0, 100),
+            "min_quantity": 0,
+        }
+
+
+async def seed_products(count: int, batch: int = 10_000) -> None:
+    from sqlalchemy import insert
+    from models import engine, Product
+
+    for start in range(0, count, batch):
+        rows = list(product_rows(min(batch, count - start), start))
+        async with engine.begin() as conn:
+            await conn.execute(insert(Product), rows)
+
+
+async def seed_orders(user_id: int, count: int, lines: int = 3) -> None:
+    """Открытые заказы пользователя по lines позиций; товары берутся из первых 500"""
+    from datetime import date
+    from sqlalchemy import insert
+    from models import engine, Order, OrderProducts
+
+    async with engine.begin() as conn:
+        first = (await conn.execute(
+            insert(Order).returning(Order.id),
+            [{
+                "user": user_id, "timestamp": date.today(), "order_sum": 100, "completed": False,
+                "shipping_address": "addr", "city": "city", "payment_method": "card",
+                "quantity": lines, "email": "", "phone": "",
+            } for _ in range(count)],
+        )).scalars().all()
+        await conn.execute(insert(OrderProducts), [
+            {"order_id": order_id, "product_id": (order_id * 7 + line) % 500 + 1, "quantity": line + 1}
+            for order_id in first for line in range(lines)
+        ])
+
+
+def summarize(samples: list[float]) -> dict:
+    """Сводка по замерам в секундах: среднее и перцентили в миллисекундах"""
+    ordered = sorted(samples)
+
+    def pct(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+@contextmanager
+def timer(samples: list[float]):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - started)
@@ -0,0 +1,114 @@
+"""Скорость и пиковая память потокового импорта CSV.
+
+    python -m bench.csv_import 10000 100000 1000000
+
+Каждый размер гоняется в отдельном процессе со своей БД, чтобы пиковый RSS
+не накапливался между прогонами. Второй проход по тому же файлу проверяет
+ветку обновления существующих товаров. Каждая тысячная строка битая (цена
+n/a, NaN или Infinity, отрицательный остаток, слишком длинное название):
+все они должны попасть в отчёт об ошибках, а не в БД. Отдельно проверяется,
+что ошибка БД в одном чанке не мешает записать остальные.
+"""
+import asyncio
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import use_temp_database, product_rows
+
+# Что портить в каждой тысячной строке
+BROKEN = (("price", "n/a"), ("price", "NaN"), ("price", "Infinity"), ("quantity", "-7"), ("title", "x" * 41))
+
+
+def write_csv(path: str, count: int) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["title", "category", "price", "size", "color", "quantity", "image_url"])
+        writer.writeheader()
+        for i, row in enumerate(product_rows(count)):
+            row.pop("min_quantity")
+            row["image_url"] = ""
+            if i % 1000 == 999:
+                field, value = BROKEN[i // 1000 % len(BROKEN)]
+                row[field] = value  # битая строка для отчёта об ошибках
+            writer.writerow(row)
+
+
+async def check_failed_chunk() -> None:
+    """Чанк, на котором падает INSERT, попадает в отчёт, а соседние чанки записываются"""
+    from sqlalchemy import text
+    from models import engine
+    from upload_products import import_products_csv
+
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TRIGGER bench_reject_boom BEFORE INSERT ON products WHEN NEW.title = 'boom' "
+            "BEGIN SELECT RAISE(ABORT, 'boom rejected'); END"
+        ))
+    lines = ["title,category,price,size,color,quantity"]
+    lines += [f"{title},chunk-check,10.00,40,red,5" for title in ("a", "b", "boom", "c", "d", "e")]
+    path = os.path.join(tempfile.mkdtemp(), "chunks.csv")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with open(path, "rb") as f:
+        report = await import_products_csv(f, chunk_size=2)
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TRIGGER bench_reject_boom"))
+    assert (report["insertedCount"], report["errorCount"]) == (4, 2), report
+    assert "boom rejected" in report["errors"][0]["error"], report["errors"]
+
+
+async def run(count: int) -> dict:
+    use_temp_database("csv")
+    from models import init_db, engine
+    from upload_products import import_products_csv
+
+    await init_db()
+    await check_failed_chunk()
+    path = os.path.join(tempfile.mkdtemp(), "products.csv")
+    write_csv(path, count)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    passes = {}
+    for name in ("insert", "update"):
+        with open(path, "rb") as f:
+            started = time.perf_counter()
+            report = await import_products_csv(f)
+            elapsed = time.perf_counter() - started
+        passes[name] = {
+            "rows_per_s": count / elapsed,
+            "inserted": report["insertedCount"],
+            "updated": report["updatedCount"],
+            "errors": report["errorCount"],
+        }
+        assert report["errorCount"] == count // 1000 and len(report["errors"]) == min(count // 1000, 100), report["errorCount"]
+        assert report["insertedCount"] + report["updatedCount"] == count - count // 1000
+    await engine.dispose()
+    passes["peak_rss_growth_mb"] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    return passes
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--rows":
+        print(json.dumps(asyncio.run(run(int(sys.argv[2])))))
+        return
+
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.csv_import", "--rows", str(size)],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"rows={size} peak_rss_growth={result['peak_rss_growth_mb']:.1f}MB")
+        for name in ("insert", "update"):
+            r = result[name]
+            print(f"  {name:<7} rows/s={r['rows_per_s']:10.0f} inserted={r['inserted']} updated={r['updated']} errors={r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Профили движка БД под смешанной нагрузкой чтения и записи (см. database.py).
+
+    python -m bench.db_profiles [--workers 1] [--duration 10] [--concurrency 32]
+    python -m bench.db_profiles --database-url postgresql+asyncpg://... [--read-url ...]
+
+Засевает шаблонную БД (в режиме журнала по умолчанию) и для каждого профиля
+поднимает uvicorn на её копии с нужными переменными окружения. Клиенты по
+кругу шлют запросы: READ_SHARE — чтения (заказы пользователя, проверка
+админа, страница каталога), остальное — записи (заказ, удержание товара).
+Печатает запросов в секунду, p50/p99 чтений и записей и ответы с ошибками
+(«database is locked» приходит как 500).
+
+SQLite-профили: plain — как было до database.py; wal — WAL и pragma, общий
+пул; wal+writer — ещё и одно соединение записи на воркер, чтения стоят в
+той же очереди; wal+writer+reads — чтения отдельным пулом (по умолчанию).
+С --database-url сравниваются plain, tuned и tuned с репликой (--read-url).
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import seed_products, summarize
+from bench.loadtest import free_port, wait_ready
+
+READ_SHARE = 0.8
+USERS = 500
+PRODUCTS = 2_000
+ORDERS_PER_USER = 20
+SQLITE_PROFILES = {
+    "plain": {"DB_PROFILE": "plain", "DB_READ_ROUTING": "false"},
+    "wal": {"DB_PROFILE": "tuned", "SQLITE_SINGLE_WRITER": "false", "DB_READ_ROUTING": "false"},
+    "wal+writer": {"DB_PROFILE": "tuned", "SQLITE_SINGLE_WRITER": "true", "DB_READ_ROUTING": "false"},
+    "wal+writer+reads": {"DB_PROFILE": "tuned", "SQLITE_SINGLE_WRITER": "true", "DB_READ_ROUTING": "true"},
+}
+# Меряем движок, а не ограничители перед ним
+COMMON_ENV = {
+    "RATE_LIMIT": "false", "MAX_CONCURRENCY": "10000", "MAX_READ_CONCURRENCY": "10000",
+    "ORDER_ARCHIVE": "false", "AUTO_MIGRATE": "false",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--database-url", help="Postgres вместо временной SQLite")
+    parser.add_argument("--read-url", help="реплика для профиля tuned+replica")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+async def seed() -> None:
+    from sqlalchemy import insert, select, update
+    from models import engine, read_engine, init_db, Product, User
+    from bench.common import seed_orders
+
+    await init_db()
+    await seed_products(PRODUCTS)
+    async with engine.begin() as conn:
+        await conn.execute(update(Product).values(quantity=10_000_000, min_quantity=0))
+        await conn.execute(insert(User), [
+            {"tg_id": 1_000_000 + i, "role": "admin" if i == 0 else "user"} for i in range(USERS)
+        ])
+        user_ids = (await conn.execute(select(User.id))).scalars().all()
+    for user_id in user_ids:
+        await seed_orders(user_id, ORDERS_PER_USER, 2)
+    await engine.dispose()
+    await read_engine.dispose()
+
+
+def requests_mix(rnd: random.Random):
+    tg_ids = [1_000_000 + i for i in range(USERS)]
+
+    def orders(client):
+        return client.get(f"/api/orders/{rnd.choice(tg_ids)}")
+
+    def is_admin(client):
+        return client.get(f"/api/is-admin/{rnd.choice(tg_ids)}")
+
+    def catalog_page(client):
+        return client.get("/api/products/page", params={"category": "boots", "sort": "price_asc", "limit": 20})
+
+    def order_create(client):
+        items = [{"id": rnd.randint(1, PRODUCTS), "quantity": 1} for _ in range(rnd.randint(1, 3))]
+        return client.post("/api/order/create", json={
+            "tg_id": rnd.choice(tg_ids), "items": items, "quantity": len(items),
+            "shopping_address": "Lenina 1", "city": "Moscow", "payment_method": "card",
+        })
+
+    def hold(client):
+        return client.post("/api/reservations", json={
+            "tg_id": rnd.choice(tg_ids), "product_id": rnd.randint(1, PRODUCTS), "quantity": rnd.randint(0, 2),
+        })
+
+    reads, writes = [orders, is_admin, catalog_page], [order_create, hold]
+
+    def pick():
+        if rnd.random() < READ_SHARE:
+            return "read", rnd.choice(reads)
+        return "write", rnd.choice(writes)
+
+    return pick
+
+
+async def drive(port: int, args) -> dict:
+    import httpx
+
+    pick = requests_mix(random.Random(args.seed))
+    samples = {"read": [], "write": []}
+    errors: dict = {}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        await wait_ready(client)
+        deadline = time.perf_counter() + args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                kind, make_request = pick()
+                started = time.perf_counter()
+                try:
+                    response = await make_request(client)
+                    code = response.status_code
+                except Exception as e:
+                    code = type(e).__name__
+                samples[kind].append(time.perf_counter() - started)
+                if code != 200:
+                    errors[code] = errors.get(code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+    return {
+        "rps": (len(samples["read"]) + len(samples["write"])) / elapsed,
+        "read": summarize(samples["read"]),
+        "write": summarize(samples["write"]),
+        "errors": errors,
+    }
+
+
+def run_profile(name: str, env: dict, database_url: str, args) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "error"],
+        env={**os.environ, **COMMON_ENV, **env, "DATABASE_URL": database_url},
+    )
+    try:
+        result = asyncio.run(drive(port, args))
+    finally:
+        server.terminate()
+        server.wait()
+    r, w = result["read"], result["write"]
+    print(f"{name:<18} rps={result['rps']:7.1f}  read p50={r['p50_ms']:6.1f}ms p99={r['p99_ms']:7.1f}ms  "
+          f"write p50={w['p50_ms']:6.1f}ms p99={w['p99_ms']:7.1f}ms  errors={result['errors']}")
+    return result
+
+
+def main() -> None:
+    args = parse_args()
+    # Шаблон засевается движком по умолчанию: в файле остаётся журнал отката, как у старых БД
+    os.environ.update(DB_PROFILE="plain", DB_READ_ROUTING="false")
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        asyncio.run(seed())
+        profiles = {
+            "plain": SQLITE_PROFILES["plain"],
+            "tuned": {"DB_PROFILE": "tuned", "DB_READ_ROUTING": "false"},
+        }
+        if args.read_url:
+            profiles["tuned+replica"] = {"DB_PROFILE": "tuned", "DB_READ_ROUTING": "true", "DATABASE_READ_URL": args.read_url}
+        for name, env in profiles.items():
+            run_profile(name, env, args.database_url, args)
+        return
+
+    directory = tempfile.mkdtemp(prefix="botshop-db-profiles-")
+    template = os.path.join(directory, "template.sqlite3")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{template}"
+    asyncio.run(seed())
+    print(f"seeded {PRODUCTS} products, {USERS} users, {USERS * ORDERS_PER_USER} orders; "
+          f"{args.workers} workers, {args.concurrency} clients, {READ_SHARE:.0%} reads")
+    results = {}
+    for name, env in SQLITE_PROFILES.items():
+        path = os.path.join(directory, f"{name}.sqlite3")
+        shutil.copy(template, path)
+        results[name] = run_profile(name, env, f"sqlite+aiosqlite:///{path}", args)
+    plain, tuned = results["plain"], results["wal+writer+reads"]
+    print(f"default profile vs plain: {tuned['rps'] / plain['rps']:.2f}x requests/s, "
+          f"errors {sum(plain['errors'].values())} -> {sum(tuned['errors'].values())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Пропускная способность нарезки картинок и задержка event loop во время неё.
+
+    python -m bench.images [images] [workers ...]
+
+Генерирует JPEG 3000×2000 (как с телефона), прогоняет images.render_image через
+пул потоков разного размера и через пул процессов, параллельно меряя, насколько
+опаздывает тикер event loop. Печатает картинок в секунду и вес размеров.
+"""
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bench.common import use_temp_database
+
+TICK = 0.005
+
+
+def make_photo(seed: int, width: int = 3000, height: int = 2000) -> bytes:
+    from PIL import Image, ImageFilter
+
+    rnd = random.Random(seed)
+    # Шум поверх градиента, чтобы JPEG весил как настоящая фотография, а не как заливка
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width // 4, height // 4), 60).resize((width, height)).convert("RGB")
+    image = Image.blend(image, noise, 0.5).filter(ImageFilter.GaussianBlur(1))
+    tint = Image.new("RGB", (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    image = Image.blend(image, tint, 0.3)
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def measure(executor, photos: list[bytes], directory: str) -> dict:
+    from images import render_image
+
+    loop = asyncio.get_running_loop()
+    lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lag = max(lag, time.perf_counter() - started - TICK)
+
+    tick_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*[loop.run_in_executor(executor, render_image, data, directory) for data in photos])
+    elapsed = time.perf_counter() - started
+    running = False
+    await tick_task
+    return {"per_second": len(photos) / elapsed, "max_loop_lag_ms": lag * 1000}
+
+
+async def main_async(count: int, workers: list[int]) -> None:
+    from images import SIZES
+
+    photos = [make_photo(i) for i in range(count)]
+    print(f"{count} photos, avg {sum(map(len, photos)) / count / 1024:.0f} KB")
+
+    pools = [(f"threads={n}", lambda n=n: ThreadPoolExecutor(n)) for n in workers]
+    pools.append((f"processes={max(workers)}", lambda: ProcessPoolExecutor(max(workers))))
+    for name, make_pool in pools:
+        # Свежий каталог: иначе одинаковые хэши пропустили бы работу
+        directory = tempfile.mkdtemp(prefix="botshop-images-")
+        with make_pool() as pool:
+            r = await measure(pool, photos, directory)
+        print(f"{name:<12} images/s={r['per_second']:6.1f} max_loop_lag={r['max_loop_lag_ms']:6.1f}ms")
+
+    sizes = {size: 0 for size in SIZES}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            sizes[name.rsplit("-", 1)[1][:-5]] += os.path.getsize(os.path.join(root, name))
+    print("avg webp size: " + ", ".join(f"{size}={total / count / 1024:.1f}KB" for size, total in sizes.items()))
+
+
+def main() -> None:
+    use_temp_database("images")
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    workers = [int(a) for a in sys.argv[2:]] or [1, 2, 4]
+    asyncio.run(main_async(count, workers))
+
+
+if __name__ == "__main__":
+    main()
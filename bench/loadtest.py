@@ -0,0 +1,262 @@
+"""Нагрузочный прогон API магазина с отчётом по перцентилям и сравнением с базовым прогоном.
+
+    python -m bench.loadtest                              # in-process, SQLite во временном каталоге
+    python -m bench.loadtest --uvicorn --workers 2        # настоящий сервер на свободном порту
+    python -m bench.loadtest --out run.json --baseline base.json
+
+Поднимает пустую БД (или берёт --database-url, например локальный Postgres),
+засевает пользователей, товары и заказы в заданном масштабе и по очереди гоняет
+сценарии: каталог, карточка товара, создание заказов с конкуренцией за горячие
+товары, история заказов, загрузка CSV и массовое изменение остатков.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date
+
+from bench.common import use_temp_database, seed_products, summarize, product_rows
+
+HOT_PRODUCTS = 5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на сценарий")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workloads", default="all", help="через запятую, по умолчанию все")
+    parser.add_argument("--database-url", help="вместо временной SQLite")
+    parser.add_argument("--uvicorn", action="store_true", help="гонять через реальный uvicorn, а не ASGI in-process")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", help="куда сохранить JSON с результатами")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимая деградация, доля")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+async def seed(args) -> dict:
+    from sqlalchemy import insert, select
+    from models import engine, init_db, Order, OrderProducts, Product, User
+
+    await init_db()
+    await seed_products(args.products)
+    async with engine.begin() as conn:
+        # Горячие товары с большим запасом — на них сходятся конкурентные заказы
+        await conn.execute(
+            Product.__table__.update().where(Product.id <= HOT_PRODUCTS).values(quantity=10_000_000, min_quantity=0)
+        )
+        await conn.execute(insert(User), [
+            {"tg_id": 1_000_000 + i, "role": "admin" if i == 0 else "user"} for i in range(args.users)
+        ])
+        user_ids = (await conn.execute(select(User.id))).scalars().all()
+
+    rnd = random.Random(args.seed)
+    batch = 5_000
+    for start in range(0, args.orders, batch):
+        count = min(batch, args.orders - start)
+        async with engine.begin() as conn:
+            order_ids = (await conn.execute(insert(Order).returning(Order.id), [{
+                "user": rnd.choice(user_ids), "timestamp": date.today(), "order_sum": 100,
+                "completed": rnd.random() < 0.7, "shipping_address": "addr", "city": rnd.choice(["Moscow", "Kazan", "Omsk"]),
+                "payment_method": "card", "quantity": 2, "email": "", "phone": "",
+            } for _ in range(count)])).scalars().all()
+            await conn.execute(insert(OrderProducts), [
+                {"order_id": oid, "product_id": rnd.randint(1, args.products), "quantity": 1}
+                for oid in order_ids for _ in range(2)
+            ])
+    await engine.dispose()
+    return {"users": len(user_ids)}
+
+
+def csv_payload(rows: int, start: int) -> bytes:
+    lines = ["title,category,price,size,color,quantity"]
+    for r in product_rows(rows, start):
+        lines.append(f"{r['title']},{r['category']},{r['price']},{r['size']},{r['color']},{r['quantity']}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def workloads(args):
+    rnd = random.Random(args.seed)
+    tg_ids = [1_000_000 + i for i in range(args.users)]
+    admin_tg_id = tg_ids[0]
+
+    def catalog(client):
+        return client.get("/api/products")
+
+    def product(client):
+        return client.get(f"/api/product/{rnd.randint(1, args.products)}")
+
+    def catalog_page(client):
+        return client.get("/api/products/page", params={"category": "boots", "sort": "price_asc", "limit": 50})
+
+    def order_create(client):
+        items = [{"id": rnd.randint(1, HOT_PRODUCTS), "quantity": 1} for _ in range(rnd.randint(1, 3))]
+        return client.post("/api/order/create", json={
+            "tg_id": rnd.choice(tg_ids), "items": items, "quantity": len(items),
+            "shopping_address": "Lenina 1", "city": "Moscow", "payment_method": "card",
+        })
+
+    def order_history(client):
+        return client.get(f"/api/orders/{rnd.choice(tg_ids)}")
+
+    counter = iter(range(10**9))
+
+    def csv_upload(client):
+        payload = csv_payload(200, 10_000_000 + next(counter) * 200)
+        return client.post(
+            "/upload-products/stream", data={"tg_id": admin_tg_id}, files={"file": ("products.csv", payload, "text/csv")}
+        )
+
+    def bulk_quantities(client):
+        ids = rnd.sample(range(HOT_PRODUCTS + 1, args.products + 1), 200)
+        return client.patch("/api/products/update-quantities", json=[{"product_id": i, "change": 1} for i in ids])
+
+    all_workloads = {
+        "catalog": catalog,
+        "product": product,
+        "catalog_page": catalog_page,
+        "order_create": order_create,
+        "order_history": order_history,
+        "csv_upload": csv_upload,
+        "bulk_quantities": bulk_quantities,
+    }
+    if args.workloads != "all":
+        wanted = args.workloads.split(",")
+        return {name: all_workloads[name] for name in wanted}
+    return all_workloads
+
+
+async def drive(client, make_request, duration: float, concurrency: int) -> dict:
+    samples, statuses = [], {}
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client)
+                code = str(response.status_code)
+            except Exception as e:
+                code = type(e).__name__
+            samples.append(time.perf_counter() - started)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    result = summarize(samples) if samples else {"count": 0}
+    result["rps"] = len(samples) / elapsed
+    result["statuses"] = statuses
+    return result
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(client, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def run(args) -> dict:
+    import httpx
+
+    server = None
+    if args.uvicorn:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            env=os.environ.copy(),
+        )
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from main import app
+        from models import init_db
+        await init_db()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    results = {}
+    try:
+        await wait_ready(client)
+        for name, make_request in workloads(args).items():
+            results[name] = await drive(client, make_request, args.duration, args.concurrency)
+            r = results[name]
+            print(f"{name:<16} rps={r['rps']:8.1f} p50={r.get('p50_ms', 0):7.2f}ms "
+                  f"p95={r.get('p95_ms', 0):7.2f}ms p99={r.get('p99_ms', 0):7.2f}ms statuses={r['statuses']}")
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not current.get("count"):
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {before['rps']:.1f} -> {current['rps']:.1f}")
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        use_temp_database("loadtest")
+    # Меряем сам сервер: все запросы идут с одного адреса и упёрлись бы в лимиты rate_limit
+    os.environ["RATE_LIMIT"] = "false"
+
+    started = time.perf_counter()
+    asyncio.run(seed(args))
+    print(f"seeded {args.products} products, {args.users} users, {args.orders} orders "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    results = asyncio.run(run(args))
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Архив заказов: скорость переноса, размер живых таблиц и оформление во время переноса.
+
+    python -m bench.order_archive [orders] [batch]
+
+Заводит orders заказов у USERS пользователей (по 3 строки), 80% из них
+закрыты 60 дней назад. Меряет оформление заказов без архивации и во время
+прохода OrderArchiver (пачки по batch заказов), печатает строк в секунду и
+размер живых таблиц до и после. Затем проверяет, что перенос незаметен
+читателям: полная история пользователей (history_dicts постранично),
+выгрузка и пересчитанные агрегаты совпадают с тем, что было до архивации.
+В конце уносит в архив все заказы и дважды оформляет, закрывает и
+архивирует новый: его id должен быть больше всех архивных.
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bench.common import use_temp_database, seed_orders, seed_products, summarize
+
+use_temp_database("archive")
+
+import orjson
+from sqlalchemy import func, select, update
+
+from fast_read import json_default
+from models import async_session, engine, init_db, ArchivedOrder, Order, OrdersDaily, Product, SalesDaily
+from order_archive import OrderArchiver, history_dicts
+from schemas import OrderItem
+import analytics
+import fast_read
+import order_export
+import requests as rq
+
+USERS = 100
+SAMPLE_USERS = 5
+CHECKOUT_TG_ID = 1
+# Заказы, оформленные в бенчмарке, — в своём городе и на свой товар (seed_orders берёт первые 500),
+# чтобы история и агрегаты прежних заказов сравнивались как есть
+CHECKOUT_CITY = "checkout"
+CHECKOUT_PRODUCT = 501
+LINES_PER_ORDER = 3
+
+
+async def full_history(user_id: int) -> bytes:
+    pages = []
+    before_id = None
+    while True:
+        page = await history_dicts(user_id, before_id=before_id, limit=50)
+        if not page:
+            return orjson.dumps(pages, default=json_default)
+        pages += page
+        before_id = page[-1]["id"]
+
+
+async def exported() -> int:
+    records = 0
+    async for chunk in order_export.stream_orders("ndjson"):
+        records += chunk.count(b"\n")
+    return records
+
+
+async def rollups() -> tuple:
+    await analytics.rebuild_rollups()
+    async with async_session() as session:
+        daily = (await session.execute(select(OrdersDaily).order_by(OrdersDaily.day, OrdersDaily.city))).scalars().all()
+        sales = (await session.execute(select(func.count(), func.sum(SalesDaily.units)).select_from(SalesDaily))).one()
+    return [(d.day, d.city, d.orders, d.completed_orders) for d in daily], tuple(sales)
+
+
+async def checkouts(until, latencies: list) -> None:
+    items = [OrderItem(id=CHECKOUT_PRODUCT, quantity=1)]
+    while time.perf_counter() < until():
+        started = time.perf_counter()
+        async with async_session() as session:
+            await rq.create_order(CHECKOUT_TG_ID, items, "addr", CHECKOUT_CITY, "card", None, None, session)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+async def check_ids_after_archive() -> None:
+    """Живые таблицы пусты после архивации — новые заказы всё равно не берут архивные id"""
+    archiver = OrderArchiver(after_days=30, batch=1000, pause=0, interval=3600)
+    old = datetime.utcnow() - timedelta(days=60)
+    async with engine.begin() as conn:
+        await conn.execute(update(Order).values(completed=True, completed_at=old))
+    await archiver.run_once()
+    for _ in range(2):
+        async with async_session() as session:
+            top = await session.scalar(select(func.max(ArchivedOrder.id)))
+            await rq.create_order(
+                CHECKOUT_TG_ID, [OrderItem(id=CHECKOUT_PRODUCT, quantity=1)], "addr", CHECKOUT_CITY, "card", None, None, session
+            )
+        async with engine.begin() as conn:
+            order_id = await conn.scalar(select(func.max(Order.id)))
+            await conn.execute(update(Order).where(Order.id == order_id).values(completed=True, completed_at=old))
+        assert order_id > top, (order_id, top)
+        run = await archiver.run_once()
+        assert run["orders"] == 1 and run["after"]["orders"] == 0, run
+    print("orders placed after archiving everything get new ids and archive again")
+
+
+async def main(count: int, batch: int) -> None:
+    await init_db()
+    await seed_products(CHECKOUT_PRODUCT)
+    async with engine.begin() as conn:
+        await conn.execute(update(Product).values(quantity=10_000_000))
+    users = [await rq.add_user(1_000 + i) for i in range(USERS)]
+    for user in users:
+        await seed_orders(user.id, count // USERS, LINES_PER_ORDER)
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(Order).where(Order.id % 5 != 0)
+            .values(completed=True, completed_at=datetime.utcnow() - timedelta(days=60))
+        )
+
+    samples = users[:SAMPLE_USERS]
+    histories = [await full_history(u.id) for u in samples]
+    export_before = await exported()
+    rollups_before = await rollups()
+    started = time.perf_counter()
+    for _ in range(20):
+        await fast_read.order_dicts(samples[0].id)
+    open_before = (time.perf_counter() - started) / 20
+
+    quiet: list = []
+    quiet_until = time.perf_counter() + 3
+    await checkouts(lambda: quiet_until, quiet)
+
+    archiver = OrderArchiver(after_days=30, batch=batch, pause=0.05, interval=3600)
+    during: list = []
+    done = False
+    task = asyncio.create_task(checkouts(lambda: float("inf") if not done else 0, during))
+    run = await archiver.run_once()
+    done = True
+    await task
+
+    started = time.perf_counter()
+    for _ in range(20):
+        await fast_read.order_dicts(samples[0].id)
+    open_after = (time.perf_counter() - started) / 20
+
+    q, d = summarize(quiet), summarize(during)
+    print(f"archived {run['orders']} orders + {run['lines']} lines in {run['seconds']:.1f}s "
+          f"({run['rows_per_second']:.0f} rows/s, {archiver.batches} batches of {batch})")
+    print(f"live orders {run['before']['orders']} -> {run['after']['orders']}, "
+          f"order_products {run['before']['order_products']} -> {run['after']['order_products']}")
+    print(f"checkout quiet p50={q['p50_ms']:.1f}ms p99={q['p99_ms']:.1f}ms; "
+          f"while archiving p50={d['p50_ms']:.1f}ms p99={d['p99_ms']:.1f}ms ({d['count']} orders)")
+    print(f"open orders page {open_before * 1000:.1f}ms -> {open_after * 1000:.1f}ms")
+
+    async with async_session() as session:
+        archived = await session.scalar(select(func.count()).select_from(ArchivedOrder))
+    assert archived == run["orders"] == count - count // 5, archived
+    assert [await full_history(u.id) for u in samples] == histories
+    created = len(quiet) + len(during)
+    assert await exported() == export_before + created
+    daily_after, _ = await rollups()
+    assert [r for r in daily_after if r[1] != CHECKOUT_CITY] == rollups_before[0]
+    print("history, export and rebuilt rollups match the pre-archive state")
+    await check_ids_after_archive()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+    ))
@@ -0,0 +1,147 @@
+"""Групповая фиксация заказов: заказов и коммитов в секунду в зависимости от размера пачки.
+
+    python -m bench.order_batching [orders] [batch sizes ...]
+
+Размер 0 — прежний путь: rq.create_order со своей транзакцией на каждый заказ.
+Перед замерами проверяет пачку из нескольких заказов одного товара: в ленту
+остатков и кэш каталога должен уйти остаток после всей пачки, как в БД.
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+
+from bench.common import use_temp_database, seed_products
+
+use_temp_database("batching")
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+
+from models import async_session, engine, init_db, Order, OrderProducts, Product
+from order_pipeline import OrderIngestor
+from schemas import OrderItem
+from stock_feed import stock_feed
+import requests as rq
+
+PRODUCTS = 50
+USERS = 200
+
+
+def make_orders(count: int, seed: int):
+    rnd = random.Random(seed)
+    return [
+        dict(
+            tg_id=5_000 + rnd.randrange(USERS),
+            items=[OrderItem(id=rnd.randint(1, PRODUCTS), quantity=rnd.randint(1, 2)) for _ in range(rnd.randint(1, 3))],
+            shipping_address="Lenina 1", city="Moscow", payment_method="card", notes=None, timestamp=None,
+        )
+        for _ in range(count)
+    ]
+
+
+async def run_direct(orders) -> tuple[int, int]:
+    async def one(order):
+        async with async_session() as session:
+            await rq.create_order(session=session, **order)
+    results = await asyncio.gather(*[one(o) for o in orders], return_exceptions=True)
+    return sum(not isinstance(r, Exception) for r in results), len(orders)
+
+
+async def run_batched(orders, batch: int) -> tuple[int, int]:
+    ingestor = OrderIngestor(max_batch=batch, max_wait=0.005)
+    ingestor.start()
+    results = await asyncio.gather(*[ingestor.submit(**o) for o in orders], return_exceptions=True)
+    await ingestor.stop()
+    unexpected = [r for r in results if isinstance(r, Exception) and not isinstance(r, HTTPException)]
+    assert not unexpected, unexpected[:3]
+    return sum(not isinstance(r, Exception) for r in results), ingestor.batches
+
+
+async def check_same_product_batch() -> None:
+    """10 заказов по одной штуке товара 1 в одной пачке: остаток 100 -> 90 в БД, ленте и каталоге"""
+    async with engine.begin() as conn:
+        await conn.execute(Product.__table__.update().where(Product.id == 1).values(quantity=100, min_quantity=0))
+    rq.catalog_cache.invalidate()
+    assert (await rq.get_product(1)).quantity == 100
+    orders = [
+        dict(tg_id=5_000 + i, items=[OrderItem(id=1, quantity=1)], shipping_address="Lenina 1", city="Moscow",
+             payment_method="card", notes=None, timestamp=None)
+        for i in range(10)
+    ]
+    accepted, batches = await run_batched(orders, len(orders))
+    assert (accepted, batches) == (10, 1), (accepted, batches)
+
+    async with async_session() as session:
+        quantity = await session.scalar(select(Product.quantity).where(Product.id == 1))
+    published = json.loads(stock_feed._log[-1][1].split(b"data: ", 1)[1])["q"]
+    assert quantity == 90 and published == [[1, 90]], (quantity, published)
+    assert (await rq.get_product(1)).quantity == 90
+    print("10 orders of one product in one batch: database, feed and catalog agree on quantity 90")
+
+
+async def check_stop_mid_batch() -> None:
+    """stop() во время сборки пачки: все 20 заказов получают id, а не висят"""
+    async with engine.begin() as conn:
+        await conn.execute(Product.__table__.update().where(Product.id == 2).values(quantity=100, min_quantity=0))
+    orders = [
+        dict(tg_id=6_000 + i, items=[OrderItem(id=2, quantity=1)], shipping_address="Lenina 1", city="Moscow",
+             payment_method="card", notes=None, timestamp=None)
+        for i in range(20)
+    ]
+    ingestor = OrderIngestor(max_batch=100, max_wait=10)
+    ingestor.start()
+    submitted = asyncio.gather(*[ingestor.submit(**o) for o in orders])
+    await asyncio.sleep(0.05)
+    await ingestor.stop()
+    order_ids = await asyncio.wait_for(submitted, 5)
+    async with async_session() as session:
+        created = await session.scalar(select(func.count(Order.id)).where(Order.id.in_(order_ids)))
+    assert (created, ingestor.batches) == (20, 1), (created, ingestor.batches)
+    print("stop() during batch collection: all 20 orders committed in one batch")
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    sizes = [int(a) for a in sys.argv[2:]] or [0, 1, 8, 32, 128]
+    await init_db()
+    await seed_products(PRODUCTS)
+    await check_same_product_batch()
+    await check_stop_mid_batch()
+
+    for i, batch in enumerate(sizes):
+        async with engine.begin() as conn:
+            # Запаса хватает примерно на половину заказов — часть отказов по остаткам
+            await conn.execute(Product.__table__.update().values(quantity=count // PRODUCTS * 2, min_quantity=0))
+            stock_before = await conn.scalar(select(func.sum(Product.quantity)))
+            orders_before = await conn.scalar(select(func.count(Order.id)))
+            last_id = await conn.scalar(select(func.coalesce(func.max(Order.id), 0)))
+
+        orders = make_orders(count, seed=i)
+        started = time.perf_counter()
+        if batch == 0:
+            accepted, commits = await run_direct(orders)
+        else:
+            accepted, commits = await run_batched(orders, batch)
+        elapsed = time.perf_counter() - started
+
+        async with async_session() as session:
+            stock_after = await session.scalar(select(func.sum(Product.quantity)))
+            created = await session.scalar(select(func.count(Order.id))) - orders_before
+            negative = await session.scalar(select(func.count(Product.id)).where(Product.quantity < 0))
+            ordered = await session.scalar(
+                select(func.coalesce(func.sum(OrderProducts.quantity), 0)).where(OrderProducts.order_id > last_id)
+            )
+        sold = stock_before - stock_after
+        # Списано ровно столько, сколько попало в строки принятых заказов
+        assert created == accepted and negative == 0 and sold == ordered, (created, accepted, negative, sold, ordered)
+
+        label = "direct" if batch == 0 else f"batch={batch}"
+        print(f"{label:<10} orders/s={count / elapsed:8.1f} commits/s={commits / elapsed:8.1f} "
+              f"accepted={accepted} units_sold={sold}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Выгрузка заказов: время до первого куска, скорость и пик памяти от числа заказов.
+
+    python -m bench.order_export [orders ...]
+
+Для каждого N дозаводит заказы до N (по 3 строки) и читает
+order_export.stream_orders в NDJSON и CSV напрямую, без HTTP. Пик памяти
+по tracemalloc не должен расти с N; число заказов и строк в выгрузке
+сверяется с базой.
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from bench.common import use_temp_database, seed_orders, seed_products
+
+use_temp_database("export")
+
+import orjson
+
+from models import engine, init_db
+import order_export
+import requests as rq
+
+LINES_PER_ORDER = 3
+SEED_CHUNK = 50_000
+
+
+async def measure(fmt: str) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    size = 0
+    records = 0
+    async for chunk in order_export.stream_orders(fmt):
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+        records += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"first_ms": first * 1000, "seconds": elapsed, "mb": size / 2**20, "records": records, "peak_kb": peak / 1024}
+
+
+async def main(counts: list[int]) -> None:
+    await init_db()
+    await seed_products(500)
+    user = await rq.add_user(1)
+
+    seeded = 0
+    for count in counts:
+        while seeded < count:
+            step = min(SEED_CHUNK, count - seeded)
+            await seed_orders(user.id, step, LINES_PER_ORDER)
+            seeded += step
+
+        ndjson = await measure("ndjson")
+        csv = await measure("csv")
+        assert ndjson["records"] == count, ndjson
+        # Заголовок плюс строка на каждую позицию
+        assert csv["records"] == count * LINES_PER_ORDER + 1, csv
+        for name, r in (("ndjson", ndjson), ("csv", csv)):
+            print(f"orders={count:<8} {name:<6} first_byte={r['first_ms']:7.1f}ms total={r['seconds']:6.2f}s "
+                  f"({count / r['seconds']:8.0f} orders/s, {r['mb']:.1f}MB) peak_mem={r['peak_kb']:.0f}KB")
+
+    # Первая запись NDJSON — заказ целиком со строками
+    async for chunk in order_export.stream_orders("ndjson"):
+        order = orjson.loads(chunk.split(b"\n", 1)[0])
+        assert order["id"] == 1 and len(order["lines"]) == LINES_PER_ORDER
+        break
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or [1_000, 200_000]))
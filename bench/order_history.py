@@ -0,0 +1,50 @@
+"""История заказов: число SQL-запросов и задержка в зависимости от числа заказов.
+
+    python -m bench.order_history
+
+Проверяет, что число запросов get_orders не растёт с числом заказов на странице (без N+1).
+"""
+import asyncio
+import time
+
+from bench.common import use_temp_database, seed_orders, seed_products
+
+use_temp_database("orders")
+
+from sqlalchemy import event
+
+from models import engine, read_engine, init_db
+import requests as rq
+
+ORDER_COUNTS = [1, 10, 100, 1000]
+LINES_PER_ORDER = 3
+
+
+async def main() -> None:
+    await init_db()
+    await seed_products(500)
+
+    statements = 0
+
+    @event.listens_for(read_engine.sync_engine, "before_cursor_execute")
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    for n in ORDER_COUNTS:
+        user = await rq.add_user(10_000 + n)
+        await seed_orders(user.id, n, LINES_PER_ORDER)
+        statements = 0
+        started = time.perf_counter()
+        orders = await rq.get_orders(user.id, limit=n)
+        elapsed = time.perf_counter() - started
+        assert len(orders) == n and all(len(o.lines) == LINES_PER_ORDER for o in orders)
+        print(f"orders={n:<5} queries={statements} latency={elapsed * 1000:.1f}ms")
+        # selectinload грузит связи пачками по 500 id: 1 + 2 запроса на каждые 500 заказов
+        expected = 1 + 2 * -(-n // 500)
+        assert statements == expected, f"expected {expected} queries, got {statements}"
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
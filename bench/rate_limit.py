@@ -0,0 +1,154 @@
+"""Оформление заказов под флудом /api/users/{tg_id}: с rate_limit и без.
+
+    python -m bench.rate_limit [seconds]
+
+In-process через ASGI. Покупатели (каждый со своего IP) ровным темпом
+оформляют заказы; параллельно флуд создаёт пользователей со случайными
+tg_id — с одного адреса и с тысячи разных. Для каждого сценария печатает
+p50/p99 оформления и что получил флуд (200/429/503); с включённым
+ограничением p99 оформления под флудом должен оставаться близким к спокойному.
+Перед замерами проверяет, что потоковая выгрузка заказов не занимает места
+чтения в AdmissionMiddleware.
+"""
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+
+from bench.common import use_temp_database, seed_products, summarize
+
+use_temp_database("rate-limit")
+
+import httpx
+from sqlalchemy import update
+
+from config import settings
+from main import app
+from models import engine, init_db, Product
+import rate_limit
+
+BUYERS = 10
+ORDERS_PER_SECOND = 1.0
+FLOOD_RPS = 300
+FLOOD_OUTSTANDING = 500
+FLOOD_IPS = 1000
+
+
+def client(ip: str) -> httpx.AsyncClient:
+    # Ошибки приложения — это 500 в статистике, а не исключение в бенчмарке
+    transport = httpx.ASGITransport(app=app, client=(ip, 40000), raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+
+
+async def buyer(tg_id: int, until: float, latencies: list, statuses: Counter) -> None:
+    order = {
+        "tg_id": tg_id, "items": [{"id": 1 + tg_id % 5, "quantity": 1}], "quantity": 1,
+        "shopping_address": "addr", "city": "city", "payment_method": "card",
+    }
+    async with client(f"10.1.0.{tg_id % 250}") as c:
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            r = await c.post("/api/order/create", json=order)
+            elapsed = time.perf_counter() - started
+            statuses[r.status_code] += 1
+            if r.status_code == 200:
+                latencies.append(elapsed)
+            await asyncio.sleep(max(0.0, 1 / ORDERS_PER_SECOND - elapsed))
+
+
+async def flood(clients: list, until: float, statuses: Counter) -> None:
+    """Открытая нагрузка: FLOOD_RPS запросов в секунду, не дожидаясь ответов (как внешний бот)"""
+    rnd = random.Random()
+    outstanding = asyncio.Semaphore(FLOOD_OUTSTANDING)
+
+    async def one():
+        try:
+            r = await rnd.choice(clients).get(f"/api/users/{rnd.randrange(10**12)}")
+            statuses[r.status_code] += 1
+        finally:
+            outstanding.release()
+
+    tasks = set()
+    sent = 0
+    started = time.perf_counter()
+    while time.perf_counter() < until:
+        due = int((time.perf_counter() - started) * FLOOD_RPS)
+        while sent < due:
+            sent += 1
+            if outstanding.locked():
+                # Бот не держит больше FLOOD_OUTSTANDING соединений — остальное он бросает
+                statuses["dropped"] += 1
+                continue
+            await outstanding.acquire()
+            task = asyncio.create_task(one())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+
+
+async def scenario(name: str, seconds: float, flood_ips: int) -> None:
+    latencies: list = []
+    buyers: Counter = Counter()
+    flooded: Counter = Counter()
+    until = time.perf_counter() + seconds
+    clients = [client(f"172.16.{i // 250}.{i % 250}") for i in range(flood_ips)]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[buyer(2_000 + i, until, latencies, buyers) for i in range(BUYERS)],
+        *([flood(clients, until, flooded)] if flood_ips else []),
+    )
+    elapsed = time.perf_counter() - started
+    for c in clients:
+        await c.aclose()
+    r = summarize(latencies) if latencies else {"p50_ms": 0, "p99_ms": 0}
+    print(f"{name:<34} checkout p50={r['p50_ms']:7.1f}ms p99={r['p99_ms']:7.1f}ms ok={len(latencies):<4} "
+          f"ok/s={len(latencies) / elapsed:6.1f} "
+          f"buyers={dict(buyers)} flood={dict(flooded)}")
+
+
+async def check_export_unadmitted() -> None:
+    """Выгрузки заказов, сколько бы их ни шло, не отнимают места чтения у каталога"""
+    settings.RATE_LIMIT = True
+    exports = asyncio.Event()
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen[scope["path"]] = rate_limit.admission.reads
+        if scope["path"] == "/admin/orders/export":
+            await exports.wait()
+
+    middleware = rate_limit.AdmissionMiddleware(app)
+    running = [
+        asyncio.create_task(middleware({"type": "http", "method": "GET", "path": "/admin/orders/export"}, None, None))
+        for _ in range(settings.MAX_READ_CONCURRENCY * 2)
+    ]
+    await asyncio.sleep(0)
+    await middleware({"type": "http", "method": "GET", "path": "/api/products"}, None, None)
+    exports.set()
+    await asyncio.gather(*running)
+    assert seen == {"/admin/orders/export": 0, "/api/products": 1}, seen
+    assert rate_limit.admission.stats() == {"inflight": 0, "reads": 0, "shed": 0}
+    print(f"{len(running)} exports in flight: catalog read admitted, no read slots taken")
+
+
+async def main(seconds: float) -> None:
+    await check_export_unadmitted()
+    await init_db()
+    await seed_products(100)
+    async with engine.begin() as conn:
+        await conn.execute(update(Product).values(quantity=10_000_000))
+
+    for enabled in (False, True):
+        settings.RATE_LIMIT = enabled
+        label = "limits on " if enabled else "limits off"
+        await scenario(f"{label} quiet", seconds, 0)
+        await scenario(f"{label} flood from 1 ip", seconds, 1)
+        await scenario(f"{label} flood from {FLOOD_IPS} ips", seconds, FLOOD_IPS)
+    print(rate_limit.stats())
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 10.0))
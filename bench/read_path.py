@@ -0,0 +1,97 @@
+"""Стоимость строки на чтении: ORM + model_validate против Core-строк (fast_read).
+
+    python -m bench.read_path [products ...]
+
+Для каталога из N товаров меряет загрузку и рендер JSON тремя путями:
+orm (select(Product) + model_validate на строку), core (Core-строки + один
+TypeAdapter) и trusted (Core-строки в dict + orjson), и проверяет, что все три
+дают одинаковый JSON. Затем то же для истории заказов через get_orders.
+"""
+import asyncio
+import sys
+import time
+
+from bench.common import use_temp_database, seed_orders, seed_products
+
+use_temp_database("read-path")
+
+import orjson
+from sqlalchemy import select
+
+from models import async_session, engine, init_db, Product
+from schemas import ProductOut
+import fast_read
+import requests as rq
+
+ROUNDS = 3
+ORDERS = 200
+
+
+async def orm_products() -> bytes:
+    async with async_session() as session:
+        products = (await session.scalars(select(Product))).all()
+        items = [ProductOut.model_validate(p) for p in products]
+    return fast_read.products_adapter.dump_json(items)
+
+
+async def core_products() -> bytes:
+    return fast_read.products_adapter.dump_json(await fast_read.load_products())
+
+
+async def trusted_products() -> bytes:
+    async with engine.connect() as conn:
+        rows = await conn.execute(select(*fast_read.PRODUCT_COLUMNS))
+        return fast_read.FastJSONResponse([fast_read.product_dict(r) for r in rows]).body
+
+
+async def orm_orders(user_id: int) -> bytes:
+    return fast_read.orders_adapter.dump_json(await rq.get_orders(user_id, limit=ORDERS))
+
+
+async def core_orders(user_id: int) -> bytes:
+    return fast_read.orders_adapter.dump_json(await fast_read.load_orders(user_id, limit=ORDERS))
+
+
+async def trusted_orders(user_id: int) -> bytes:
+    return fast_read.FastJSONResponse(await fast_read.order_dicts(user_id, limit=ORDERS)).body
+
+
+async def compare(label: str, rows: int, paths: dict) -> None:
+    bodies = {}
+    best = {}
+    for name, run in paths.items():
+        samples = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            bodies[name] = await run()
+            samples.append(time.perf_counter() - started)
+        best[name] = min(samples)
+    reference = orjson.loads(bodies["orm"])
+    for name, body in bodies.items():
+        assert orjson.loads(body) == reference, f"{label}: {name} differs from orm"
+    line = " ".join(f"{name}={best[name] / rows * 1e6:6.2f}us/row" for name in paths)
+    print(f"{label:<16} {line}  speedup={best['orm'] / best['trusted']:.1f}x")
+
+
+async def main(counts: list[int]) -> None:
+    await init_db()
+    seeded = 0
+    for count in counts:
+        await seed_products(count - seeded)
+        seeded = count
+        await compare(f"products={count}", count, {
+            "orm": orm_products, "core": core_products, "trusted": trusted_products,
+        })
+
+    user = await rq.add_user(1)
+    await seed_orders(user.id, ORDERS)
+    await compare(f"orders={ORDERS}", ORDERS, {
+        "orm": lambda: orm_orders(user.id),
+        "core": lambda: core_orders(user.id),
+        "trusted": lambda: trusted_orders(user.id),
+    })
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or [10_000, 100_000]))
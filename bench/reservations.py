@@ -0,0 +1,144 @@
+"""Удержания в корзине: стоимость hold от числа живых удержаний и работа sweeper под нагрузкой.
+
+    python -m bench.reservations [held ...]
+
+Для каждого N из held заводит N живых удержаний и меряет hold/release
+одного пользователя: время не должно расти с N (всё идёт по индексам).
+Затем просрочивает все удержания и, пока ReservationSweeper их снимает,
+меряет задержку hold и опоздание тикера event loop. В конце сверяет
+products.reserved с суммой оставшихся удержаний и проверяет заказ, который
+берёт товар частью из удержания, частью из свободного остатка: лента и
+каталог должны показать тот же остаток, что в БД.
+"""
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bench.common import use_temp_database, seed_products, summarize
+
+use_temp_database("reservations")
+
+from sqlalchemy import func, insert, select, update
+
+from models import async_session, engine, init_db, Product, Reservation, User
+from reservations import ReservationSweeper, hold
+from schemas import OrderItem
+from stock_feed import stock_feed
+import requests as rq
+
+PRODUCTS = 1000
+SAMPLES = 200
+TICK = 0.005
+
+
+async def seed_holds(start: int, count: int, expires_at: datetime) -> None:
+    users = [{"tg_id": 1_000_000 + i, "role": "user"} for i in range(start, start + count)]
+    async with engine.begin() as conn:
+        ids = (await conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True), users)).scalars().all()
+        await conn.execute(insert(Reservation), [
+            {"user_id": uid, "product_id": uid % PRODUCTS + 1, "quantity": 1, "expires_at": expires_at}
+            for uid in ids
+        ])
+        await conn.execute(
+            update(Product).values(reserved=select(func.count()).where(Reservation.product_id == Product.id).scalar_subquery())
+        )
+
+
+async def hold_latency(user_id: int) -> dict:
+    samples = []
+    for i in range(SAMPLES):
+        started = time.perf_counter()
+        await hold(user_id, i % PRODUCTS + 1, 1)
+        await hold(user_id, i % PRODUCTS + 1, 0)
+        samples.append((time.perf_counter() - started) / 2)
+    return summarize(samples)
+
+
+async def check_consistency() -> None:
+    async with async_session() as session:
+        mismatched = await session.scalar(
+            select(func.count()).select_from(Product).where(
+                Product.reserved != select(func.coalesce(func.sum(Reservation.quantity), 0))
+                .where(Reservation.product_id == Product.id).scalar_subquery()
+            )
+        )
+    assert mismatched == 0, f"{mismatched} products with reserved != sum of holds"
+
+
+async def check_hold_plus_extra() -> None:
+    """Остаток 10, удержано 2, заказ на 5: в БД, ленте и каталоге должно стать 5"""
+    async with engine.begin() as conn:
+        product_id = await conn.scalar(
+            insert(Product).values(
+                title="hold+extra", category="boots", price=1, size=40, color="red", quantity=10, min_quantity=0,
+            ).returning(Product.id)
+        )
+    user = await rq.add_user(2)
+    await hold(user.id, product_id, 2)
+    rq.catalog_cache.invalidate()
+    assert (await rq.get_product(product_id)).quantity == 10
+    async with async_session() as session:
+        await rq.create_order(2, [OrderItem(id=product_id, quantity=5)], "addr", "city", "card", None, None, session)
+
+    async with async_session() as session:
+        product = await session.get(Product, product_id)
+    published = json.loads(stock_feed._log[-1][1].split(b"data: ", 1)[1])["q"]
+    assert (product.quantity, product.reserved) == (5, 0), (product.quantity, product.reserved)
+    assert published == [[product_id, 5]], published
+    assert (await rq.get_product(product_id)).quantity == 5
+    print("hold + free stock in one order: database, feed and catalog agree on quantity 5")
+
+
+async def main(counts: list[int]) -> None:
+    await init_db()
+    await seed_products(PRODUCTS)
+    async with engine.begin() as conn:
+        await conn.execute(update(Product).values(quantity=10_000_000))
+    async with engine.begin() as conn:
+        user_id = await conn.scalar(insert(User).values(tg_id=1, role="user").returning(User.id))
+
+    seeded = 0
+    live = datetime.utcnow() + timedelta(hours=1)
+    for count in counts:
+        await seed_holds(seeded, count - seeded, live)
+        seeded = count
+        r = await hold_latency(user_id)
+        print(f"held={count:<7} hold p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms")
+
+    # Все удержания истекли разом — худший случай для sweeper
+    async with engine.begin() as conn:
+        await conn.execute(update(Reservation).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+
+    lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lag = max(lag, time.perf_counter() - started - TICK)
+
+    sweeper = ReservationSweeper(batch=500, interval=1.0)
+    tick_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    sweeper.start()
+    r = await hold_latency(user_id)
+    while sweeper.released < seeded:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    running = False
+    await tick_task
+    await sweeper.stop()
+
+    print(f"sweep {seeded} expired in {elapsed:.2f}s ({sweeper.sweeps} batches); "
+          f"hold meanwhile p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms; max loop lag={lag * 1000:.1f}ms")
+    await check_consistency()
+    await check_hold_plus_extra()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or [1_000, 100_000]))
@@ -0,0 +1,70 @@
+"""Задержка полнотекстового поиска в зависимости от размера каталога.
+
+    python -m bench.search 10000 100000 1000000
+
+Перед замерами проверяет, что ранжируются все совпадения: товар с лучшим
+bm25, добавленный последним (самый большой rowid), идёт первым.
+"""
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+from bench.common import use_temp_database, seed_products, summarize, timer, CATEGORIES, COLORS
+
+QUERIES = 300
+
+
+async def run(size: int) -> dict:
+    use_temp_database("search")
+    from sqlalchemy import insert
+    from models import engine, init_db, Product
+    from search import rebuild_search_index, search_products
+
+    await init_db()
+    await seed_products(size)
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        await rebuild_search_index(conn)
+    build = time.perf_counter() - started
+
+    async with engine.begin() as conn:
+        best = await conn.scalar(insert(Product).values(
+            title="Product product product", category=CATEGORIES[0], price=10, size=40,
+            color=COLORS[0], quantity=1, min_quantity=0,
+        ).returning(Product.id))
+        await rebuild_search_index(conn)
+    top = await search_products("product", limit=1)
+    assert [p.id for p in top] == [best], (top, best)
+
+    rnd = random.Random(3)
+    prefix, filtered = [], []
+    for _ in range(QUERIES):
+        with timer(prefix):
+            await search_products(f"{rnd.choice(COLORS)[:3]} product {rnd.randint(1, 99)}")
+        with timer(filtered):
+            await search_products(rnd.choice(COLORS), category=rnd.choice(CATEGORIES), min_price=50, max_price=150)
+    await engine.dispose()
+    return {"build_s": build, "prefix": summarize(prefix), "filtered": summarize(filtered)}
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--size":
+        print(json.dumps(asyncio.run(run(int(sys.argv[2])))))
+        return
+
+    for size in [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.search", "--size", str(size)],
+            check=True, capture_output=True, text=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"products={size} index_build={r['build_s']:.1f}s")
+        for name in ("prefix", "filtered"):
+            print(f"  {name:<9} p50={r[name]['p50_ms']:.2f}ms p95={r[name]['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
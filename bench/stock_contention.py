@@ -0,0 +1,87 @@
+"""Флеш-распродажа: сотни параллельных заказов на один товар.
+
+    python -m bench.stock_contention [orders] [stock]
+
+Сравнивает прежнее чтение-проверка-запись в Python с условным UPDATE
+из inventory и проверяет, что продано не больше, чем было на складе.
+"""
+import asyncio
+import sys
+import time
+
+from bench.common import use_temp_database
+
+use_temp_database("stock")
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+
+from models import async_session, engine, init_db, Product
+from schemas import OrderItem
+import inventory
+
+
+async def legacy_reserve(session, items):
+    """Старый путь из create_order: прочитать, проверить в Python, присвоить"""
+    result = await session.execute(select(Product).where(Product.id.in_([it.id for it in items])))
+    products = {p.id: p for p in result.scalars().all()}
+    for it in items:
+        prod = products[it.id]
+        new_quantity = prod.quantity - it.quantity
+        if new_quantity < prod.min_quantity:
+            raise HTTPException(400, "Not enough stock")
+        prod.quantity = new_quantity
+    return products
+
+
+async def run(reserve, orders: int, stock: int) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(Product.__table__.delete())
+        await conn.execute(insert(Product), [{
+            "id": 1, "title": "Hot", "category": "sale", "price": 10, "size": 42,
+            "color": "red", "quantity": stock, "min_quantity": 0,
+        }])
+
+    sold = rejected = errors = 0
+
+    async def one():
+        nonlocal sold, rejected, errors
+        async with async_session() as session:
+            try:
+                await reserve(session, [OrderItem(id=1, quantity=1)])
+                await session.commit()
+                sold += 1
+            except HTTPException:
+                await session.rollback()
+                rejected += 1
+            except Exception:
+                await session.rollback()
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(orders)])
+    elapsed = time.perf_counter() - started
+
+    async with async_session() as session:
+        left = await session.scalar(select(Product.quantity).where(Product.id == 1))
+    oversold = max(0, sold - stock) + max(0, (stock - left) - sold) + max(0, -left)
+    print(
+        f"{reserve.__module__}.{reserve.__name__:<16} orders/s={orders / elapsed:8.1f} "
+        f"sold={sold} rejected={rejected} errors={errors} left={left} "
+        f"lost_updates={abs((stock - left) - sold)} oversold={oversold}"
+    )
+    if reserve is inventory.reserve_stock:
+        assert sold <= stock and left == stock - sold and left >= 0, "oversell detected"
+
+
+async def main() -> None:
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stock = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    await init_db()
+    await run(legacy_reserve, orders, stock)
+    await run(inventory.reserve_stock, orders, stock)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""Лента остатков: доставка событий простаивающим клиентам и работа через два воркера.
+
+    python -m bench.stock_feed fanout 1000 10000     # in-process: задержка доставки и память на клиента
+    python -m bench.stock_feed workers [clients]     # uvicorn --workers 2, SSE через HTTP
+    python -m bench.stock_feed locked                # публикация, пока блокировку держит другой воркер
+
+fanout подписывает N потоков StockFeed.stream напрямую (без HTTP) и меряет,
+за сколько публикация доходит до всех, и сколько памяти держит один клиент.
+workers поднимает настоящий сервер с общим STOCK_FEED_DIR, раскидывает
+SSE-подключения по воркерам, меняет остатки через API и проверяет, что каждый
+клиент получил все ревизии по порядку, а переподключение с Last-Event-ID
+догоняет пропущенное. locked держит flock счётчика ревизий, как занятый
+публикацией соседний воркер, публикует события и проверяет, что event loop
+при этом не стоит, а после освобождения события выходят по порядку.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.common import use_temp_database, seed_products, summarize
+
+EVENTS = 50
+
+
+async def fanout(clients: int) -> dict:
+    from stock_feed import StockFeed
+
+    feed = StockFeed(buffer=10_000, heartbeat=60)
+    received = [0] * clients
+    done = asyncio.Event()
+    pending = clients
+
+    async def client(i: int):
+        nonlocal pending
+        async for chunk in feed.stream():
+            events = chunk.count(b"\nid: ") + chunk.startswith(b"id: ")
+            if not events:
+                continue
+            received[i] += events
+            if received[i] == expected:
+                pending -= 1
+                if pending == 0:
+                    done.set()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(client(i)) for i in range(clients)]
+    await asyncio.sleep(0.1)
+    per_client = (tracemalloc.get_traced_memory()[0] - before) / clients
+    tracemalloc.stop()
+
+    latencies = []
+    for n in range(1, EVENTS + 1):
+        expected = n
+        done.clear()
+        pending = clients
+        started = time.perf_counter()
+        feed.publish({n: n})
+        await done.wait()
+        latencies.append(time.perf_counter() - started)
+
+    feed.close()
+    await asyncio.gather(*tasks)
+    return {"clients": clients, "bytes_per_client": per_client, **summarize(latencies)}
+
+
+async def read_events(response, count: int, timeout: float) -> list[int]:
+    revisions = []
+
+    async def consume():
+        async for line in response.aiter_lines():
+            if line.startswith("id: "):
+                revisions.append(int(line[4:]))
+                if len(revisions) == count:
+                    return
+
+    try:
+        await asyncio.wait_for(consume(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return revisions
+
+
+async def workers(clients: int) -> None:
+    import httpx
+    from bench.loadtest import free_port, wait_ready
+
+    use_temp_database("stock-feed")
+    from models import init_db, engine
+    await init_db()
+    await seed_products(100)
+    await engine.dispose()
+
+    env = dict(os.environ, STOCK_FEED_DIR=tempfile.mkdtemp(prefix="botshop-feed-"), RATE_LIMIT="false")
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", "2", "--log-level", "warning"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=30, limits=httpx.Limits(max_connections=clients + 10)) as api:
+            await wait_ready(api)
+            # Ждём, пока оба воркера поднимут свои сокеты
+            while len([n for n in os.listdir(env["STOCK_FEED_DIR"]) if n.endswith(".sock")]) < 2:
+                await asyncio.sleep(0.1)
+
+            streams = [api.stream("GET", "/api/stock/stream") for _ in range(clients)]
+            responses = [await s.__aenter__() for s in streams]
+            await asyncio.sleep(0.5)
+            readers = [asyncio.create_task(read_events(r, EVENTS, 30)) for r in responses]
+
+            started = time.perf_counter()
+            # Изменения идут через оба воркера — соединения API тоже распределяются ядром
+            await asyncio.gather(*[api.patch(f"/api/product/increase/{1 + i % 10}") for i in range(EVENTS)])
+            got = await asyncio.gather(*readers)
+            elapsed = time.perf_counter() - started
+            for s in streams:
+                await s.__aexit__(None, None, None)
+
+            complete = sum(1 for revs in got if len(revs) == EVENTS)
+            ordered = all(revs == sorted(revs) for revs in got)
+            print(f"clients={clients} events={EVENTS} complete={complete}/{clients} ordered={ordered} "
+                  f"elapsed={elapsed:.2f}s")
+            assert complete == clients and ordered
+
+            # Переподключение с середины: должны прийти ровно пропущенные ревизии
+            last = got[0][EVENTS // 2 - 1]
+            async with api.stream("GET", "/api/stock/stream", headers={"Last-Event-ID": str(last)}) as r:
+                replay = await read_events(r, EVENTS - EVENTS // 2, 10)
+            print(f"resume from {last}: replayed {len(replay)} events")
+            assert replay == got[0][EVENTS // 2:]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def locked() -> None:
+    from stock_feed import StockFeed
+
+    directory = tempfile.mkdtemp(prefix="botshop-feed-")
+    feed = StockFeed(buffer=100, heartbeat=60, channel_dir=directory)
+    feed.start()
+    # Отдельный open — отдельная блокировка flock, как у другого воркера
+    other = os.open(os.path.join(directory, "revision"), os.O_RDWR)
+    fcntl.flock(other, fcntl.LOCK_EX)
+
+    lags = []
+
+    async def ticker(until: float):
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    hold = 0.2
+    ticking = asyncio.create_task(ticker(time.perf_counter() + hold))
+    for n in range(1, EVENTS + 1):
+        feed.publish({n: n})
+    assert feed.stats()["queued"] == EVENTS and feed.stats()["published"] == 0, feed.stats()
+    await ticking
+    fcntl.flock(other, fcntl.LOCK_UN)
+    started = time.perf_counter()
+    while feed.stats()["queued"]:
+        await asyncio.sleep(0.001)
+    drained = time.perf_counter() - started
+    feed.publish({0: 0})
+
+    frames = [json.loads(frame.split(b"data: ", 1)[1]) for _, frame in feed._log]
+    assert [f["rev"] for f in frames] == list(range(1, EVENTS + 2)), frames
+    assert [f["q"][0][0] for f in frames] == [*range(1, EVENTS + 1), 0]
+    feed.close()
+    os.close(other)
+    print(f"lock held {hold * 1000:.0f}ms: {EVENTS} events queued, max loop lag={max(lags) * 1000:.1f}ms; "
+          f"published in order {drained * 1000:.1f}ms after release")
+
+
+def main() -> None:
+    mode = sys.argv[1] if len(sys.argv) > 1 else "fanout"
+    if mode == "fanout":
+        use_temp_database("stock-feed")
+        for clients in [int(a) for a in sys.argv[2:]] or [1_000, 10_000]:
+            r = asyncio.run(fanout(clients))
+            print(f"clients={clients:<6} memory/client={r['bytes_per_client'] / 1024:.1f}KB "
+                  f"deliver p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms")
+    elif mode == "workers":
+        asyncio.run(workers(int(sys.argv[2]) if len(sys.argv) > 2 else 20))
+    elif mode == "locked":
+        asyncio.run(locked())
+    else:
+        print(__doc__)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Стартовые данные мини-приложения одним запросом.
+
+При открытии мини-приложение по очереди звало /api/users/{tg_id},
+/api/is-admin/{tg_id}, /api/products и /api/orders/{tg_id}: четыре
+round trip'а по мобильной сети, и на сервере трижды resolve_user.
+/api/bootstrap/{tg_id} находит пользователя один раз, а каталог и открытые
+заказы собирает параллельно (asyncio.gather, у каждой части своё
+соединение read_engine).
+
+У каждой части своя версия: у каталога — его ETag без кавычек, у заказов —
+хеш их JSON. Клиент присылает версии, которые уже лежат у него в кэше
+(?catalog=…&orders=…); совпавшая часть приходит как null, а в versions
+всегда текущие версии. Ответ собирается из готовых байтов: тело каталога из
+catalog_cache/снимка вставляется как есть, без разбора и сериализации.
+"""
+import asyncio
+import hashlib
+from typing import Optional
+
+import orjson
+
+from fast_read import json_default
+import fast_read
+import requests as rq
+
+
+def version(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+async def _orders(user_id: int) -> bytes:
+    orders = await fast_read.order_dicts(user_id)
+    return orjson.dumps(orders, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+async def payload(tg_id: int, catalog_version: Optional[str] = None, orders_version: Optional[str] = None) -> bytes:
+    """JSON BootstrapOut; части с версией, совпавшей с присланной, — null"""
+    user = await rq.add_user(tg_id)
+    catalog, orders = await asyncio.gather(rq.get_all_products_rendered(), _orders(user.id))
+    versions = {"catalog": catalog.etag.strip('"'), "orders": version(orders)}
+    head = orjson.dumps({
+        "user": {"id": user.id, "tg_id": user.tg_id, "role": user.role},
+        "isAdmin": user.role == "admin",
+        "versions": versions,
+    })
+    return b"".join((
+        head[:-1],
+        b',"catalog":', b"null" if versions["catalog"] == catalog_version else catalog.body,
+        b',"orders":', b"null" if versions["orders"] == orders_version else orders,
+        b"}",
+    ))
@@ -0,0 +1,147 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from fast_read import products_adapter
+from schemas import ProductOut
+
+
+class RenderedBody:
+    """Готовое JSON-тело ответа, его ETag и сжатая копия, которую считаем один раз"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self._gzipped: Optional[bytes] = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class CatalogCache:
+    """Кэш каталога в памяти процесса: список ProductOut, индекс по id и номер версии"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._items: Optional[List[ProductOut]] = None
+        self._by_id: Dict[int, ProductOut] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        # Отрендеренные ответы для текущего снимка: ключ "all" или id товара
+        self._rendered: Dict[object, RenderedBody] = {}
+
+    def _fresh(self) -> bool:
+        if self._items is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    async def _snapshot(
+        self, loader: Callable[[], Awaitable[List[ProductOut]]]
+    ) -> Tuple[List[ProductOut], Dict[int, ProductOut]]:
+        if self._fresh():
+            self.hits += 1
+            return self._items, self._by_id
+        self.misses += 1
+        # Одновременные промахи ждут одну загрузку из БД
+        async with self._lock:
+            if self._fresh():
+                return self._items, self._by_id
+            version = self.version
+            items = await loader()
+            by_id = {p.id: p for p in items}
+            self.loads += 1
+            # Если каталог поменялся во время загрузки, прочитанное не кэшируем
+            if version == self.version:
+                self._items, self._by_id = items, by_id
+                self._loaded_at = time.monotonic()
+                self._rendered = {}
+            return items, by_id
+
+    async def get_all(self, loader: Callable[[], Awaitable[List[ProductOut]]]) -> List[ProductOut]:
+        items, _ = await self._snapshot(loader)
+        return items
+
+    async def get(
+        self, product_id: int, loader: Callable[[], Awaitable[List[ProductOut]]]
+    ) -> Optional[ProductOut]:
+        _, by_id = await self._snapshot(loader)
+        return by_id.get(product_id)
+
+    async def render_all(self, loader: Callable[[], Awaitable[List[ProductOut]]]) -> RenderedBody:
+        items, _ = await self._snapshot(loader)
+        rendered = self._rendered.get("all")
+        if rendered is None:
+            rendered = RenderedBody(products_adapter.dump_json(items))
+            # Кэшируем только тело, построенное из текущего установленного снимка
+            if items is self._items:
+                self._rendered["all"] = rendered
+        return rendered
+
+    async def render_one(
+        self, product_id: int, loader: Callable[[], Awaitable[List[ProductOut]]]
+    ) -> Optional[RenderedBody]:
+        _, by_id = await self._snapshot(loader)
+        rendered = self._rendered.get(product_id)
+        if rendered is None:
+            product = by_id.get(product_id)
+            if product is None:
+                return None
+            rendered = RenderedBody(product.model_dump_json().encode())
+            if by_id is self._by_id:
+                self._rendered[product_id] = rendered
+        return rendered
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш целиком (новые товары, правка карточки, загрузка CSV)"""
+        _snapshot_stale()
+        self.version += 1
+        self._items = None
+        self._by_id = {}
+        self._rendered = {}
+
+    def patch_quantities(self, quantities: Dict[int, int]) -> None:
+        """Точечно обновляет остатки без перечитывания каталога"""
+        if not quantities:
+            return
+        _snapshot_stale()
+        self.version += 1
+        self._rendered = {}
+        if self._items is None:
+            return
+        for product_id, quantity in quantities.items():
+            product = self._by_id.get(product_id)
+            if product is None:
+                # Товара нет в снимке — безопаснее перечитать всё
+                self.invalidate()
+                return
+            self._by_id[product_id] = product.model_copy(update={"quantity": quantity})
+        self._items = list(self._by_id.values())
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._by_id),
+        }
+
+
+def _snapshot_stale() -> None:
+    # catalog_snapshot сам импортирует отсюда RenderedBody
+    from catalog_snapshot import catalog_snapshot
+    catalog_snapshot.mark_stale()
+
+
+catalog_cache = CatalogCache(ttl=settings.CATALOG_CACHE_TTL)
@@ -0,0 +1,232 @@
+"""Общий для всех воркеров снимок каталога в отображаемом в память файле.
+
+Без него каждый воркер uvicorn держит свой catalog_cache: свою копию
+каталога и готовых ответов, и каждый сам перечитывает БД. Со снимком
+(задан CATALOG_SNAPSHOT_DIR) каталог сериализуется один раз в файл
+
+    заголовок | индекс (id, смещение, длина) по возрастанию id | JSON-массив | он же в gzip
+
+и все воркеры отдают /api/products и /api/product/{id} срезами mmap этого
+файла, без копий и без разбора JSON. Страницы файла общие в page cache,
+поэтому память на воркер не растёт с числом воркеров.
+
+Файл снимка после публикации не меняется: новый пишется рядом и ставится на
+место через os.replace, затем увеличивается номер поколения в файле
+generation. Воркер, заметивший новое поколение, отображает новый файл;
+старое отображение живёт, пока его срезы отдаются, так что читатель не может
+увидеть наполовину записанный снимок. Запись в каталог (catalog_cache
+.invalidate/patch_quantities) помечает снимок устаревшим; правки за
+CATALOG_SNAPSHOT_DELAY секунд собираются в одну пересборку. Пересборка
+читает БД и публикует под flock, поэтому снимок последнего собравшего не
+бывает старше уже опубликованного. Сериализация, gzip и запись файла идут в
+потоке (asyncio.to_thread): на большом каталоге это сотни миллисекунд, и
+event loop воркера не должен стоять на каждой правке остатков.
+"""
+import asyncio
+import bisect
+import fcntl
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from typing import Awaitable, Callable, List, Optional
+
+from catalog_cache import RenderedBody
+from config import settings
+from schemas import ProductOut
+
+logger = logging.getLogger("botshop.catalog_snapshot")
+
+MAGIC = b"BSCAT\x00\x00\x01"
+# magic, поколение, товаров, длина JSON, длина gzip, ETag (hex blake2b-16)
+HEADER = struct.Struct("<8sQQQQ32s")
+GENERATION = struct.Struct("<Q")
+# Ждём чужую пересборку короткими снами, не блокируя event loop на flock
+LOCK_RETRY = 0.005
+
+
+class MappedBody(RenderedBody):
+    """Тело ответа — срез отображённого снимка; gzip и ETag уже лежат в файле"""
+
+    def __init__(self, body: memoryview, etag: str, gzipped: Optional[memoryview] = None):
+        self.body = body
+        self.etag = etag
+        self._gzipped = gzipped
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class _Mapped:
+    """Один опубликованный файл снимка, отображённый только на чтение"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        magic, self.generation, count, body_len, gzip_len, etag = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a catalog snapshot")
+        index_end = HEADER.size + count * 24
+        index = view[HEADER.size:index_end].cast("Q")
+        self._ids = index[0::3]
+        self._offsets = index[1::3]
+        self._lengths = index[2::3]
+        self._body = view[index_end:index_end + body_len]
+        self.all = MappedBody(
+            self._body, f'"{etag.decode()}"', view[index_end + body_len:index_end + body_len + gzip_len]
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, product_id: int) -> Optional[RenderedBody]:
+        i = bisect.bisect_left(self._ids, product_id)
+        if i == len(self._ids) or self._ids[i] != product_id:
+            return None
+        offset = self._offsets[i]
+        return RenderedBody(self._body[offset:offset + self._lengths[i]])
+
+
+def build(products: List[ProductOut], generation: int) -> bytes:
+    """Снимок каталога в формате файла; тело совпадает с ответом catalog_cache"""
+    products = sorted(products, key=lambda p: p.id)
+    index = []
+    parts = []
+    offset = 1
+    for product in products:
+        body = product.model_dump_json().encode()
+        index += (product.id, offset, len(body))
+        parts.append(body)
+        offset += len(body) + 1
+    body = b"[" + b",".join(parts) + b"]"
+    gzipped = gzip.compress(body, compresslevel=6)
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest().encode()
+    header = HEADER.pack(MAGIC, generation, len(products), len(body), len(gzipped), etag)
+    # Индекс в родном порядке байт: читатели смотрят на него через memoryview.cast("Q")
+    return header + struct.pack(f"{len(index)}Q", *index) + body + gzipped
+
+
+def _write(path: str, products: List[ProductOut], generation: int) -> None:
+    with open(path, "wb") as f:
+        f.write(build(products, generation))
+
+
+class CatalogSnapshot:
+    def __init__(self, directory: Optional[str], delay: float):
+        self.directory = directory
+        self.delay = delay
+        self.builds = 0
+        self.remaps = 0
+        self._path = os.path.join(directory, "catalog.snap") if directory else None
+        self._loader: Optional[Callable[[], Awaitable[List[ProductOut]]]] = None
+        self._fd: Optional[int] = None
+        self._generation: Optional[mmap.mmap] = None
+        self._mapped: Optional[_Mapped] = None
+        self._stale = False
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._fd is not None
+
+    async def start(self, loader: Callable[[], Awaitable[List[ProductOut]]]) -> None:
+        """Открывает общий каталог и пересобирает снимок: файл мог остаться от прошлого запуска"""
+        if self.directory is None or self._fd is not None:
+            return
+        self._loader = loader
+        self.open()
+        await self.rebuild()
+
+    def open(self) -> None:
+        """Только чтение уже опубликованных снимков, без пересборки"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._fd = os.open(os.path.join(self.directory, "generation"), os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < GENERATION.size:
+            os.pwrite(self._fd, bytes(GENERATION.size), 0)
+        self._generation = mmap.mmap(self._fd, GENERATION.size, access=mmap.ACCESS_READ)
+
+    async def stop(self) -> None:
+        if self._rebuild_task is not None:
+            await self._rebuild_task
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        # Сами отображения не закрываем: их срезы могут ещё отдаваться клиентам
+        self._generation = None
+        self._mapped = None
+
+    def generation(self) -> int:
+        return GENERATION.unpack_from(self._generation)[0]
+
+    def _current(self) -> _Mapped:
+        mapped = self._mapped
+        if mapped is None or mapped.generation < self.generation():
+            # Поколение меняют после os.replace, поэтому в файле оно не меньше прочитанного
+            mapped = self._mapped = _Mapped(self._path)
+            self.remaps += 1
+        return mapped
+
+    def render_all(self) -> RenderedBody:
+        return self._current().all
+
+    def render_one(self, product_id: int) -> Optional[RenderedBody]:
+        return self._current().get(product_id)
+
+    def mark_stale(self) -> None:
+        """Каталог в БД поменялся: пересобрать снимок через delay секунд, если ещё не собирается"""
+        if not self.enabled:
+            return
+        self._stale = True
+        if self._rebuild_task is None:
+            self._rebuild_task = asyncio.get_running_loop().create_task(self._rebuild_later())
+
+    async def _rebuild_later(self) -> None:
+        try:
+            while self._stale:
+                await asyncio.sleep(self.delay)
+                self._stale = False
+                await self.rebuild()
+        except Exception:
+            logger.exception("catalog snapshot rebuild failed")
+        finally:
+            self._rebuild_task = None
+
+    async def rebuild(self) -> None:
+        """Читает каталог и публикует новое поколение"""
+        async with self._lock:
+            while True:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(LOCK_RETRY)
+            try:
+                # Читаем БД уже под блокировкой: опубликованное позже видит всё, что закоммичено раньше
+                products = await self._loader()
+                generation = self.generation() + 1
+                tmp = f"{self._path}.{os.getpid()}.tmp"
+                await asyncio.to_thread(_write, tmp, products, generation)
+                os.replace(tmp, self._path)
+                os.pwrite(self._fd, GENERATION.pack(generation), 0)
+                self.builds += 1
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        mapped = self._mapped
+        return {
+            "generation": self.generation() if self.enabled else 0,
+            "mapped_generation": mapped.generation if mapped is not None else 0,
+            "size": len(mapped) if mapped is not None else 0,
+            "builds": self.builds,
+            "remaps": self.remaps,
+        }
+
+
+catalog_snapshot = CatalogSnapshot(settings.CATALOG_SNAPSHOT_DIR, settings.CATALOG_SNAPSHOT_DELAY)
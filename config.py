@@ -1,7 +1,91 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Профиль движка БД (database.py): plain — настройки драйвера и пула по умолчанию, tuned — ниже
+    DB_PROFILE: Literal["plain", "tuned"] = "tuned"
+    # SQLite: журнал, synchronous, ожидание чужой блокировки (мс), кэш страниц (КиБ) и mmap (байт) на
+    # соединение; SINGLE_WRITER — все запросы через engine идут по одному соединению на воркер
+    SQLITE_JOURNAL_MODE: Literal["wal", "delete"] = "wal"
+    SQLITE_SYNCHRONOUS: Literal["off", "normal", "full"] = "normal"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 256 * 2**20
+    SQLITE_SINGLE_WRITER: bool = True
+    # Postgres: соединений в пуле и сверх него на воркер, проверка соединения перед выдачей,
+    # пересоздание старых соединений (с) и кэш подготовленных запросов asyncpg на соединение
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    # Чтение каталога, заказов и пользователей через read_engine: реплика DATABASE_READ_URL или,
+    # для SQLite, отдельный пул к тому же файлу; READ_POOL_SIZE — соединений в этом пуле
+    DB_READ_ROUTING: bool = True
+    DATABASE_READ_URL: Optional[str] = None
+    DB_READ_POOL_SIZE: int = 5
+    # Сколько секунд процесс доверяет своему кэшу каталога (другие воркеры его не сбрасывают)
+    CATALOG_CACHE_TTL: float = 5.0
+    # Общий снимок каталога для всех воркеров (catalog_snapshot.py): каталог для его файлов; без него
+    # каждый воркер держит свой кэш. Правки каталога за DELAY секунд собираются в одну пересборку
+    CATALOG_SNAPSHOT_DIR: Optional[str] = None
+    CATALOG_SNAPSHOT_DELAY: float = 0.05
+    # Кэш пользователей tg_id -> (id, role); сброса нет, смена роли в БД видна через USER_CACHE_TTL
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL: float = 60.0
+    # Логирование SQL: echo печатает каждый запрос, медленные пишутся в лог всегда
+    SQL_ECHO: bool = False
+    SLOW_QUERY_MS: float = 200.0
+    # Групповая фиксация заказов (order_pipeline): пачка до N заказов или до M мс ожидания
+    ORDER_BATCHING: bool = False
+    ORDER_BATCH_MAX_SIZE: int = 64
+    ORDER_BATCH_MAX_WAIT_MS: float = 5.0
+    # Лента остатков (stock_feed): событий в буфере для догона, пинг простаивающих клиентов;
+    # при нескольких воркерах — общий каталог для сокетов и счётчика ревизий
+    STOCK_FEED_BUFFER: int = 10_000
+    STOCK_FEED_HEARTBEAT: float = 15.0
+    STOCK_FEED_DIR: Optional[str] = None
+    # Миграции схемы при старте воркера; false — только проверка версии, миграции через `python migrate.py upgrade`
+    AUTO_MIGRATE: bool = True
+    # Картинки товаров (images.py): каталог с миниатюрами и потоки для их нарезки
+    IMAGES_DIR: str = "media/images"
+    IMAGE_WORKERS: int = 4
+    # Удержание товара в корзине (reservations.py): срок по умолчанию и предел в секундах,
+    # размер пачки и наибольший сон фонового снятия истёкших
+    RESERVATION_TTL: float = 900.0
+    RESERVATION_MAX_TTL: float = 3600.0
+    RESERVATION_SWEEP_BATCH: int = 500
+    RESERVATION_SWEEP_INTERVAL: float = 5.0
+    # Архив заказов (order_archive.py): закрытые раньше AFTER_DAYS дней заказы переносятся в *_archive
+    # пачками по BATCH заказов с паузой PAUSE секунд между пачками; проход раз в INTERVAL секунд
+    ORDER_ARCHIVE: bool = True
+    ORDER_ARCHIVE_AFTER_DAYS: float = 30.0
+    ORDER_ARCHIVE_BATCH: int = 500
+    ORDER_ARCHIVE_PAUSE: float = 0.05
+    ORDER_ARCHIVE_INTERVAL: float = 600.0
+    # Выгрузка заказов (order_export.py): строк за одно чтение с курсора
+    EXPORT_FETCH_SIZE: int = 1000
+    # Ограничение частоты (rate_limit.py): токенов в секунду на tg_id и на IP клиента, отдельно для
+    # чтения (GET) и записи; запас ведра — на BURST_SECONDS такой частоты. За прокси uvicorn нужен
+    # с --proxy-headers, иначе все клиенты придут с адреса прокси
+    RATE_LIMIT: bool = True
+    RATE_LIMIT_USER_READ: float = 10.0
+    RATE_LIMIT_USER_WRITE: float = 2.0
+    RATE_LIMIT_IP_READ: float = 50.0
+    RATE_LIMIT_IP_WRITE: float = 10.0
+    RATE_LIMIT_BURST_SECONDS: float = 5.0
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    # Одновременных запросов к БД на воркер, из них на чтение; сверх — сразу 503. Потоковая выгрузка
+    # заказов мест не занимает (её держит пул read_engine)
+    MAX_CONCURRENCY: int = 24
+    MAX_READ_CONCURRENCY: int = 8
+    # Путь чтения (fast_read.py): orm — ORM + model_validate, core — Core-строки через TypeAdapter,
+    # trusted — Core-строки сразу в orjson без pydantic (каталог в кэше хранит модели, ему trusted не нужен)
+    CATALOG_READ_PATH: Literal["orm", "core"] = "core"
+    ORDERS_READ_PATH: Literal["orm", "core", "trusted"] = "trusted"
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,107 @@
+"""Движки БД: настройки соединений под SQLite и Postgres и отдельный движок для чтения.
+
+DB_PROFILE=plain — движок как раньше: всё по умолчанию драйвера и пула.
+Профиль tuned:
+
+SQLite. На каждом новом соединении журнал WAL (читатели не ждут писателя,
+писатель не ждёт читателей), synchronous=NORMAL (в WAL при отключении
+питания теряются последние транзакции, но не целостность файла),
+busy_timeout, cache_size и mmap_size. При SQLITE_SINGLE_WRITER пул engine —
+одно соединение: записи воркера ждут его в очереди пула (видно в
+botshop_db_pool_checkout_wait_seconds), а не крутятся в busy-цикле SQLite
+с «database is locked» в конце. Воркеры между собой по-прежнему делят
+блокировку записи файла, их развязывает busy_timeout.
+
+Postgres. Пул DB_POOL_SIZE + DB_MAX_OVERFLOW на воркер, pool_pre_ping
+(соединение, порванное рестартом БД или pgbouncer, заменяется до запроса),
+pool_recycle и кэш подготовленных запросов asyncpg.
+
+Чтение. При DB_READ_ROUTING пути только для чтения (каталог, заказы и
+история пользователя, поиск пользователя для проверки ролей, страницы
+каталога, выгрузка) идут через read_engine: на реплику DATABASE_READ_URL,
+а без неё в SQLite — отдельным пулом к тому же файлу с query_only, чтобы
+чтения не стояли в очереди к единственному писателю. Через реплику эти
+чтения отстают от записи на задержку репликации.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import settings
+from metrics import TimedAsyncQueuePool, instrument_engine
+
+
+def _sqlite_pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+        # Отрицательный cache_size — в КиБ, а не в страницах
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def _tune_sqlite(engine: AsyncEngine, read_only: bool) -> None:
+    pragmas = _sqlite_pragmas(read_only)
+    journal_mode = settings.SQLITE_JOURNAL_MODE
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            # Режим журнала хранится в самом файле, а переключение берёт монопольную блокировку:
+            # меняем, только если он другой (у :memory: режим свой и не меняется)
+            cursor.execute("PRAGMA journal_mode")
+            current = cursor.fetchone()[0]
+            if current not in (journal_mode, "memory") and not read_only:
+                cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        finally:
+            cursor.close()
+
+
+def _engine_options(url: str, read_only: bool) -> dict:
+    options = {"echo": settings.SQL_ECHO, "poolclass": TimedAsyncQueuePool}
+    if settings.DB_PROFILE == "plain":
+        return options
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        if read_only:
+            options.update(pool_size=settings.DB_READ_POOL_SIZE, max_overflow=0)
+        elif settings.SQLITE_SINGLE_WRITER:
+            options.update(pool_size=1, max_overflow=0)
+        options["pool_timeout"] = settings.DB_POOL_TIMEOUT
+    elif url.get_backend_name() == "postgresql":
+        options.update(
+            pool_size=settings.DB_READ_POOL_SIZE if read_only else settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def make_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    engine = create_async_engine(url, **_engine_options(url, read_only))
+    if settings.DB_PROFILE == "tuned" and engine.dialect.name == "sqlite":
+        _tune_sqlite(engine, read_only)
+    instrument_engine(engine)
+    return engine
+
+
+def make_read_engine(engine: AsyncEngine) -> AsyncEngine:
+    """Движок для путей только для чтения; без реплики и не для SQLite — сам engine"""
+    if not settings.DB_READ_ROUTING:
+        return engine
+    if settings.DATABASE_READ_URL:
+        return make_engine(settings.DATABASE_READ_URL, read_only=True)
+    if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        return make_engine(settings.DATABASE_URL, read_only=True)
+    return engine
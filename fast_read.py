@@ -0,0 +1,124 @@
+"""Быстрый путь чтения: Core-строки вместо ORM-объектов.
+
+Для данных только на чтение ORM тратит больше всего времени на гидрацию
+объектов (identity map, инструментированные атрибуты), а model_validate с
+from_attributes добавляет ещё проход по каждой строке. Здесь выбираются только
+нужные колонки, и дальше есть два варианта:
+
+  core    — строки проверяются пачкой одним TypeAdapter и дают обычные модели;
+  trusted — строки из своей БД сразу собираются в dict и уходят в orjson
+            (FastJSONResponse), без pydantic вообще.
+
+Какой путь у эндпоинта, задают CATALOG_READ_PATH и ORDERS_READ_PATH; orm —
+прежний путь через ORM. Сравнение стоимости строки: python -m bench.read_path
+"""
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from images import image_urls
+from models import read_engine, Order, OrderProducts, Product
+from schemas import OrderOut, ProductOut
+
+products_adapter = TypeAdapter(List[ProductOut])
+# Каталог читается и проверяется пачками: целиком это сотни мс без возврата в event loop
+PRODUCTS_FETCH_SIZE = 1000
+orders_adapter = TypeAdapter(List[OrderOut])
+
+# Порядок колонок совпадает с полями ProductOut: так быстрее собирать dict
+PRODUCT_COLUMNS = (
+    Product.id, Product.title, Product.category, Product.price, Product.size,
+    Product.color, Product.quantity, Product.image_url, Product.image_hash,
+)
+PRODUCT_FIELDS = tuple(c.key for c in PRODUCT_COLUMNS)
+ORDER_COLUMNS = (
+    Order.id, Order.user, Order.timestamp, Order.order_sum, Order.shopping_address,
+    Order.city, Order.payment_method, Order.quantity, Order.email, Order.phone,
+)
+
+
+def json_default(value):
+    # Decimal, как и pydantic, отдаём строкой: float потерял бы копейки
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(ORJSONResponse):
+    """ORJSONResponse, который понимает Decimal"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def product_dict(row) -> dict:
+    """Строка PRODUCT_COLUMNS в тот же JSON, что даёт ProductOut"""
+    return {
+        "id": row[0], "title": row[1], "category": row[2], "price": row[3], "size": row[4],
+        "color": row[5], "quantity": row[6], "image_url": row[7],
+        "images": image_urls(row[8]) if row[8] else None,
+    }
+
+
+# Каталог
+async def load_products() -> List[ProductOut]:
+    """Весь каталог для кэша: Core-строки и одна проверка всего списка"""
+    products: List[ProductOut] = []
+    async with read_engine.connect() as conn:
+        result = await conn.stream(select(*PRODUCT_COLUMNS).execution_options(yield_per=PRODUCTS_FETCH_SIZE))
+        async for rows in result.mappings().partitions():
+            products += products_adapter.validate_python(rows)
+    return products
+
+
+# Заказы
+async def order_dicts(
+    user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = 50,
+    product: Callable[[Sequence], dict] = product_dict,
+) -> List[dict]:
+    """То же, что requests.get_orders, двумя запросами и сразу в виде JSON-совместимых dict"""
+    stmt = (
+        select(*ORDER_COLUMNS)
+        .where(Order.user == user_id, Order.completed == False)
+        .order_by(Order.id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        stmt = stmt.where(Order.id < before_id)
+
+    async with read_engine.connect() as conn:
+        orders = (await conn.execute(stmt)).all()
+        if not orders:
+            return []
+        by_id: Dict[int, dict] = {}
+        for o in orders:
+            by_id[o[0]] = {
+                "id": o[0], "user": o[1], "timestamp": o[2], "products": [], "lines": [],
+                "order_sum": o[3], "shopping_address": o[4], "city": o[5],
+                "payment_method": o[6], "quantity": o[7], "email": o[8], "phone": o[9],
+            }
+        # Позиции и товары одним запросом; outer join — позиция удалённого товара не теряется
+        lines = await conn.execute(
+            select(OrderProducts.order_id, OrderProducts.product_id, OrderProducts.quantity, *PRODUCT_COLUMNS)
+            .outerjoin(Product, Product.id == OrderProducts.product_id)
+            .where(OrderProducts.order_id.in_(list(by_id)))
+            .order_by(OrderProducts.order_id, OrderProducts.id)
+        )
+        for line in lines:
+            order = by_id[line[0]]
+            order["lines"].append({"product_id": line[1], "quantity": line[2]})
+            if line[3] is not None:
+                order["products"].append(product(line[3:]))
+    return list(by_id.values())
+
+
+async def load_orders(user_id: int, before_id: Optional[int] = None, limit: int = 50) -> List[OrderOut]:
+    """Путь core: те же строки, проверенные одним TypeAdapter"""
+    rows = await order_dicts(user_id, before_id, limit, product=lambda row: dict(zip(PRODUCT_FIELDS, row)))
+    return orders_adapter.validate_python(rows)
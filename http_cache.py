@@ -0,0 +1,53 @@
+import gzip
+
+from fastapi import Request, Response
+
+from catalog_cache import RenderedBody
+
+# Мелкие ответы (одна карточка товара) сжимать невыгодно
+GZIP_MIN_SIZE = 512
+
+
+def _etag_matches(if_none_match: str, etags: tuple) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") in etags:
+            return True
+    return False
+
+
+def cached_json_response(request: Request, rendered: RenderedBody) -> Response:
+    """JSON-ответ с ETag: 304 на совпавший If-None-Match, gzip из кэша, если клиент его принимает"""
+    gzip_etag = rendered.etag[:-1] + '-gzip"'
+    use_gzip = (
+        len(rendered.body) >= GZIP_MIN_SIZE
+        and "gzip" in request.headers.get("accept-encoding", "")
+    )
+    headers = {
+        "ETag": gzip_etag if use_gzip else rendered.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, (rendered.etag, gzip_etag)):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(rendered.gzipped(), media_type="application/json", headers=headers)
+    return Response(rendered.body, media_type="application/json", headers=headers)
+
+
+def json_response(request: Request, body: bytes) -> Response:
+    """JSON-ответ без кэша на сервере, сжатый, если клиент принимает gzip.
+
+    Сжимается на каждый запрос, но с тем же уровнем, что и кэш каталога: на мобильной
+    сети лишние килобайты дороже пары миллисекунд процессора.
+    """
+    if len(body) >= GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            gzip.compress(body, compresslevel=6), media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(body, media_type="application/json", headers={"Vary": "Accept-Encoding"})
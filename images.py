@@ -0,0 +1,185 @@
+"""Картинки товаров: миниатюры в WebP под именами по хэшу содержимого.
+
+Исходник декодируется и ужимается Pillow в пуле потоков (Pillow отпускает GIL
+на декодировании и ресайзе), так что event loop не блокируется. Файлы лежат
+в IMAGES_DIR/<2 символа хэша>/<хэш>-<размер>.webp: одинаковые картинки
+хранятся один раз, а имя меняется вместе с содержимым, поэтому раздавать их
+можно с Cache-Control: immutable. Товар хранит только image_hash, URL
+размеров собирает ProductOut.images.
+
+Обработка уже заданных image_url (скачать, нарезать, записать image_hash):
+
+    python images.py backfill
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.staticfiles import StaticFiles
+from sqlalchemy import select, update
+
+from config import settings
+from models import async_session, Product
+
+# Размер — максимальная сторона в пикселях
+SIZES = {"thumb": 160, "card": 480, "full": 1200}
+WEBP_QUALITY = 80
+URL_PREFIX = "/media/images"
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+# Защита от «бомб» — картинок с огромным разрешением при маленьком файле
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+_executor: Optional[Executor] = None
+
+
+def _pool() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+    return _executor
+
+
+def image_urls(image_hash: str) -> Dict[str, str]:
+    return {size: f"{URL_PREFIX}/{image_hash[:2]}/{image_hash}-{size}.webp" for size in SIZES}
+
+
+def _path(directory: str, image_hash: str, size: str) -> str:
+    return os.path.join(directory, image_hash[:2], f"{image_hash}-{size}.webp")
+
+
+def render_image(data: bytes, directory: str) -> str:
+    """Нарезает все размеры в directory и возвращает хэш; синхронная — вызывать в пуле"""
+    image_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if all(os.path.exists(_path(directory, image_hash, size)) for size in SIZES):
+        return image_hash
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # draft() даёт декодеру JPEG сразу уменьшить картинку в 2-8 раз — самое дорогое место
+            source.draft("RGB", (max(SIZES.values()), max(SIZES.values())))
+            image = ImageOps.exif_transpose(source)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"not an image: {e}")
+
+    os.makedirs(os.path.join(directory, image_hash[:2]), exist_ok=True)
+    # От большего к меньшему: каждый следующий размер ужимается из предыдущего
+    for size, side in sorted(SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((side, side), Image.Resampling.LANCZOS)
+        target = _path(directory, image_hash, size)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        image.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(tmp, target)
+    return image_hash
+
+
+async def store_image(data: bytes) -> str:
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_pool(), render_image, data, settings.IMAGES_DIR)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+async def set_product_image(product_id: int, image_hash: str) -> None:
+    async with async_session() as session:
+        result = await session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(image_hash=image_hash, image_url=image_urls(image_hash)["full"])
+        )
+        if result.rowcount == 0:
+            raise HTTPException(404, "Product not found")
+        await session.commit()
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Раздача картинок: имя файла — хэш содержимого, поэтому кэшировать можно навсегда"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def static_files() -> ImmutableStaticFiles:
+    os.makedirs(settings.IMAGES_DIR, exist_ok=True)
+    return ImmutableStaticFiles(directory=settings.IMAGES_DIR)
+
+
+# Обработка уже заданных image_url
+BACKFILL_CONCURRENCY = 8
+
+
+async def backfill(concurrency: int = BACKFILL_CONCURRENCY) -> dict:
+    """Скачивает внешние image_url товаров без image_hash и нарезает их"""
+    import httpx
+
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(Product.id, Product.image_url)
+            .where(Product.image_hash.is_(None), Product.image_url.is_not(None))
+            .order_by(Product.id)
+        )).all()
+
+    # Одна картинка на нескольких товарах качается и режется один раз
+    by_url: Dict[str, List[int]] = {}
+    for row in rows:
+        by_url.setdefault(row.image_url, []).append(row.id)
+
+    done = failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(client: httpx.AsyncClient, url: str, product_ids: List[int]):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                if url.startswith(("http://", "https://")):
+                    response = await client.get(url)
+                    response.raise_for_status()
+                    data = response.content
+                else:
+                    data = await asyncio.to_thread(_read_file, url)
+                image_hash = await store_image(data)
+            except (httpx.HTTPError, OSError, HTTPException) as e:
+                failed += len(product_ids)
+                print(f"skip {url}: {getattr(e, 'detail', e)}")
+                return
+        async with async_session() as session:
+            await session.execute(
+                update(Product).where(Product.id.in_(product_ids)).values(image_hash=image_hash)
+            )
+            await session.commit()
+        done += len(product_ids)
+
+    async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+        await asyncio.gather(*[process(client, url, ids) for url, ids in by_url.items()])
+    return {"processed": done, "failed": failed, "images": len(by_url)}
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _main(argv: List[str]) -> None:
+    from models import engine, init_db
+
+    if argv[1:] != ["backfill"]:
+        print("usage: python images.py backfill")
+        sys.exit(2)
+    await init_db()
+    print(await backfill())
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
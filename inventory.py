@@ -0,0 +1,163 @@
+from typing import Dict, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Product
+from schemas import OrderItem, QuantityDelta, QuantityResult, QuantityRejection, BulkQuantityResult
+
+# CASE по id встречается в запросе трижды (по 2 параметра на товар); держимся ниже лимита переменных SQLite
+CHUNK_SIZE = 400
+
+
+def _conditional_update(deltas: Dict[int, int]):
+    """UPDATE products SET quantity = quantity + d WHERE id IN (...) AND остаток не уходит ниже min_quantity.
+
+    Удержанное в корзинах (reserved) продать нельзя: оно вычитается из остатка.
+    """
+    delta = case(deltas, value=Product.id)
+    return (
+        update(Product)
+        .where(Product.id.in_(deltas))
+        .where(or_(delta >= 0, Product.quantity - Product.reserved + delta >= func.coalesce(Product.min_quantity, 0)))
+        .values(quantity=Product.quantity + delta)
+        .returning(Product)
+        # Товар мог быть уже загружен в сессию: без populate_existing RETURNING отдаст его со старым quantity
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+
+
+async def _explain_failure(session: AsyncSession, deltas: Dict[int, int], applied: Iterable[int]) -> HTTPException:
+    failed = [pid for pid in deltas if pid not in set(applied)]
+    rows = await session.execute(
+        select(Product.id, Product.title, Product.quantity, Product.reserved, Product.min_quantity)
+        .where(Product.id.in_(failed))
+    )
+    found = {row.id: row for row in rows}
+    for pid in failed:
+        prod = found.get(pid)
+        if prod is None:
+            return HTTPException(404, f"Product {pid} not found")
+        wanted = -deltas[pid]
+        min_quantity = prod.min_quantity or 0
+        available = prod.quantity - prod.reserved
+        if available - wanted < 0:
+            return HTTPException(400, f"Not enough stock for {prod.title}. Available: {available}")
+        return HTTPException(400,
+            f"Cannot order {wanted} items. Would breach minimum stock {min_quantity}. "
+            f"Max available: {available - min_quantity}"
+        )
+    return HTTPException(409, "Stock changed concurrently, retry")
+
+
+async def _apply_chunks(session: AsyncSession, deltas: Dict[int, int]) -> Dict[int, Product]:
+    updated: Dict[int, Product] = {}
+    items = list(deltas.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = dict(items[start:start + CHUNK_SIZE])
+        result = await session.execute(_conditional_update(chunk))
+        for product in result.scalars():
+            updated[product.id] = product
+    return updated
+
+
+async def apply_deltas(session: AsyncSession, deltas: Dict[int, int]) -> Dict[int, Product]:
+    """Атомарно применяет изменения остатков; при любом отказе бросает HTTPException.
+
+    Транзакцию не фиксирует. Если часть товаров не прошла условие, уже списанное
+    возвращается в той же транзакции, так что после ошибки её можно продолжать.
+    """
+    updated = await _apply_chunks(session, deltas)
+    if len(updated) != len(deltas):
+        error = await _explain_failure(session, deltas, updated)
+        await _undo(session, {pid: deltas[pid] for pid in updated})
+        raise error
+    return updated
+
+
+async def _undo(session: AsyncSession, applied: Dict[int, int]) -> None:
+    """Откатывает уже применённые изменения в той же транзакции (без SAVEPOINT)"""
+    items = list(applied.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = dict(items[start:start + CHUNK_SIZE])
+        await session.execute(
+            update(Product)
+            .where(Product.id.in_(chunk))
+            .values(quantity=Product.quantity - case(chunk, value=Product.id))
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _rejections(session: AsyncSession, deltas: Dict[int, int]) -> list[QuantityRejection]:
+    found = {}
+    ids = list(deltas)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows = await session.execute(
+            select(Product.id, Product.quantity, Product.reserved, Product.min_quantity)
+            .where(Product.id.in_(ids[start:start + CHUNK_SIZE]))
+        )
+        found.update({row.id: row for row in rows})
+
+    rejections = []
+    for pid, delta in deltas.items():
+        prod = found.get(pid)
+        if prod is None:
+            rejections.append(QuantityRejection(product_id=pid, reason="not_found"))
+        elif delta < 0 and prod.quantity - prod.reserved + delta < (prod.min_quantity or 0):
+            rejections.append(QuantityRejection(
+                product_id=pid,
+                reason="below_min_quantity",
+                quantity=prod.quantity,
+                min_quantity=prod.min_quantity or 0,
+            ))
+    return rejections
+
+
+async def apply_bulk_deltas(session: AsyncSession, updates: list[QuantityDelta]) -> BulkQuantityResult:
+    """Применяет пачку изменений остатков целиком или не применяет ничего; commit — за вызывающим"""
+    deltas: Dict[int, int] = {}
+    for upd in updates:
+        deltas[upd.product_id] = deltas.get(upd.product_id, 0) + upd.change
+
+    # Оптимистично: сразу условный UPDATE, разбор причин — только если что-то не прошло
+    updated = await _apply_chunks(session, deltas)
+    if len(updated) == len(deltas):
+        return BulkQuantityResult(
+            applied=True,
+            results=[QuantityResult(product_id=pid, quantity=p.quantity) for pid, p in updated.items()],
+        )
+
+    await session.rollback()
+    rejections = await _rejections(session, deltas)
+    if not rejections:
+        raise HTTPException(409, "Stock changed concurrently, retry")
+    return BulkQuantityResult(applied=False, rejections=rejections)
+
+
+async def reserve_stock(session: AsyncSession, items: list[OrderItem]) -> Dict[int, Product]:
+    """Списывает остатки под все позиции заказа одним условным UPDATE"""
+    deltas: Dict[int, int] = {}
+    for it in items:
+        if it.quantity <= 0:
+            raise HTTPException(400, f"Invalid quantity for product {it.id}")
+        deltas[it.id] = deltas.get(it.id, 0) - it.quantity
+    return await apply_deltas(session, deltas)
+
+
+async def adjust_stock(session: AsyncSession, product_id: int, delta: int) -> Product:
+    updated = await apply_deltas(session, {product_id: delta})
+    return updated[product_id]
+
+
+async def set_stock(session: AsyncSession, product_id: int, quantity: int) -> Product:
+    product = await session.scalar(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(quantity=quantity)
+        .returning(Product)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    if product is None:
+        raise HTTPException(404, "Product not found")
+    return product
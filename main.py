@@ -1,14 +1,35 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import get_async_session, init_db
 import requests as rq
-from schemas import CreateOrder, CreateProduct, CompleteOrder, CompleteProduct, ProductOut, OrderOut, UpdateProduct
+from schemas import CreateOrder, CreateProduct, CompleteOrder, CompleteProduct, ProductOut, ProductPage, OrderOut, OrderHistoryOut, UpdateProduct, QuantityDelta, BulkQuantityResult, HoldProduct, ReservationOut, BootstrapOut
 import os
-from typing import List
+from typing import List, Optional
+from decimal import Decimal
 from admin import router as admin_router
 from upload_products import router as upload_router
+from upload_images import router as upload_images_router
+from images import URL_PREFIX as IMAGES_URL_PREFIX, static_files
+from catalog_cache import catalog_cache
+from catalog_snapshot import catalog_snapshot
+from http_cache import cached_json_response, json_response
+from metrics import MetricsMiddleware, render_metrics
+from rate_limit import AdmissionMiddleware, rate_limit
+import rate_limit as limits
+from order_pipeline import order_ingestor
+from config import settings
+from search import search_products
+from stock_feed import stock_feed
+from reservations import reservation_sweeper
+from order_archive import order_archiver
+import order_archive
+import reservations
+import bootstrap
+from fast_read import FastJSONResponse
+import fast_read
 import asyncio
 
 @asynccontextmanager
@@ -16,12 +37,27 @@ async def lifespan(app: FastAPI):
     try:
         await init_db()
         print('Database initialized')
+        await catalog_snapshot.start(rq.load_all_products)
+        if settings.ORDER_BATCHING:
+            order_ingestor.start()
+        stock_feed.start()
+        reservation_sweeper.start()
+        if settings.ORDER_ARCHIVE:
+            order_archiver.start()
         yield
+        await order_archiver.stop()
+        await reservation_sweeper.stop()
+        stock_feed.close()
+        await order_ingestor.stop()
+        await catalog_snapshot.stop()
     except Exception as e:
         print(f'Startup error: {e}')
         raise
 
-app = FastAPI(title="To Do App", lifespan=lifespan)
+app = FastAPI(title="To Do App", lifespan=lifespan, dependencies=[Depends(rate_limit)])
+
+# Внутри CORS: отказы 503 тоже должны нести CORS-заголовки
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,11 +65,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Подключаем роутеры
 app.include_router(admin_router)
 app.include_router(upload_router)
+app.include_router(upload_images_router)
+app.mount(IMAGES_URL_PREFIX, static_files(), name="images")
 
 # Keep-alive background task
 async def keep_app_alive():
@@ -44,6 +85,11 @@ async def keep_app_alive():
 async def root():
     return {"message": "Сервис работает"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_route():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.get("/api/test-cors")
 def test_cors():
     return {"status": "ok"}
@@ -59,21 +105,67 @@ async def is_admin(tg_id: int):
     user = await rq.add_user(tg_id)
     return {"isAdmin": user.role == "admin"}
 
+# Пользователь, роль, каталог и открытые заказы одним запросом (см. bootstrap.py);
+# catalog/orders — версии частей, которые уже есть у клиента: такие части придут как null
+@app.get("/api/bootstrap/{tg_id}", response_model=BootstrapOut)
+async def bootstrap_route(
+    tg_id: int,
+    request: Request,
+    catalog: Optional[str] = None,
+    orders: Optional[str] = None
+):
+    return json_response(request, await bootstrap.payload(tg_id, catalog, orders))
+
 # Заказы
 @app.get("/api/orders/{tg_id}", response_model=List[OrderOut])
-async def get_user_orders(tg_id: int):
+async def get_user_orders(
+    tg_id: int,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
     user = await rq.add_user(tg_id)
-    return await rq.get_orders(user.id)
+    if settings.ORDERS_READ_PATH == "trusted":
+        return FastJSONResponse(await fast_read.order_dicts(user.id, before_id=before_id, limit=limit))
+    if settings.ORDERS_READ_PATH == "core":
+        orders = await fast_read.load_orders(user.id, before_id=before_id, limit=limit)
+        return Response(fast_read.orders_adapter.dump_json(orders), media_type="application/json")
+    return await rq.get_orders(user.id, before_id=before_id, limit=limit)
+
+# Вся история: открытые, закрытые и перенесённые в архив заказы (см. order_archive.py)
+@app.get("/api/orders/{tg_id}/history", response_model=List[OrderHistoryOut])
+async def get_user_order_history(
+    tg_id: int,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
+    user = await rq.add_user(tg_id)
+    return FastJSONResponse(await order_archive.history_dicts(user.id, before_id=before_id, limit=limit))
+
+@app.get("/api/order-archive/stats")
+async def order_archive_stats_route():
+    return order_archiver.stats()
 
 @app.post("/api/order/create")
 async def create_order_route(
     order: CreateOrder, 
     session: AsyncSession = Depends(get_async_session)
 ):
+    if settings.ORDER_BATCHING:
+        await order_ingestor.submit(
+            tg_id=order.tg_id,
+            items=order.items,
+            shipping_address=order.shopping_address,
+            city=order.city,
+            payment_method=order.payment_method,
+            notes=order.notes,
+            timestamp=order.timestamp
+        )
+        return {"status": "ok"}
+
     await rq.create_order(
         tg_id=order.tg_id,
         items=order.items,
-        shipping_address=order.shipping_address,
+        shipping_address=order.shopping_address,
         city=order.city,
         payment_method=order.payment_method,
         notes=order.notes,
@@ -82,6 +174,27 @@ async def create_order_route(
     )
     return {"status": "ok"}
 
+# Удержание товара в корзине: заказ потом списывает удержанное без повторной проверки остатка
+@app.post("/api/reservations", response_model=ReservationOut)
+async def hold_product_route(body: HoldProduct):
+    user = await rq.add_user(body.tg_id)
+    return await reservations.hold(user.id, body.product_id, body.quantity, body.ttl)
+
+@app.get("/api/reservations/stats")
+async def reservation_stats_route():
+    return reservation_sweeper.stats()
+
+@app.get("/api/reservations/{tg_id}", response_model=List[ReservationOut])
+async def user_reservations_route(tg_id: int):
+    user = await rq.add_user(tg_id)
+    return await reservations.user_reservations(user.id)
+
+@app.delete("/api/reservations/{tg_id}/{product_id}")
+async def release_reservation_route(tg_id: int, product_id: int):
+    user = await rq.add_user(tg_id)
+    await reservations.hold(user.id, product_id, 0)
+    return {"status": "ok"}
+
 @app.patch("/api/order/completed")
 async def complete_order_route(order: CompleteOrder):
     await rq.update_order(order.id)
@@ -89,8 +202,68 @@ async def complete_order_route(order: CompleteOrder):
 
 # Товары
 @app.get("/api/products", response_model=List[ProductOut])
-async def get_products_route():
-    return await rq.get_all_products()
+async def get_products_route(request: Request):
+    return cached_json_response(request, await rq.get_all_products_rendered())
+
+@app.get("/api/products/page", response_model=ProductPage)
+async def get_products_page_route(
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[int] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    return await rq.query_products(
+        category=category,
+        color=color,
+        size=size,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        cursor=cursor,
+        limit=limit
+    )
+
+@app.get("/api/products/search", response_model=List[ProductOut])
+async def search_products_route(
+    q: str = Query(..., min_length=1, max_length=100),
+    category: Optional[str] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    return await search_products(q, category=category, min_price=min_price, max_price=max_price, limit=limit)
+
+@app.get("/api/products/cache-stats")
+async def products_cache_stats():
+    return catalog_cache.stats()
+
+@app.get("/api/products/snapshot-stats")
+async def products_snapshot_stats():
+    return catalog_snapshot.stats()
+
+# Лента остатков вместо опроса каталога; since или заголовок Last-Event-ID — продолжить с ревизии
+@app.get("/api/stock/stream")
+async def stock_stream_route(request: Request, since: Optional[int] = None):
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        stock_feed.stream(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/rate-limit/stats")
+async def rate_limit_stats_route():
+    return limits.stats()
+
+@app.get("/api/stock/stats")
+async def stock_stats_route():
+    return stock_feed.stats()
 
 @app.post("/api/product/create")
 async def create_product_route(product: CreateProduct):
@@ -129,12 +302,11 @@ async def update_product_route(
     return {"status": "updated"}
 
 @app.get("/api/product/{product_id}", response_model=ProductOut)
-async def get_product_route(product_id: int):
-    products = await rq.get_all_products()
-    for product in products:
-        if product.id == product_id:
-            return product
-    raise HTTPException(status_code=404, detail="Product not found")
+async def get_product_route(product_id: int, request: Request):
+    rendered = await rq.get_product_rendered(product_id)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return cached_json_response(request, rendered)
 
 @app.patch("/api/product/decrease/{product_id}")
 async def decrease_quantity(
@@ -175,15 +347,16 @@ async def increase_quantity(
             detail=f"Internal server error: {str(e)}"
         )
 
-@app.patch("/api/products/update-quantities")
+@app.patch("/api/products/update-quantities", response_model=BulkQuantityResult)
 async def bulk_update_quantities(
-    updates: list[dict[str, int]],  # [{product_id: 1, change: +1}]
+    updates: List[QuantityDelta],  # [{product_id: 1, change: +1}]
+    response: Response,
     session: AsyncSession = Depends(get_async_session)
 ):
-    for update in updates:
-        product = await session.get(Product, update["product_id"])
-        product.quantity += update["change"]
-    await session.commit()
+    result = await rq.bulk_update_quantities(updates, session)
+    if not result.applied:
+        response.status_code = status.HTTP_409_CONFLICT
+    return result
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import settings
+
+logger = logging.getLogger("botshop.sql")
+
+REQUEST_LATENCY = Histogram(
+    "botshop_request_seconds", "Время обработки HTTP-запроса", ["method", "route", "status"],
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    "botshop_request_sql_statements", "Число SQL-запросов на HTTP-запрос", ["route"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64, 128),
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "botshop_request_sql_seconds", "Суммарное время SQL на HTTP-запрос", ["route"],
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "botshop_pool_checkout_wait_seconds", "Ожидание соединения из пула",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SLOW_QUERIES = Counter(
+    "botshop_slow_queries_total", "SQL-запросы дольше SLOW_QUERY_MS",
+)
+REJECTED_REQUESTS = Counter(
+    "botshop_rejected_requests_total", "Запросы, отклонённые rate_limit: ip/user — 429, busy — 503", ["reason"],
+)
+ARCHIVED_ROWS = Counter(
+    "botshop_archived_rows_total", "Строки, перенесённые order_archive в архив", ["table"],
+)
+ARCHIVE_ROWS_PER_SECOND = Gauge(
+    "botshop_archive_rows_per_second", "Скорость переноса в архив за последний проход",
+)
+LIVE_TABLE_ROWS = Gauge(
+    "botshop_live_table_rows", "Строк в живых таблицах заказов до и после последнего прохода архивации",
+    ["table", "phase"],
+)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine) -> None:
+    """Вешает на движок счётчики SQL для текущего запроса и лог медленных запросов"""
+    sync_engine = engine.sync_engine
+    slow_seconds = settings.SLOW_QUERY_MS / 1000
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+        if elapsed >= slow_seconds:
+            SLOW_QUERIES.inc()
+            logger.warning("slow query %.1fms: %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка по шаблону маршрута и SQL-нагрузка каждого запроса"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            # Шаблон пути, а не сам путь, чтобы id в URL не раздували число серий
+            label = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], label, str(status)).observe(time.perf_counter() - started)
+            REQUEST_SQL_STATEMENTS.labels(label).observe(stats.statements)
+            REQUEST_SQL_SECONDS.labels(label).observe(stats.db_seconds)
+
+
+class CacheCollector:
+    """Отдаёт счётчики попаданий in-process кэшей в момент опроса /metrics"""
+
+    def describe(self):
+        # Без describe() реестр вызвал бы collect() при регистрации, до импорта кэшей
+        yield CounterMetricFamily("botshop_cache_requests", "Обращения к кэшам", labels=["cache", "result"])
+        yield GaugeMetricFamily("botshop_cache_entries", "Записей в кэше", labels=["cache"])
+
+    def collect(self):
+        from catalog_cache import catalog_cache
+        from users import user_cache
+
+        requests = CounterMetricFamily("botshop_cache_requests", "Обращения к кэшам", labels=["cache", "result"])
+        size = GaugeMetricFamily("botshop_cache_entries", "Записей в кэше", labels=["cache"])
+        for name, stats in (("catalog", catalog_cache.stats()), ("users", user_cache.stats())):
+            requests.add_metric([name, "hit"], stats["hits"])
+            requests.add_metric([name, "miss"], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield requests
+        yield size
+
+
+REGISTRY.register(CacheCollector())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
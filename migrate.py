@@ -0,0 +1,209 @@
+"""Версионные миграции схемы БД.
+
+Скрипты лежат в migrations/ и называются NNNN_описание.py; каждый объявляет
+upgrade(conn) над синхронным Connection. Номер последнего применённого скрипта
+хранится в таблице schema_version.
+
+При старте воркера ensure_schema() делает один запрос (max(version)); если
+схема отстаёт, миграции применяет тот воркер, который первым возьмёт
+блокировку (файловую для SQLite, advisory lock для Postgres), остальные
+дожидаются и перепроверяют версию. С AUTO_MIGRATE=false воркер только
+проверяет версию, а миграции накатываются заранее:
+
+    python migrate.py upgrade
+    python migrate.py status
+
+Первые миграции рассчитаны и на базы, созданные до появления schema_version
+через create_all: они проверяют, что уже есть, и доводят схему до нужной.
+"""
+import asyncio
+import fcntl
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from types import ModuleType
+from typing import List
+
+from sqlalchemy import Connection, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+
+logger = logging.getLogger("botshop.migrate")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_NAME = re.compile(r"^(\d{4})_(\w+)\.py$")
+# Ключ pg_advisory_lock, общий для всех воркеров
+PG_LOCK_KEY = 0x626f7473686f70
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+    def upgrade(self, conn: Connection) -> None:
+        self.module.upgrade(conn)
+
+
+# Помощники для скриптов миграций
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def column_names(conn: Connection, table: str) -> set[str]:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def index_names(conn: Connection, table: str) -> set[str]:
+    return {i["name"] for i in inspect(conn).get_indexes(table)}
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _NAME.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(f"migrations.{filename[:-3]}", os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    versions = [m.version for m in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise RuntimeError(f"migrations must be numbered 0001, 0002, ... without gaps: {versions}")
+    return migrations
+
+
+MIGRATIONS = load_migrations()
+HEAD = MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+# Версия и блокировка
+async def current_version(engine: AsyncEngine) -> int:
+    """Один запрос; 0 — если таблицы версий ещё нет"""
+    try:
+        async with engine.connect() as conn:
+            return (await conn.scalar(text("SELECT max(version) FROM schema_version"))) or 0
+    except DBAPIError:
+        return 0
+
+
+def _lock_path(engine: AsyncEngine) -> str:
+    url = make_url(str(engine.url))
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        return f"{os.path.abspath(url.database)}.migrate.lock"
+    digest = hashlib.sha1(str(engine.url).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"botshop-migrate-{digest}.lock")
+
+
+@asynccontextmanager
+async def _migration_lock(engine: AsyncEngine):
+    """Только один процесс мигрирует: flock на этой машине, advisory lock — между машинами для Postgres"""
+    fd = os.open(_lock_path(engine), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        if engine.dialect.name == "postgresql":
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": PG_LOCK_KEY})
+                try:
+                    yield
+                finally:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PG_LOCK_KEY})
+        else:
+            yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+    conn.execute(
+        text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": migration.version, "name": migration.name, "applied_at": datetime.utcnow()},
+    )
+
+
+async def _apply(engine: AsyncEngine, migration: Migration) -> None:
+    if engine.dialect.name == "sqlite":
+        # Драйвер sqlite3 сам не открывает транзакцию перед DDL — открываем явно,
+        # чтобы миграция и запись о ней применились целиком или никак
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                await conn.run_sync(migration.upgrade)
+                await conn.run_sync(_record, migration)
+            except BaseException:
+                await conn.exec_driver_sql("ROLLBACK")
+                raise
+            await conn.exec_driver_sql("COMMIT")
+    else:
+        async with engine.begin() as conn:
+            await conn.run_sync(migration.upgrade)
+            await conn.run_sync(_record, migration)
+
+
+async def upgrade(engine: AsyncEngine, target: int = HEAD) -> List[int]:
+    """Применяет недостающие миграции до target; возвращает номера применённых"""
+    if await current_version(engine) >= target:
+        return []
+
+    applied = []
+    async with _migration_lock(engine):
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+            ))
+        # Пока ждали блокировку, другой воркер мог всё применить
+        current = await current_version(engine)
+        for migration in MIGRATIONS:
+            if current < migration.version <= target:
+                logger.warning("applying migration %04d_%s", migration.version, migration.name)
+                await _apply(engine, migration)
+                applied.append(migration.version)
+    return applied
+
+
+async def ensure_schema(engine: AsyncEngine) -> None:
+    """Проверка при старте: один запрос, если схема актуальна"""
+    current = await current_version(engine)
+    if current == HEAD:
+        return
+    if current > HEAD:
+        raise RuntimeError(f"database schema v{current} is newer than this code (v{HEAD})")
+    if not settings.AUTO_MIGRATE:
+        raise RuntimeError(f"database schema v{current}, code needs v{HEAD}: run `python migrate.py upgrade`")
+    await upgrade(engine)
+
+
+async def _main(argv: List[str]) -> None:
+    from models import engine
+
+    command = argv[1] if len(argv) > 1 else ""
+    if command == "status":
+        current = await current_version(engine)
+        for m in MIGRATIONS:
+            print(f"{'applied' if m.version <= current else 'pending':<8} {m.version:04d}_{m.name}")
+    elif command == "upgrade":
+        applied = await upgrade(engine, int(argv[2]) if len(argv) > 2 else HEAD)
+        print(f"applied: {', '.join(f'{v:04d}' for v in applied) or 'nothing'}; schema v{await current_version(engine)}")
+    else:
+        print("usage: python migrate.py status | upgrade [version]")
+        sys.exit(2)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,59 @@
+"""Исходная схема — такой её создавал create_all до появления миграций.
+
+Для баз, созданных раньше, существующие таблицы не трогаются (checkfirst);
+расхождения с моделями исправляют следующие миграции.
+"""
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Connection, Date, ForeignKey, Integer, MetaData, Numeric, String, Table,
+)
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("tg_id", BigInteger),
+    Column("role", String(10), nullable=False),
+)
+Table(
+    "products", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("title", String(40), nullable=False),
+    Column("category", String(40), nullable=False),
+    Column("price", Numeric(10, 2), nullable=False),
+    Column("size", Integer, nullable=False),
+    Column("color", String(40), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("image_url", String(255)),
+    Column("min_quantity", Integer, nullable=False),
+)
+Table(
+    "orders", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user", ForeignKey("users.id"), nullable=False),
+    Column("timestamp", Date),
+    Column("order_sum", Numeric(10, 2)),
+    Column("completed", Boolean, nullable=False),
+    Column("shipping_address", String(255), nullable=False),
+    Column("city", String(100), nullable=False),
+    Column("payment_method", String(50), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("email", String(128), nullable=False),
+    Column("phone", String(12), nullable=False),
+)
+Table(
+    "order_products", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("order_id", ForeignKey("orders.id"), nullable=False),
+    Column("product_id", ForeignKey("products.id"), nullable=False),
+    Column("quantity", Integer, nullable=False),
+)
+Table(
+    "admins", metadata,
+    Column("id", ForeignKey("users.id"), primary_key=True),
+    Column("access_level", Integer, nullable=False),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn, checkfirst=True)
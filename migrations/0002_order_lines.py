@@ -0,0 +1,36 @@
+"""order_products как строки заказа: суррогатный id и количество.
+
+Старые базы хранили пару (order_id, product_id) составным ключом без
+количества; такие строки переносятся с quantity = 1.
+"""
+from sqlalchemy import Column, Connection, ForeignKey, Integer, MetaData, Table, text
+
+from migrate import column_names
+
+
+def upgrade(conn: Connection) -> None:
+    columns = column_names(conn, "order_products")
+    if "id" in columns:
+        if "quantity" not in columns:
+            conn.execute(text("ALTER TABLE order_products ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1"))
+        return
+
+    metadata = MetaData()
+    # Заглушки нужны только для внешних ключей; создаётся одна order_products_new
+    Table("orders", metadata, Column("id", Integer, primary_key=True))
+    Table("products", metadata, Column("id", Integer, primary_key=True))
+    lines = Table(
+        "order_products_new", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("order_id", ForeignKey("orders.id"), nullable=False),
+        Column("product_id", ForeignKey("products.id"), nullable=False),
+        Column("quantity", Integer, nullable=False),
+    )
+    lines.create(conn)
+    quantity = "quantity" if "quantity" in columns else "1"
+    conn.execute(text(
+        "INSERT INTO order_products_new (order_id, product_id, quantity) "
+        f"SELECT order_id, product_id, {quantity} FROM order_products ORDER BY order_id, product_id"
+    ))
+    conn.execute(text("DROP TABLE order_products"))
+    conn.execute(text("ALTER TABLE order_products_new RENAME TO order_products"))
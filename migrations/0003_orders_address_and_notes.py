@@ -0,0 +1,13 @@
+"""Адрес доставки хранится в shipping_address (модель одно время создавала
+shopping_address), и у заказа появляется комментарий notes."""
+from sqlalchemy import Connection, text
+
+from migrate import column_names
+
+
+def upgrade(conn: Connection) -> None:
+    columns = column_names(conn, "orders")
+    if "shopping_address" in columns and "shipping_address" not in columns:
+        conn.execute(text("ALTER TABLE orders RENAME COLUMN shopping_address TO shipping_address"))
+    if "notes" not in columns:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN notes VARCHAR(500)"))
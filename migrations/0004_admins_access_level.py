@@ -0,0 +1,9 @@
+"""admins.access_level есть в модели, но в старых базах отсутствует."""
+from sqlalchemy import Connection, text
+
+from migrate import column_names
+
+
+def upgrade(conn: Connection) -> None:
+    if "access_level" not in column_names(conn, "admins"):
+        conn.execute(text("ALTER TABLE admins ADD COLUMN access_level INTEGER NOT NULL DEFAULT 1"))
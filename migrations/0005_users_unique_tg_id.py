@@ -0,0 +1,35 @@
+"""Уникальный tg_id: на нём держится upsert пользователя (ON CONFLICT (tg_id)).
+
+Прежний add_user (SELECT, затем INSERT) под конкуренцией мог создать дубли —
+заказы и роль админа переносятся на самую раннюю запись, остальные удаляются.
+"""
+from sqlalchemy import Connection, column, func, select, table, text
+
+from migrate import index_names
+
+users = table("users", column("id"), column("tg_id"), column("role"))
+orders = table("orders", column("user"))
+admins = table("admins", column("id"), column("access_level"))
+
+
+def upgrade(conn: Connection) -> None:
+    duplicated = select(users.c.tg_id).where(users.c.tg_id.is_not(None)).group_by(users.c.tg_id).having(func.count() > 1)
+    groups: dict[int, list] = {}
+    for row in conn.execute(
+        select(users.c.id, users.c.tg_id, users.c.role).where(users.c.tg_id.in_(duplicated)).order_by(users.c.id)
+    ):
+        groups.setdefault(row.tg_id, []).append(row)
+
+    for rows in groups.values():
+        keep, drop = rows[0].id, [r.id for r in rows[1:]]
+        conn.execute(orders.update().where(orders.c.user.in_(drop)).values(user=keep))
+        if any(r.role == "admin" for r in rows):
+            conn.execute(users.update().where(users.c.id == keep).values(role="admin"))
+        level = conn.scalar(select(func.max(admins.c.access_level)).where(admins.c.id.in_([keep, *drop])))
+        conn.execute(admins.delete().where(admins.c.id.in_(drop)))
+        if level is not None and conn.scalar(select(admins.c.id).where(admins.c.id == keep)) is None:
+            conn.execute(admins.insert().values(id=keep, access_level=level))
+        conn.execute(users.delete().where(users.c.id.in_(drop)))
+
+    if "ix_users_tg_id" not in index_names(conn, "users"):
+        conn.execute(text("CREATE UNIQUE INDEX ix_users_tg_id ON users (tg_id)"))
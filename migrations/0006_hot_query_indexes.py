@@ -0,0 +1,20 @@
+"""Индексы под горячие запросы: фильтры и keyset-пагинация каталога,
+загрузка CSV по естественному ключу, открытые заказы пользователя и
+подгрузка строк заказов."""
+from sqlalchemy import Connection, text
+
+INDEXES = [
+    "ix_products_category_id ON products (category, id)",
+    "ix_products_category_price_id ON products (category, price, id)",
+    "ix_products_price_id ON products (price, id)",
+    "ix_products_color_id ON products (color, id)",
+    "ix_products_size_id ON products (size, id)",
+    "ix_products_natural_key ON products (title, category, size, color)",
+    'ix_orders_user_completed_id ON orders ("user", completed, id)',
+    "ix_order_products_order_id ON order_products (order_id, id)",
+]
+
+
+def upgrade(conn: Connection) -> None:
+    for index in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index}"))
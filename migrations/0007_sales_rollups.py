@@ -0,0 +1,48 @@
+"""Дневные агрегаты продаж для аналитики (см. analytics.py) с пересчётом по
+уже накопленным заказам."""
+from sqlalchemy import Column, Connection, Date, Index, Integer, MetaData, Numeric, String, Table, text
+
+from migrate import has_table
+
+metadata = MetaData()
+sales_daily = Table(
+    "sales_daily", metadata,
+    Column("day", Date, primary_key=True),
+    Column("product_id", Integer, primary_key=True),
+    Column("city", String(100), primary_key=True),
+    Column("category", String(40), nullable=False),
+    Column("units", Integer, nullable=False),
+    Column("revenue", Numeric(14, 2)),
+    Column("completed_units", Integer, nullable=False),
+    Index("ix_sales_daily_category_day", "category", "day"),
+)
+orders_daily = Table(
+    "orders_daily", metadata,
+    Column("day", Date, primary_key=True),
+    Column("city", String(100), primary_key=True),
+    Column("orders", Integer, nullable=False),
+    Column("revenue", Numeric(14, 2)),
+    Column("completed_orders", Integer, nullable=False),
+    Column("completed_revenue", Numeric(14, 2)),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    if has_table(conn, "orders_daily"):
+        return
+    metadata.create_all(conn)
+    # Тем же SQL, что и analytics.rebuild_rollups, только без pandas: здесь важна
+    # не скорость, а то, чтобы агрегаты сразу сходились с историей заказов
+    conn.execute(text(
+        "INSERT INTO orders_daily (day, city, orders, revenue, completed_orders, completed_revenue) "
+        "SELECT timestamp, city, count(*), sum(order_sum), "
+        "sum(CASE WHEN completed THEN 1 ELSE 0 END), sum(CASE WHEN completed THEN order_sum ELSE 0 END) "
+        "FROM orders GROUP BY timestamp, city"
+    ))
+    conn.execute(text(
+        "INSERT INTO sales_daily (day, product_id, city, category, units, revenue, completed_units) "
+        "SELECT o.timestamp, l.product_id, o.city, max(p.category), sum(l.quantity), sum(p.price * l.quantity), "
+        "sum(CASE WHEN o.completed THEN l.quantity ELSE 0 END) "
+        "FROM order_products l JOIN orders o ON o.id = l.order_id JOIN products p ON p.id = l.product_id "
+        "GROUP BY o.timestamp, l.product_id, o.city"
+    ))
@@ -0,0 +1,23 @@
+"""Полнотекстовый индекс товаров (см. search.py): FTS5-таблица в SQLite,
+GIN-индекс по tsvector в Postgres."""
+from sqlalchemy import Connection, text
+
+from migrate import has_table
+
+
+def upgrade(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_products_search ON products "
+            "USING gin (to_tsvector('simple', title || ' ' || category || ' ' || color))"
+        ))
+        return
+    if has_table(conn, "products_fts"):
+        return
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE products_fts USING fts5("
+        "title, category, color, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    conn.execute(text(
+        "INSERT INTO products_fts (rowid, title, category, color) SELECT id, title, category, color FROM products"
+    ))
@@ -0,0 +1,9 @@
+"""Хэш загруженной картинки товара (см. images.py)."""
+from sqlalchemy import Connection, text
+
+from migrate import column_names
+
+
+def upgrade(conn: Connection) -> None:
+    if "image_hash" not in column_names(conn, "products"):
+        conn.execute(text("ALTER TABLE products ADD COLUMN image_hash VARCHAR(32)"))
@@ -0,0 +1,28 @@
+"""Удержание товара в корзине (см. reservations.py): таблица удержаний и
+счётчик удержанного products.reserved."""
+from sqlalchemy import Column, Connection, DateTime, ForeignKey, Index, Integer, MetaData, Table, text
+
+from migrate import column_names, has_table
+
+
+def upgrade(conn: Connection) -> None:
+    if "reserved" not in column_names(conn, "products"):
+        conn.execute(text("ALTER TABLE products ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0"))
+    if has_table(conn, "reservations"):
+        return
+
+    metadata = MetaData()
+    # Заглушки нужны только для внешних ключей; создаётся одна reservations
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table("products", metadata, Column("id", Integer, primary_key=True))
+    reservations = Table(
+        "reservations", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", ForeignKey("users.id"), nullable=False),
+        Column("product_id", ForeignKey("products.id"), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        Column("expires_at", DateTime, nullable=False),
+        Index("ux_reservations_user_product", "user_id", "product_id", unique=True),
+        Index("ix_reservations_expires_at", "expires_at"),
+    )
+    reservations.create(conn)
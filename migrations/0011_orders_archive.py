@@ -0,0 +1,54 @@
+"""Архив закрытых заказов (см. order_archive.py): orders.completed_at, по
+которому выбираются старые закрытые заказы, и таблицы orders_archive и
+order_products_archive с теми же колонками.
+
+Уже закрытым заказам completed_at ставится по дате заказа — точнее для них
+ничего не известно.
+"""
+from sqlalchemy import (
+    Boolean, Column, Connection, Date, DateTime, ForeignKey, Index, Integer, MetaData, Numeric, String, Table, text,
+)
+
+from migrate import column_names, has_table
+
+
+def upgrade(conn: Connection) -> None:
+    if "completed_at" not in column_names(conn, "orders"):
+        conn.execute(text("ALTER TABLE orders ADD COLUMN completed_at TIMESTAMP"))
+        day = "datetime(timestamp)" if conn.dialect.name == "sqlite" else "CAST(timestamp AS TIMESTAMP)"
+        conn.execute(text(f"UPDATE orders SET completed_at = {day} WHERE completed AND completed_at IS NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_completed_at ON orders (completed_at)"))
+    if has_table(conn, "orders_archive"):
+        return
+
+    metadata = MetaData()
+    # Заглушки нужны только для внешних ключей; создаются две таблицы архива
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table("products", metadata, Column("id", Integer, primary_key=True))
+    orders = Table(
+        "orders_archive", metadata,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("user", ForeignKey("users.id"), nullable=False),
+        Column("timestamp", Date),
+        Column("order_sum", Numeric(10, 2)),
+        Column("completed", Boolean, nullable=False),
+        Column("shipping_address", String(255), nullable=False),
+        Column("city", String(100), nullable=False),
+        Column("payment_method", String(50), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        Column("email", String(128), nullable=False),
+        Column("phone", String(12), nullable=False),
+        Column("notes", String(500)),
+        Column("completed_at", DateTime),
+        Index("ix_orders_archive_user_id", "user", "id"),
+    )
+    lines = Table(
+        "order_products_archive", metadata,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("order_id", ForeignKey("orders_archive.id"), nullable=False),
+        Column("product_id", ForeignKey("products.id"), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        Index("ix_order_products_archive_order_id", "order_id", "id"),
+    )
+    orders.create(conn)
+    lines.create(conn)
@@ -0,0 +1,18 @@
+"""Индексы под очередь заказов для админов (requests.list_orders).
+
+Ключ — (completed, id) или (city, completed, id), что даёт keyset-пагинацию
+по id без сортировки, а остальные фильтры (город, способ оплаты, дата)
+лежат в хвосте индекса: строки, которые им не подходят, отбрасываются по
+индексу, и таблица читается только для строк страницы.
+"""
+from sqlalchemy import Connection, text
+
+INDEXES = [
+    "ix_orders_admin_queue ON orders (completed, id, city, payment_method, timestamp)",
+    "ix_orders_admin_city ON orders (city, completed, id, payment_method, timestamp)",
+]
+
+
+def upgrade(conn: Connection) -> None:
+    for index in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index}"))
@@ -0,0 +1,79 @@
+"""Монотонные id заказов и строк в SQLite: orders и order_products с AUTOINCREMENT.
+
+Без AUTOINCREMENT SQLite выдаёт новой строке max(rowid) + 1 по самой
+таблице, и после переноса последних заказов в архив (order_archive.py)
+новый заказ получал id, который уже есть в orders_archive: следующая
+пачка архива падала на UNIQUE, а история и выгрузка склеивали два заказа.
+Таблицы пересобираются с AUTOINCREMENT, счётчик sqlite_sequence ставится
+выше наибольшего id в живой и архивной таблицах. В Postgres id выдаёт
+последовательность, она и так не возвращается назад.
+"""
+from sqlalchemy import (
+    Boolean, Column, Connection, Date, DateTime, ForeignKey, Integer, MetaData, Numeric, String, Table, text,
+)
+
+# (живая, архивная) — счётчик живой таблицы должен быть выше id обеих
+TABLES = (("orders", "orders_archive"), ("order_products", "order_products_archive"))
+
+
+def _rebuild(conn: Connection, new: Table, name: str, archive: str) -> None:
+    indexes = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"),
+        {"name": name},
+    ).scalars().all()
+    columns = ", ".join(f'"{c.name}"' for c in new.c)
+    new.create(conn)
+    conn.execute(text(f"INSERT INTO {new.name} ({columns}) SELECT {columns} FROM {name} ORDER BY id"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text(f"ALTER TABLE {new.name} RENAME TO {name}"))
+    for sql in indexes:
+        conn.execute(text(sql))
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": name})
+    conn.execute(
+        text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, max("
+            f"(SELECT coalesce(max(id), 0) FROM {name}), (SELECT coalesce(max(id), 0) FROM {archive}))"
+        ),
+        {"name": name},
+    )
+
+
+def upgrade(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    autoincrement = conn.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'orders'"))
+    if "AUTOINCREMENT" in autoincrement.upper():
+        return
+
+    metadata = MetaData()
+    # Заглушки нужны только для внешних ключей; создаются orders_new и order_products_new
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table("products", metadata, Column("id", Integer, primary_key=True))
+    Table("orders", metadata, Column("id", Integer, primary_key=True))
+    orders = Table(
+        "orders_new", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user", ForeignKey("users.id"), nullable=False),
+        Column("timestamp", Date),
+        Column("order_sum", Numeric(10, 2)),
+        Column("completed", Boolean, nullable=False),
+        Column("shipping_address", String(255), nullable=False),
+        Column("city", String(100), nullable=False),
+        Column("payment_method", String(50), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        Column("email", String(128), nullable=False),
+        Column("phone", String(12), nullable=False),
+        Column("notes", String(500)),
+        Column("completed_at", DateTime),
+        sqlite_autoincrement=True,
+    )
+    lines = Table(
+        "order_products_new", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("order_id", ForeignKey("orders.id"), nullable=False),
+        Column("product_id", ForeignKey("products.id"), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        sqlite_autoincrement=True,
+    )
+    for new, (name, archive) in zip((orders, lines), TABLES):
+        _rebuild(conn, new, name, archive)
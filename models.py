@@ -1,12 +1,17 @@
-from sqlalchemy import ForeignKey, String, BigInteger, Numeric, Date, Integer
+from sqlalchemy import ForeignKey, String, BigInteger, Numeric, Date, DateTime, Integer, Index, text
 from sqlalchemy.orm import Mapped, DeclarativeBase, mapped_column, relationship
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker
 from config import settings
+from database import make_engine, make_read_engine
+from migrate import ensure_schema
 from typing import Optional
 from decimal import Decimal
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+engine = make_engine(settings.DATABASE_URL)
+# Только для чтения: реплика или отдельный пул (см. database.py); без маршрутизации — тот же engine
+read_engine = make_read_engine(engine)
 async_session = async_sessionmaker(bind=engine, expire_on_commit=False)
+read_session = async_sessionmaker(bind=read_engine, expire_on_commit=False)
 async def get_async_session() -> async_session:
     async with async_session() as session:
         yield session
@@ -20,7 +25,7 @@ class User(Base):
     __tablename__ = 'users'
     
     id: Mapped[int] = mapped_column(primary_key=True) #уникальный индификатор 
-    tg_id = mapped_column(BigInteger)                 #id по тг
+    tg_id = mapped_column(BigInteger, unique=True, index=True)  #id по тг
     role: Mapped[str] = mapped_column(String(10))
    
 
@@ -35,7 +40,22 @@ class Product(Base):
     color: Mapped[str] = mapped_column(String(40))
     quantity: Mapped[int] = mapped_column(Integer)
     image_url: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Хэш загруженной картинки; файлы миниатюр и их URL — см. images.py
+    image_hash: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
     min_quantity: Mapped[int] = mapped_column(Integer, default=0)
+    # Сколько штук удержано в корзинах (см. reservations.py); продать можно quantity - reserved - min_quantity
+    reserved: Mapped[int] = mapped_column(Integer, default=0, server_default=text("0"))
+
+    # Индексы под фильтры и keyset-пагинацию каталога (см. requests.query_products)
+    __table_args__ = (
+        Index('ix_products_category_id', 'category', 'id'),
+        Index('ix_products_category_price_id', 'category', 'price', 'id'),
+        Index('ix_products_price_id', 'price', 'id'),
+        Index('ix_products_color_id', 'color', 'id'),
+        Index('ix_products_size_id', 'size', 'id'),
+        # Естественный ключ товара для загрузки CSV; в данных есть дубли, поэтому не unique
+        Index('ix_products_natural_key', 'title', 'category', 'size', 'color'),
+    )
 
 class Order(Base):
     __tablename__ = 'orders'
@@ -43,15 +63,31 @@ class Order(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     user: Mapped[int] = mapped_column(ForeignKey('users.id'))
     timestamp = mapped_column(Date)
-    products: Mapped[list[Product]] = relationship("Product", secondary="order_products")
+    # lazy="raise_on_sql": история заказов обязана подгружать связи явно (selectinload), без N+1
+    products: Mapped[list[Product]] = relationship("Product", secondary="order_products", viewonly=True, lazy="raise_on_sql")
+    lines: Mapped[list["OrderProducts"]] = relationship(order_by="OrderProducts.id", viewonly=True, lazy="raise_on_sql")
     order_sum = mapped_column(Numeric(10, 2))
     completed: Mapped[bool] = mapped_column(default=False)
-    shopping_address: Mapped[str] = mapped_column(String(255))
+    # В БД колонка называется shipping_address; имя атрибута сохранено ради API
+    shopping_address: Mapped[str] = mapped_column("shipping_address", String(255))
     city: Mapped[str] = mapped_column(String(100))
     payment_method: Mapped[str] = mapped_column(String(50))
     quantity: Mapped[int] = mapped_column(Integer)
     email: Mapped[str] = mapped_column(String(128))
     phone: Mapped[str] = mapped_column(String(12))
+    notes: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    # Когда заказ закрыли; по нему order_archive уносит старые закрытые заказы в архив
+    completed_at = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_orders_user_completed_id', 'user', 'completed', 'id'),
+        Index('ix_orders_completed_at', 'completed_at'),
+        # Очередь заказов для админов (requests.list_orders): фильтры после id проверяются по индексу
+        Index('ix_orders_admin_queue', 'completed', 'id', 'city', 'payment_method', 'timestamp'),
+        Index('ix_orders_admin_city', 'city', 'completed', 'id', 'payment_method', 'timestamp'),
+        # id не переиспользуются после переноса последних заказов в архив (миграция 0013)
+        {'sqlite_autoincrement': True},
+    )
      
 class OrderProducts(Base):
     __tablename__ = 'order_products'
@@ -60,6 +96,89 @@ class OrderProducts(Base):
     product_id: Mapped[int] = mapped_column(ForeignKey('products.id'))
     quantity: Mapped[int] = mapped_column(Integer)
 
+    __table_args__ = (
+        Index('ix_order_products_order_id', 'order_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+# Архив закрытых заказов (см. order_archive.py): те же колонки и те же id, что в orders/order_products
+class ArchivedOrder(Base):
+    __tablename__ = 'orders_archive'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    user: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    timestamp = mapped_column(Date)
+    order_sum = mapped_column(Numeric(10, 2))
+    completed: Mapped[bool] = mapped_column(default=True)
+    shopping_address: Mapped[str] = mapped_column("shipping_address", String(255))
+    city: Mapped[str] = mapped_column(String(100))
+    payment_method: Mapped[str] = mapped_column(String(50))
+    quantity: Mapped[int] = mapped_column(Integer)
+    email: Mapped[str] = mapped_column(String(128))
+    phone: Mapped[str] = mapped_column(String(12))
+    notes: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    completed_at = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_orders_archive_user_id', 'user', 'id'),
+    )
+
+
+class ArchivedOrderProducts(Base):
+    __tablename__ = 'order_products_archive'
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(ForeignKey('orders_archive.id'))
+    product_id: Mapped[int] = mapped_column(ForeignKey('products.id'))
+    quantity: Mapped[int] = mapped_column(Integer)
+
+    __table_args__ = (
+        Index('ix_order_products_archive_order_id', 'order_id', 'id'),
+    )
+
+
+# Удержание товара в корзине: одно на пару пользователь-товар, истёкшие снимает фоновый sweeper
+class Reservation(Base):
+    __tablename__ = 'reservations'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    product_id: Mapped[int] = mapped_column(ForeignKey('products.id'))
+    quantity: Mapped[int] = mapped_column(Integer)
+    expires_at = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ux_reservations_user_product', 'user_id', 'product_id', unique=True),
+        # Sweeper идёт по этому индексу от самых ранних, не просматривая живые удержания
+        Index('ix_reservations_expires_at', 'expires_at'),
+    )
+
+
+# Дневные агрегаты продаж (см. analytics.py): ключ — первичный, счётчики только накапливаются
+class SalesDaily(Base):
+    __tablename__ = 'sales_daily'
+    day = mapped_column(Date, primary_key=True)
+    product_id: Mapped[int] = mapped_column(primary_key=True)
+    city: Mapped[str] = mapped_column(String(100), primary_key=True)
+    # Категория на момент заказа, чтобы отчёт по категориям не ходил в products
+    category: Mapped[str] = mapped_column(String(40))
+    units: Mapped[int] = mapped_column(Integer, default=0)
+    revenue = mapped_column(Numeric(14, 2), default=0)
+    completed_units: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (
+        Index('ix_sales_daily_category_day', 'category', 'day'),
+    )
+
+
+class OrdersDaily(Base):
+    __tablename__ = 'orders_daily'
+    day = mapped_column(Date, primary_key=True)
+    city: Mapped[str] = mapped_column(String(100), primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, default=0)
+    revenue = mapped_column(Numeric(14, 2), default=0)
+    completed_orders: Mapped[int] = mapped_column(Integer, default=0)
+    completed_revenue = mapped_column(Numeric(14, 2), default=0)
+
     
 class Admin(User):
     __tablename__ = 'admins'
@@ -70,5 +189,5 @@ class Admin(User):
 
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Доводит схему БД до текущей версии миграций (см. migrate.py)"""
+    await ensure_schema(engine)
@@ -0,0 +1,205 @@
+"""Горячие и холодные заказы: старые закрытые заказы уезжают в архив.
+
+Закрытый заказ больше не меняется, но без архива он навсегда остаётся в
+orders/order_products, и вместе с ним растут индексы и кэш таблиц, по
+которым работают оформление и открытые заказы. OrderArchiver раз в
+ORDER_ARCHIVE_INTERVAL секунд переносит заказы, закрытые раньше
+ORDER_ARCHIVE_AFTER_DAYS дней назад, в orders_archive/order_products_archive
+с теми же id. Перенос идёт пачками по ORDER_ARCHIVE_BATCH заказов, каждая
+пачка — своя короткая транзакция (INSERT … SELECT в архив и DELETE из живых
+таблиц), а между пачками пауза, чтобы писатели не ждали блокировку. На
+Postgres воркеры делят заказы через FOR UPDATE SKIP LOCKED.
+Счётчики id живых таблиц в SQLite — AUTOINCREMENT (миграция 0013), иначе
+новый заказ после переноса последних получил бы уже архивный id.
+
+Чтение истории (history_dicts, /api/orders/{tg_id}/history) объединяет живые
+и архивные заказы; выгрузка и пересчёт аналитики тоже читают обе части.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, union_all
+
+from config import settings
+from fast_read import PRODUCT_COLUMNS, product_dict
+from metrics import ARCHIVED_ROWS, ARCHIVE_ROWS_PER_SECOND, LIVE_TABLE_ROWS
+from models import engine, read_engine, ArchivedOrder, ArchivedOrderProducts, Order, OrderProducts, Product
+
+logger = logging.getLogger("botshop.order_archive")
+
+ORDERS = Order.__table__
+LINES = OrderProducts.__table__
+ORDERS_ARCHIVE = ArchivedOrder.__table__
+LINES_ARCHIVE = ArchivedOrderProducts.__table__
+# (живая, архивная) — пары таблиц, которые читаются вместе
+ORDER_TABLES = ((ORDERS, LINES), (ORDERS_ARCHIVE, LINES_ARCHIVE))
+
+ORDER_COLUMN_NAMES = [c.name for c in ORDERS_ARCHIVE.c]
+LINE_COLUMN_NAMES = [c.name for c in LINES_ARCHIVE.c]
+HISTORY_COLUMNS = (
+    "id", "user", "timestamp", "order_sum", "shipping_address", "city",
+    "payment_method", "quantity", "email", "phone", "completed",
+)
+
+
+async def archive_batch(cutoff: datetime, limit: int) -> Tuple[int, int]:
+    """Переносит до limit заказов, закрытых раньше cutoff; возвращает (заказов, строк)"""
+    due = (
+        select(ORDERS.c.id)
+        .where(ORDERS.c.completed_at < cutoff)
+        .order_by(ORDERS.c.completed_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with engine.begin() as conn:
+        # Транзакция начинается с записи: в SQLite чтение перед записью ловит database is locked
+        ids = (await conn.execute(
+            insert(ORDERS_ARCHIVE)
+            .from_select(ORDER_COLUMN_NAMES, select(*(ORDERS.c[name] for name in ORDER_COLUMN_NAMES)).where(ORDERS.c.id.in_(due)))
+            .returning(ORDERS_ARCHIVE.c.id)
+        )).scalars().all()
+        if not ids:
+            return 0, 0
+        lines = await conn.execute(
+            insert(LINES_ARCHIVE)
+            .from_select(LINE_COLUMN_NAMES, select(*(LINES.c[name] for name in LINE_COLUMN_NAMES)).where(LINES.c.order_id.in_(ids)))
+        )
+        await conn.execute(delete(LINES).where(LINES.c.order_id.in_(ids)))
+        await conn.execute(delete(ORDERS).where(ORDERS.c.id.in_(ids)))
+    return len(ids), lines.rowcount
+
+
+async def live_rows() -> Dict[str, int]:
+    async with engine.connect() as conn:
+        return {
+            "orders": await conn.scalar(select(func.count()).select_from(ORDERS)),
+            "order_products": await conn.scalar(select(func.count()).select_from(LINES)),
+        }
+
+
+class OrderArchiver:
+    """Фоновый перенос старых закрытых заказов в архив"""
+
+    def __init__(self, after_days: float, batch: int, pause: float, interval: float):
+        self.after_days = after_days
+        self.batch = batch
+        self.pause = pause
+        self.interval = interval
+        self.orders = 0
+        self.lines = 0
+        self.batches = 0
+        self.last_run: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self, now: Optional[datetime] = None) -> dict:
+        """Один проход: пачки до тех пор, пока есть что переносить"""
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.after_days)
+        before = await live_rows()
+        started = time.perf_counter()
+        orders = lines = 0
+        while True:
+            moved, moved_lines = await archive_batch(cutoff, self.batch)
+            orders += moved
+            lines += moved_lines
+            self.batches += 1
+            ARCHIVED_ROWS.labels("orders").inc(moved)
+            ARCHIVED_ROWS.labels("order_products").inc(moved_lines)
+            if moved < self.batch:
+                break
+            await asyncio.sleep(self.pause)
+        elapsed = time.perf_counter() - started
+        after = await live_rows()
+
+        self.orders += orders
+        self.lines += lines
+        rate = (orders + lines) / elapsed if elapsed else 0.0
+        ARCHIVE_ROWS_PER_SECOND.set(rate)
+        for table in before:
+            LIVE_TABLE_ROWS.labels(table, "before").set(before[table])
+            LIVE_TABLE_ROWS.labels(table, "after").set(after[table])
+        self.last_run = {
+            "cutoff": cutoff, "orders": orders, "lines": lines, "seconds": elapsed,
+            "rows_per_second": rate, "before": before, "after": after,
+        }
+        return self.last_run
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("order archive run failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {"orders": self.orders, "lines": self.lines, "batches": self.batches, "last_run": self.last_run}
+
+
+order_archiver = OrderArchiver(
+    after_days=settings.ORDER_ARCHIVE_AFTER_DAYS,
+    batch=settings.ORDER_ARCHIVE_BATCH,
+    pause=settings.ORDER_ARCHIVE_PAUSE,
+    interval=settings.ORDER_ARCHIVE_INTERVAL,
+)
+
+
+# История заказов
+async def history_dicts(user_id: int, before_id: Optional[int] = None, limit: int = 50) -> List[dict]:
+    """Все заказы пользователя, живые и архивные, от новых к старым; before_id — как в get_orders"""
+    async with read_engine.connect() as conn:
+        rows = []
+        # id общие у живых и архивных заказов, поэтому по limit с каждой стороны и слияние по id
+        for orders, _ in ORDER_TABLES:
+            stmt = (
+                select(*(orders.c[name] for name in HISTORY_COLUMNS))
+                .where(orders.c.user == user_id)
+                .order_by(orders.c.id.desc())
+                .limit(limit)
+            )
+            if before_id is not None:
+                stmt = stmt.where(orders.c.id < before_id)
+            rows += (await conn.execute(stmt)).all()
+        if not rows:
+            return []
+        rows.sort(key=lambda r: r[0], reverse=True)
+        by_id: Dict[int, dict] = {}
+        for o in rows[:limit]:
+            by_id[o[0]] = {
+                "id": o[0], "user": o[1], "timestamp": o[2], "products": [], "lines": [],
+                "order_sum": o[3], "shopping_address": o[4], "city": o[5], "payment_method": o[6],
+                "quantity": o[7], "email": o[8], "phone": o[9], "completed": bool(o[10]),
+            }
+
+        ids = list(by_id)
+        all_lines = union_all(*(
+            select(lines.c.id, lines.c.order_id, lines.c.product_id, lines.c.quantity).where(lines.c.order_id.in_(ids))
+            for _, lines in ORDER_TABLES
+        )).subquery()
+        result = await conn.execute(
+            select(all_lines.c.order_id, all_lines.c.product_id, all_lines.c.quantity, *PRODUCT_COLUMNS)
+            .outerjoin(Product, Product.id == all_lines.c.product_id)
+            .order_by(all_lines.c.order_id, all_lines.c.id)
+        )
+        for line in result:
+            order = by_id[line[0]]
+            order["lines"].append({"product_id": line[1], "quantity": line[2]})
+            if line[3] is not None:
+                order["products"].append(product_dict(line[3:]))
+    return list(by_id.values())
@@ -0,0 +1,135 @@
+"""Выгрузка заказов со строками для админов: NDJSON или CSV потоком.
+
+Запрос orders ⟕ order_products ⟕ products, упорядоченный по заказу,
+читается курсором пачками по EXPORT_FETCH_SIZE строк (на Postgres —
+серверный курсор): сначала по архиву (order_archive.py), затем по живым
+таблицам. Генератор склеивает строки одного заказа и отдаёт текст
+кусками по ~FLUSH_BYTES. В памяти только текущая пачка и текущий кусок,
+поэтому память не зависит от числа заказов, а первые байты уходят клиенту,
+пока запрос ещё читается.
+
+Курсор держит одну транзакцию чтения на всю выгрузку: выгрузка видит
+согласованный снимок. Читает она через read_engine (database.py), чтобы не
+занимать соединение писателя; в SQLite без WAL писатели ждут её окончания.
+"""
+import csv
+import io
+from datetime import date
+from typing import AsyncIterator, List, Optional
+
+import orjson
+from sqlalchemy import select
+
+from config import settings
+from fast_read import json_default
+from models import read_engine, Order, OrderProducts, Product
+from order_archive import ORDER_TABLES, ORDERS_ARCHIVE
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+FLUSH_BYTES = 64 * 1024
+
+ORDER_FIELDS = (
+    "id", "user", "timestamp", "completed", "city", "shipping_address",
+    "payment_method", "order_sum", "quantity", "notes",
+)
+LINE_FIELDS = ("product_id", "title", "category", "price", "quantity")
+CSV_HEADER = [f"order_{f}" if f in ("id", "quantity") else f for f in ORDER_FIELDS] + [
+    "product_id", "title", "category", "price", "line_quantity",
+]
+
+
+def export_query(
+    orders=Order.__table__,
+    lines=OrderProducts.__table__,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+):
+    stmt = (
+        select(
+            orders.c.id, orders.c.user, orders.c.timestamp, orders.c.completed, orders.c.city, orders.c.shipping_address,
+            orders.c.payment_method, orders.c.order_sum, orders.c.quantity, orders.c.notes,
+            lines.c.product_id, Product.title, Product.category, Product.price, lines.c.quantity,
+        )
+        .outerjoin(lines, lines.c.order_id == orders.c.id)
+        .outerjoin(Product, Product.id == lines.c.product_id)
+        .order_by(orders.c.id, lines.c.id)
+    )
+    if date_from is not None:
+        stmt = stmt.where(orders.c.timestamp >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(orders.c.timestamp <= date_to)
+    if completed is not None:
+        stmt = stmt.where(orders.c.completed == completed)
+    if city is not None:
+        stmt = stmt.where(orders.c.city == city)
+    return stmt
+
+
+async def _rows(stmts) -> AsyncIterator[list]:
+    """Пачки строк с курсора запрос за запросом; соединение занято, пока генератор не закрыт"""
+    async with read_engine.connect() as conn:
+        for stmt in stmts:
+            result = await conn.stream(stmt.execution_options(yield_per=settings.EXPORT_FETCH_SIZE))
+            async for partition in result.partitions():
+                yield partition
+
+
+async def _ndjson(stmts) -> AsyncIterator[bytes]:
+    buf: List[bytes] = []
+    size = 0
+    order = None
+    async for partition in _rows(stmts):
+        for row in partition:
+            if order is None or order["id"] != row[0]:
+                if order is not None:
+                    line = orjson.dumps(order, default=json_default) + b"\n"
+                    buf.append(line)
+                    size += len(line)
+                order = dict(zip(ORDER_FIELDS, row[:10]))
+                order["lines"] = []
+            if row[10] is not None:
+                order["lines"].append(dict(zip(LINE_FIELDS, row[10:])))
+        if size >= FLUSH_BYTES:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if order is not None:
+        buf.append(orjson.dumps(order, default=json_default) + b"\n")
+    if buf:
+        yield b"".join(buf)
+
+
+async def _csv(stmts) -> AsyncIterator[bytes]:
+    # Одна строка CSV на строку заказа; поля заказа повторяются
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    # Заголовок сразу: клиент видит начало файла до первой пачки
+    yield out.getvalue().encode()
+    out.seek(0)
+    out.truncate()
+    async for partition in _rows(stmts):
+        writer.writerows(partition)
+        if out.tell() >= FLUSH_BYTES:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+
+def stream_orders(
+    fmt: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    # Архивные заказы все закрыты: с completed=false архив не читаем
+    stmts = [
+        export_query(orders, lines, date_from, date_to, completed, city)
+        for orders, lines in reversed(ORDER_TABLES)
+        if not (orders is ORDERS_ARCHIVE and completed is False)
+    ]
+    return _ndjson(stmts) if fmt == "ndjson" else _csv(stmts)
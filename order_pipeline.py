@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+
+from config import settings
+from models import async_session, Order, OrderProducts
+from schemas import OrderItem
+from stock_feed import stock_changed
+import analytics
+import requests as rq
+import reservations
+
+logger = logging.getLogger("botshop.orders")
+
+
+@dataclass
+class PendingOrder:
+    tg_id: int
+    items: list[OrderItem]
+    shipping_address: str
+    city: str
+    payment_method: str
+    notes: Optional[str]
+    timestamp: Optional[date]
+    future: asyncio.Future = field(repr=False)
+
+
+class OrderIngestor:
+    """Групповая фиксация заказов: очередь, писатель и одна транзакция на микропачку.
+
+    Каждый заказ пачки списывает остатки своим условным UPDATE; отказ одного
+    заказа не мешает остальным, а вызывающий получает свой результат через future.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.orders = 0
+        # None в очереди — метка остановки от stop()
+        self._queue: asyncio.Queue[Optional[PendingOrder]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # Без cancel: писатель дособирает и зафиксирует текущую пачку, дойдёт до метки и выйдет,
+        # иначе отмена посреди _write оставила бы futures пачки без результата
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._stopping = False
+        # Всё, что не успели взять в пачку, дописываем перед выходом
+        while not self._queue.empty():
+            await self._commit_batch(self._drain([]))
+
+    async def submit(
+        self,
+        tg_id: int,
+        items: list[OrderItem],
+        shipping_address: str,
+        city: str,
+        payment_method: str,
+        notes: Optional[str],
+        timestamp: Optional[date],
+    ) -> int:
+        """Ставит заказ в очередь и ждёт фиксации его пачки; возвращает id заказа"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(PendingOrder(
+            tg_id, items, shipping_address, city, payment_method, notes, timestamp, future
+        ))
+        return await future
+
+    def _take(self, batch: list[PendingOrder], pending: Optional[PendingOrder]) -> None:
+        if pending is None:
+            self._stopping = True
+        else:
+            batch.append(pending)
+
+    def _drain(self, batch: list[PendingOrder]) -> list[PendingOrder]:
+        while len(batch) < self.max_batch and not self._stopping and not self._queue.empty():
+            self._take(batch, self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            batch: list[PendingOrder] = []
+            self._take(batch, await self._queue.get())
+            self._drain(batch)
+            deadline = loop.time() + self.max_wait
+            while batch and len(batch) < self.max_batch and not self._stopping:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._take(batch, await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                self._drain(batch)
+            if batch:
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list[PendingOrder]) -> None:
+        try:
+            results = await self._write(batch)
+        except Exception as e:
+            logger.exception("order batch of %d failed", len(batch))
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.orders += len(batch)
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    async def _write(self, batch: list[PendingOrder]) -> list:
+        users = await asyncio.gather(*[rq.add_user(p.tg_id) for p in batch])
+        results: list = [None] * len(batch)
+        accepted: list[tuple[int, dict, dict, list[OrderItem]]] = []
+        quantities: dict[int, int] = {}
+
+        async with async_session() as session:
+            for i, (pending, user) in enumerate(zip(batch, users)):
+                try:
+                    products = await reservations.checkout_stock(session, user.id, pending.items)
+                except HTTPException as e:
+                    results[i] = e
+                    continue
+                # Товары общие для всей пачки в identity map сессии; UPDATE в checkout_stock
+                # обновляет их (populate_existing), так что здесь остаток после этого заказа
+                quantities.update({p.id: p.quantity for p in products.values()})
+                accepted.append((i, rq.order_values(
+                    user.id, products, pending.items, pending.shipping_address,
+                    pending.city, pending.payment_method, pending.notes, pending.timestamp
+                ), products, pending.items))
+
+            if accepted:
+                order_ids = (await session.execute(
+                    insert(Order).returning(Order.id, sort_by_parameter_order=True),
+                    [values for _, values, _, _ in accepted],
+                )).scalars().all()
+                await session.execute(insert(OrderProducts), [
+                    {"order_id": order_id, "product_id": it.id, "quantity": it.quantity}
+                    for order_id, (_, _, _, items) in zip(order_ids, accepted)
+                    for it in items
+                ])
+                await analytics.record_orders(session, [
+                    (values, products, items) for _, values, products, items in accepted
+                ])
+                for order_id, (i, _, _, _) in zip(order_ids, accepted):
+                    results[i] = order_id
+            await session.commit()
+
+        stock_changed(quantities)
+        return results
+
+
+order_ingestor = OrderIngestor(
+    max_batch=settings.ORDER_BATCH_MAX_SIZE,
+    max_wait=settings.ORDER_BATCH_MAX_WAIT_MS / 1000,
+)
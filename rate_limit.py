@@ -0,0 +1,201 @@
+"""Ограничение частоты и приём запросов перед маршрутами, которые ходят в БД.
+
+Два слоя:
+
+  AdmissionMiddleware — общий предел одновременных запросов. Сверх предела
+      запрос сразу получает 503, а не встаёт в очередь к пулу соединений.
+      Чтению (GET) достаётся только часть мест, остальные всегда свободны
+      для записи, так что поток чтений не вытесняет оформление заказов.
+      Потоковая выгрузка заказов места не занимает: она держала бы его до
+      последнего байта, и несколько выгрузок отнимали бы места у каталога.
+      Её ограничивают пул read_engine и лимиты частоты.
+  rate_limit — зависимость приложения: token bucket на tg_id и на IP клиента,
+      отдельные бюджеты для чтения и записи (всё, что не GET: заказы,
+      изменения товаров, /upload-products). Пустое ведро — 429 с Retry-After.
+
+Ведра лежат в LRU ограниченного размера. Пополнение считается лениво при
+обращении, а простоявшие до полного ведра ключи выбрасываются попутно.
+Лимиты свои у каждого воркера.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import orjson
+from fastapi import HTTPException, Request
+
+from config import settings
+from metrics import REJECTED_REQUESTS
+
+# Долгие потоки и раздача файлов в БД не ходят
+EXEMPT_PREFIXES = ("/metrics", "/media/", "/api/stock/stream", "/api/test-cors", "/docs", "/openapi.json")
+# Отдают ответ потоком дольше обычного запроса: лимиты частоты есть, мест в admission не занимают
+UNADMITTED_PREFIXES = ("/admin/orders/export",)
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+# Сколько простоявших ключей выбрасывать за одно обращение
+EVICT_PER_CALL = 2
+
+
+class TokenBuckets:
+    """Token bucket на ключ: rate токенов в секунду, не больше burst"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.rejected = 0
+        # Ведро полно через idle секунд простоя — такой ключ можно забыть без последствий
+        self._idle = burst / rate
+        self._buckets: "OrderedDict[object, list]" = OrderedDict()
+
+    def take(self, key, now: Optional[float] = None) -> float:
+        """Берёт токен; 0 — пропустить, иначе через сколько секунд появится токен"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket[0]) / self.rate
+
+    def _evict(self, now: float) -> None:
+        for _ in range(EVICT_PER_CALL):
+            if not self._buckets:
+                return
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self._idle:
+                break
+            del self._buckets[key]
+        while len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "allowed": self.allowed, "rejected": self.rejected}
+
+
+def _buckets(rate: float) -> TokenBuckets:
+    return TokenBuckets(rate, max(1.0, rate * settings.RATE_LIMIT_BURST_SECONDS), settings.RATE_LIMIT_MAX_KEYS)
+
+
+user_reads = _buckets(settings.RATE_LIMIT_USER_READ)
+user_writes = _buckets(settings.RATE_LIMIT_USER_WRITE)
+ip_reads = _buckets(settings.RATE_LIMIT_IP_READ)
+ip_writes = _buckets(settings.RATE_LIMIT_IP_WRITE)
+
+
+def _exempt(path: str) -> bool:
+    return path == "/" or path.startswith(EXEMPT_PREFIXES)
+
+
+async def _tg_id(request: Request) -> Optional[int]:
+    value = request.path_params.get("tg_id") or request.query_params.get("tg_id")
+    if value is None and request.headers.get("content-type", "").startswith("application/json"):
+        # Тело FastAPI потом возьмёт из кэша Request, второй раз не читается
+        try:
+            body = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            return None
+        value = body.get("tg_id") if isinstance(body, dict) else None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _reject(reason: str, wait: float) -> HTTPException:
+    REJECTED_REQUESTS.labels(reason).inc()
+    return HTTPException(429, "Too many requests", headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+
+async def rate_limit(request: Request) -> None:
+    """Зависимость приложения: token bucket по IP и по tg_id"""
+    if not settings.RATE_LIMIT or _exempt(request.url.path):
+        return
+    read = request.method in READ_METHODS
+    now = time.monotonic()
+    if request.client is not None:
+        wait = (ip_reads if read else ip_writes).take(request.client.host, now)
+        if wait:
+            raise _reject("ip", wait)
+    tg_id = await _tg_id(request)
+    if tg_id is not None:
+        wait = (user_reads if read else user_writes).take(tg_id, now)
+        if wait:
+            raise _reject("user", wait)
+
+
+class Admission:
+    """Счётчики одновременных запросов: не больше max_inflight, из них не больше max_reads на чтение"""
+
+    def __init__(self, max_inflight: int, max_reads: int):
+        self.max_inflight = max_inflight
+        self.max_reads = max_reads
+        self.inflight = 0
+        self.reads = 0
+        self.shed = 0
+
+    def enter(self, read: bool) -> bool:
+        if self.inflight >= self.max_inflight or (read and self.reads >= self.max_reads):
+            self.shed += 1
+            return False
+        self.inflight += 1
+        self.reads += read
+        return True
+
+    def leave(self, read: bool) -> None:
+        self.inflight -= 1
+        self.reads -= read
+
+    def stats(self) -> dict:
+        return {"inflight": self.inflight, "reads": self.reads, "shed": self.shed}
+
+
+admission = Admission(settings.MAX_CONCURRENCY, settings.MAX_READ_CONCURRENCY)
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware: сверх предела admission сразу 503, без очереди"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not settings.RATE_LIMIT or _exempt(scope["path"])
+                or scope["path"].startswith(UNADMITTED_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        read = scope["method"] in READ_METHODS
+        if not admission.enter(read):
+            REJECTED_REQUESTS.labels("busy").inc()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Server busy, retry"}'})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.leave(read)
+
+
+def stats() -> dict:
+    return {
+        "admission": admission.stats(),
+        "user_reads": user_reads.stats(),
+        "user_writes": user_writes.stats(),
+        "ip_reads": ip_reads.stats(),
+        "ip_writes": ip_writes.stats(),
+    }
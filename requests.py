@@ -1,32 +1,125 @@
-from sqlalchemy import select, update
+from sqlalchemy import select, update, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession  
-from models import async_session, User, Order, Product, OrderProducts  
-from datetime import date
+from sqlalchemy.orm import selectinload
+from models import async_session, read_session, Order, Product, OrderProducts  
+from datetime import date, datetime
 from decimal import Decimal
 from typing import List, Optional
-from schemas import ProductOut, OrderOut, UpdateProduct, OrderItem
+from schemas import ProductOut, ProductPage, OrderOut, AdminOrderOut, AdminOrderPage, UpdateProduct, OrderItem, QuantityDelta, BulkQuantityResult
 from fastapi import HTTPException
+from catalog_cache import catalog_cache, RenderedBody
+from catalog_snapshot import catalog_snapshot
+from users import CachedUser, resolve_user
+from stock_feed import stock_changed
+from config import settings
+import analytics
+import fast_read
+import inventory
+import reservations
+import search
+import base64
+import json
 
 
 #Пользователи
-async def add_user(tg_id) -> User:
-    async with async_session() as session:
-        stmt = select(User).where(User.tg_id == tg_id)
-        user = await session.scalar(stmt)
-        if user:
-            return user
-        
-        new_user = User(tg_id=tg_id, role='user')  # Явно указываем обязательные поля
-        session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
-        return new_user
+async def add_user(tg_id) -> CachedUser:
+    return await resolve_user(tg_id)
+
 #Товары
-async def get_all_products() -> List[ProductOut]:
-    async with async_session() as session:
+async def load_all_products() -> List[ProductOut]:
+    if settings.CATALOG_READ_PATH == "core":
+        return await fast_read.load_products()
+    async with read_session() as session:
         result = await session.execute(select(Product))
         products = result.scalars().all()
         return [ProductOut.model_validate(p) for p in products]
+
+async def get_all_products() -> List[ProductOut]:
+    return await catalog_cache.get_all(load_all_products)
+
+async def get_product(product_id: int) -> Optional[ProductOut]:
+    return await catalog_cache.get(product_id, load_all_products)
+
+async def get_all_products_rendered() -> RenderedBody:
+    if catalog_snapshot.enabled:
+        return catalog_snapshot.render_all()
+    return await catalog_cache.render_all(load_all_products)
+
+async def get_product_rendered(product_id: int) -> Optional[RenderedBody]:
+    if catalog_snapshot.enabled:
+        return catalog_snapshot.render_one(product_id)
+    return await catalog_cache.render_one(product_id, load_all_products)
+
+PRODUCT_SORTS = ("id", "price_asc", "price_desc")
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(400, "Invalid cursor")
+    return values
+
+async def query_products(
+    category: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[int] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> ProductPage:
+    """Страница каталога с фильтрами; курсор — значения ключа сортировки последней строки"""
+    if sort not in PRODUCT_SORTS:
+        raise HTTPException(400, f"Unknown sort: {sort}")
+
+    stmt = select(Product)
+    if category is not None:
+        stmt = stmt.where(Product.category == category)
+    if color is not None:
+        stmt = stmt.where(Product.color == color)
+    if size is not None:
+        stmt = stmt.where(Product.size == size)
+    if min_price is not None:
+        stmt = stmt.where(Product.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Product.price <= max_price)
+
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        if sort == "id":
+            if after:
+                stmt = stmt.where(Product.id > int(after[0]))
+            stmt = stmt.order_by(Product.id)
+        elif sort == "price_asc":
+            if after:
+                stmt = stmt.where(tuple_(Product.price, Product.id) > (Decimal(after[0]), int(after[1])))
+            stmt = stmt.order_by(Product.price, Product.id)
+        else:
+            if after:
+                stmt = stmt.where(tuple_(Product.price, Product.id) < (Decimal(after[0]), int(after[1])))
+            stmt = stmt.order_by(Product.price.desc(), Product.id.desc())
+    except (IndexError, ArithmeticError, TypeError, ValueError):
+        raise HTTPException(400, "Invalid cursor")
+
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    async with read_session() as session:
+        rows = (await session.scalars(stmt.limit(limit + 1))).all()
+
+    items = [ProductOut.model_validate(p) for p in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        key = [last.id] if sort == "id" else [str(last.price), last.id]
+        next_cursor = encode_cursor(key)
+    return ProductPage(items=items, next_cursor=next_cursor)
         
 async def create_product(
     title: str,
@@ -46,7 +139,10 @@ async def create_product(
             quantity=quantity
         )
         session.add(new_product)
+        await session.flush()
+        await search.index_products(session, [new_product.id])
         await session.commit()
+    catalog_cache.invalidate()
         
 async def update_product_data(product_data: UpdateProduct):
     async with async_session() as session:
@@ -68,55 +164,180 @@ async def update_product_data(product_data: UpdateProduct):
             .values(**values)
         )
 
-        await session.execute(stmt)
+        updated = (await session.execute(stmt)).rowcount
+        await search.index_products(session, [product_data.id])
         await session.commit()
+    catalog_cache.invalidate()
+    # Остаток тоже мог измениться — подписчики ленты остатков должны узнать о нём
+    if updated:
+        stock_changed({product_data.id: product_data.quantity})
 
 async def update_product_quantity(product_id: int, new_quantity: int):
     async with async_session() as session:
-        product = await session.scalar(select(Product).where(Product.id == product_id))
-        if not product:
-            raise HTTPException(404, "Product not found")
-        product.quantity = new_quantity
+        product = await inventory.set_stock(session, product_id, new_quantity)
         await session.commit()
+    stock_changed({product.id: product.quantity})
         
 async def increase_product_quantity(product_id: int, session: AsyncSession) -> ProductOut:
     """Увеличивает количество товара на 1 и возвращает обновлённый объект"""
-    product = await session.scalar(select(Product).where(Product.id == product_id))
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    product.quantity += 1
+    product = await inventory.adjust_stock(session, product_id, 1)
     await session.commit()
-    await session.refresh(product)  # Обновляем объект из БД
+    stock_changed({product.id: product.quantity})
     return ProductOut.model_validate(product)
 
 
-async def decrease_product_quantity(product_id: int, session: AsyncSession):
-    """Уменьшает количество товара на 1 (но не ниже 1)"""
-    product = await session.scalar(select(Product).where(Product.id == product_id))
-    if not product:
-        raise HTTPException(404, "Product not found")
-    if product.quantity <= product.min_quantity:
-        raise HTTPException(400, f"Cannot decrease below minimum quantity {product.min_quantity}")
-    
-    product.quantity -= 1
+async def decrease_product_quantity(product_id: int, session: AsyncSession) -> Product:
+    """Уменьшает количество товара на 1 (но не ниже min_quantity)"""
+    try:
+        product = await inventory.adjust_stock(session, product_id, -1)
+    except HTTPException as e:
+        await session.rollback()
+        if e.status_code == 400:
+            raise HTTPException(400, "Cannot decrease below minimum quantity")
+        raise
     await session.commit()
+    stock_changed({product.id: product.quantity})
+    return product
+
+async def bulk_update_quantities(updates: list[QuantityDelta], session: AsyncSession) -> BulkQuantityResult:
+    result = await inventory.apply_bulk_deltas(session, updates)
+    if result.applied:
+        await session.commit()
+        stock_changed({r.product_id: r.quantity for r in result.results})
+    return result
 
 #Заказы        
-async def get_orders(user) -> List[OrderOut]:
-    async with async_session() as session:
-        orders = await session.scalars(
-            select(Order).where(Order.user == user, Order.completed == False)
-        )
+async def get_orders(user, before_id: Optional[int] = None, limit: int = 50) -> List[OrderOut]:
+    """Открытые заказы пользователя от новых к старым; before_id — id последнего заказа прошлой страницы"""
+    stmt = (
+        select(Order)
+        .where(Order.user == user, Order.completed == False)
+        .options(selectinload(Order.products), selectinload(Order.lines))
+        .order_by(Order.id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        stmt = stmt.where(Order.id < before_id)
+    async with read_session() as session:
+        orders = await session.scalars(stmt)
         return [OrderOut.model_validate(order) for order in orders]
 
 
 async def update_order(order_id: int) -> None:
+    await complete_orders(ids=[order_id])
+
+
+def _order_filters(
+    stmt,
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    if completed is not None:
+        stmt = stmt.where(Order.completed == completed)
+    if city is not None:
+        stmt = stmt.where(Order.city == city)
+    if payment_method is not None:
+        stmt = stmt.where(Order.payment_method == payment_method)
+    if date_from is not None:
+        stmt = stmt.where(Order.timestamp >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Order.timestamp <= date_to)
+    return stmt
+
+
+ORDER_SORTS = ("id_desc", "id")
+
+async def list_orders(
+    completed: Optional[bool] = None,
+    city: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    sort: str = "id_desc",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> AdminOrderPage:
+    """Очередь заказов для админов с фильтрами; курсор — id последнего заказа страницы"""
+    if sort not in ORDER_SORTS:
+        raise HTTPException(400, f"Unknown sort: {sort}")
+
+    stmt = _order_filters(select(Order), completed, city, payment_method, date_from, date_to)
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        if sort == "id_desc":
+            if after:
+                stmt = stmt.where(Order.id < int(after[0]))
+            stmt = stmt.order_by(Order.id.desc())
+        else:
+            if after:
+                stmt = stmt.where(Order.id > int(after[0]))
+            stmt = stmt.order_by(Order.id)
+    except (IndexError, TypeError, ValueError):
+        raise HTTPException(400, "Invalid cursor")
+
+    async with read_session() as session:
+        rows = (await session.scalars(stmt.limit(limit + 1))).all()
+
+    items = [AdminOrderOut.model_validate(o) for o in rows[:limit]]
+    next_cursor = encode_cursor([items[-1].id]) if len(rows) > limit else None
+    return AdminOrderPage(items=items, next_cursor=next_cursor)
+
+
+async def complete_orders(
+    ids: Optional[List[int]] = None,
+    city: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+) -> List[int]:
+    """Закрывает заказы одним UPDATE: по списку id или до limit самых старых открытых по фильтрам"""
+    # completed == False в условии: повторное закрытие не попадёт в агрегаты второй раз
+    stmt = update(Order).where(Order.completed == False)
+    if ids is not None:
+        stmt = _order_filters(stmt.where(Order.id.in_(ids)), None, city, payment_method, date_from, date_to)
+    else:
+        due = _order_filters(select(Order.id), False, city, payment_method, date_from, date_to).order_by(Order.id)
+        if limit is not None:
+            due = due.limit(limit)
+        stmt = stmt.where(Order.id.in_(due.scalar_subquery()))
     async with async_session() as session:
-        order = await session.scalar(select(Order).where(Order.id == order_id))
-        if order:
-            order.completed = True
-            await session.commit()
+        completed = (await session.execute(
+            stmt.values(completed=True, completed_at=datetime.utcnow())
+            .returning(Order.id, Order.timestamp, Order.city, Order.order_sum)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await analytics.record_completions(session, completed)
+        await session.commit()
+    return sorted(row.id for row in completed)
+
+
+def order_values(
+    user_id: int,
+    products: dict[int, Product],
+    items: list[OrderItem],
+    shipping_address: str,
+    city: str,
+    payment_method: str,
+    notes: str | None,
+    timestamp: date | None,
+) -> dict:
+    """Поля новой строки orders по списанным товарам и позициям заказа"""
+    return {
+        "user": user_id,
+        "timestamp": timestamp or date.today(),
+        "order_sum": sum(products[it.id].price * it.quantity for it in items),
+        "shopping_address": shipping_address,
+        "city": city,
+        "payment_method": payment_method,
+        "quantity": sum(it.quantity for it in items),
+        "email": "",
+        "phone": "",
+        "notes": notes,
+    }
 
 
 async def create_order(
@@ -131,45 +352,18 @@ async def create_order(
 ) -> None:
     user = await add_user(tg_id)
 
-    ids = [it.id for it in items]
-    result = await session.execute(select(Product).where(Product.id.in_(ids)))
-    products = {p.id: p for p in result.scalars().all()}
-
-    for it in items:
-        prod = products.get(it.id)
-        if not prod:
-            raise HTTPException(404, f"Product {it.id} not found")
-        new_quantity = prod.quantity - it.quantity
-        if new_quantity < 0:
-            raise HTTPException(400, f"Not enough stock for {prod.title}. Available: {prod.quantity}")
-            
-        if new_quantity < prod.min_quantity:
-            raise HTTPException(400, 
-                f"Cannot order {it.quantity} items. Would breach minimum stock {prod.min_quantity}. "
-                f"Max available: {prod.quantity - prod.min_quantity}"
-            )
-        
-        prod.quantity = new_quantity
-        session.add(prod)
-        
-
+    # Удержанное в корзине списывается без проверки, остальное — условным UPDATE
+    # сразу по всем позициям: либо списано всё, либо ничего
+    try:
+        products = await reservations.checkout_stock(session, user.id, items)
+    except HTTPException:
+        await session.rollback()
+        raise
 
-    total_sum = sum(products[it.id].price * it.quantity for it in items)
-    total_qty = sum(it.quantity for it in items)
-    order_date = timestamp or date.today()
-
-    new_order = Order(
-        user=user.id,
-        timestamp=order_date,
-        order_sum=total_sum,
-        shipping_address=shipping_address,
-        city=city,
-        payment_method=payment_method,
-        quantity=total_qty,
-        email=user.email or "",
-        phone=user.phone or "",
-        notes=notes
+    values = order_values(
+        user.id, products, items, shipping_address, city, payment_method, notes, timestamp
     )
+    new_order = Order(**values)
     session.add(new_order)
     await session.flush() 
 
@@ -182,4 +376,6 @@ async def create_order(
                 quantity=it.quantity
             )
         )
-    await session.commit() 
+    await analytics.record_orders(session, [(values, products, items)])
+    await session.commit()
+    stock_changed({p.id: p.quantity for p in products.values()})
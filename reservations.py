@@ -0,0 +1,270 @@
+"""Удержание товара в корзине на время оформления заказа.
+
+Удержание — строка reservations (одна на пару пользователь-товар) плюс
+счётчик products.reserved. Удерживается условным UPDATE того же вида, что в
+inventory: reserved растёт, только если quantity - reserved - min_quantity
+хватает. Заказ (requests.create_order, order_pipeline) сначала забирает живые
+удержания пользователя по своим товарам и списывает их без проверки остатка,
+а условный UPDATE делает только для непокрытой части. Так оформление не
+проваливается в последний момент.
+
+Все операции идут по индексам: (user_id, product_id) для удержания и заказа,
+expires_at для ReservationSweeper, который снимает истёкшие пачками от самых
+ранних и спит до следующего срока.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import async_session, Product, Reservation
+from schemas import OrderItem, ReservationOut
+import inventory
+
+logger = logging.getLogger("botshop.reservations")
+
+
+def _release_update(released: Dict[int, int]):
+    """UPDATE products SET reserved = reserved - n по товарам"""
+    return (
+        update(Product)
+        .where(Product.id.in_(released))
+        .values(reserved=Product.reserved - case(released, value=Product.id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _release(session: AsyncSession, released: Dict[int, int]) -> None:
+    items = list(released.items())
+    for start in range(0, len(items), inventory.CHUNK_SIZE):
+        await session.execute(_release_update(dict(items[start:start + inventory.CHUNK_SIZE])))
+
+
+async def hold(user_id: int, product_id: int, quantity: int, ttl: Optional[float] = None) -> ReservationOut:
+    """Задаёт удержание пользователя по товару: quantity штук на ttl секунд; 0 — снять"""
+    if quantity < 0:
+        raise HTTPException(400, "Quantity must not be negative")
+    ttl = settings.RESERVATION_TTL if ttl is None else ttl
+    if not 0 < ttl <= settings.RESERVATION_MAX_TTL:
+        raise HTTPException(400, f"TTL must be within (0, {settings.RESERVATION_MAX_TTL:g}] seconds")
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+
+    async with async_session() as session:
+        # Начинаем с записи: SQLite не даст поднять читающую транзакцию до пишущей,
+        # пока пишет sweeper. Старое удержание удаляется и при нужде вставляется заново
+        previous = await session.scalar(
+            delete(Reservation)
+            .where(Reservation.user_id == user_id, Reservation.product_id == product_id)
+            .returning(Reservation.quantity)
+        )
+        # Истёкшее, но ещё не снятое удержание всё ещё сидит в reserved — считаем от него
+        delta = quantity - (previous or 0)
+
+        if delta > 0:
+            held = await session.scalar(
+                update(Product)
+                .where(
+                    Product.id == product_id,
+                    Product.quantity - Product.reserved - delta >= func.coalesce(Product.min_quantity, 0),
+                )
+                .values(reserved=Product.reserved + delta)
+                .returning(Product.id)
+                .execution_options(synchronize_session=False)
+            )
+            if held is None:
+                raise await _hold_failure(session, product_id, quantity)
+        elif delta < 0:
+            await session.execute(_release_update({product_id: -delta}))
+
+        if quantity:
+            await session.execute(insert(Reservation).values(
+                user_id=user_id, product_id=product_id, quantity=quantity, expires_at=expires_at
+            ))
+        await session.commit()
+
+    if quantity:
+        reservation_sweeper.schedule(expires_at)
+    return ReservationOut(product_id=product_id, quantity=quantity, expires_at=expires_at)
+
+
+async def _hold_failure(session: AsyncSession, product_id: int, wanted: int) -> HTTPException:
+    prod = (await session.execute(
+        select(Product.quantity, Product.reserved, Product.min_quantity).where(Product.id == product_id)
+    )).first()
+    if prod is None:
+        return HTTPException(404, "Product not found")
+    available = prod.quantity - prod.reserved - (prod.min_quantity or 0)
+    return HTTPException(409, f"Cannot hold {wanted} items. Available: {available}")
+
+
+async def user_reservations(user_id: int) -> List[ReservationOut]:
+    async with async_session() as session:
+        rows = await session.execute(
+            select(Reservation.product_id, Reservation.quantity, Reservation.expires_at)
+            .where(Reservation.user_id == user_id, Reservation.expires_at > datetime.utcnow())
+            .order_by(Reservation.product_id)
+        )
+        return [ReservationOut.model_validate(r) for r in rows]
+
+
+async def checkout_stock(session: AsyncSession, user_id: int, items: list[OrderItem]) -> Dict[int, Product]:
+    """Списывает остатки под заказ: удержанное — без проверки, остальное — inventory.reserve_stock.
+
+    Транзакцию не фиксирует. При отказе по остаткам удержания возвращаются на
+    место в той же транзакции, как и в inventory.apply_deltas.
+    """
+    wanted: Dict[int, int] = defaultdict(int)
+    for it in items:
+        if it.quantity <= 0:
+            raise HTTPException(400, f"Invalid quantity for product {it.id}")
+        wanted[it.id] += it.quantity
+
+    taken = (await session.execute(
+        delete(Reservation)
+        .where(
+            Reservation.user_id == user_id,
+            Reservation.product_id.in_(list(wanted)),
+            Reservation.expires_at > datetime.utcnow(),
+        )
+        .returning(Reservation.product_id, Reservation.quantity, Reservation.expires_at)
+    )).all()
+    held = {row.product_id: row.quantity for row in taken}
+
+    rest = [
+        OrderItem(id=pid, quantity=qty - held.get(pid, 0))
+        for pid, qty in wanted.items() if qty > held.get(pid, 0)
+    ]
+    products: Dict[int, Product] = {}
+    if rest:
+        try:
+            products = await inventory.reserve_stock(session, rest)
+        except HTTPException:
+            # create_order после отказа откатывает транзакцию, но order_pipeline продолжает в ней
+            # остальные заказы пачки — там без возврата удержания пропали бы при коммите
+            if taken:
+                await session.execute(insert(Reservation), [
+                    {"user_id": user_id, "product_id": r.product_id, "quantity": r.quantity, "expires_at": r.expires_at}
+                    for r in taken
+                ])
+            raise
+
+    if held:
+        # Удержание больше заказа — лишнее просто отпускается вместе с остальным
+        used = {pid: min(qty, wanted[pid]) for pid, qty in held.items()}
+        result = await session.execute(
+            update(Product)
+            .where(Product.id.in_(held))
+            .values(
+                quantity=Product.quantity - case(used, value=Product.id),
+                reserved=Product.reserved - case(held, value=Product.id),
+            )
+            .returning(Product)
+            # reserve_stock мог уже загрузить этот товар (часть из удержания, часть из остатка)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        products.update({p.id: p for p in result.scalars()})
+    return products
+
+
+class ReservationSweeper:
+    """Фоновое снятие истёкших удержаний.
+
+    Ближайший срок берётся из индекса по expires_at, и до него задача спит
+    (но не дольше interval — удержания других воркеров сюда не сообщают).
+    hold() будит её, если новый срок раньше запланированного. Истёкшие
+    снимаются пачками по batch строк, каждая в своей короткой транзакции.
+    """
+
+    def __init__(self, batch: int, interval: float):
+        self.batch = batch
+        self.interval = interval
+        self.released = 0
+        self.sweeps = 0
+        self._wake_at: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def schedule(self, expires_at: datetime) -> None:
+        if self._task is not None and (self._wake_at is None or expires_at < self._wake_at):
+            self._wakeup.set()
+
+    async def sweep(self) -> int:
+        """Снимает до batch истёкших удержаний; возвращает, сколько снято"""
+        now = datetime.utcnow()
+        due = (
+            select(Reservation.id)
+            .where(Reservation.expires_at <= now)
+            .order_by(Reservation.expires_at)
+            .limit(self.batch)
+        )
+        async with async_session() as session:
+            rows = (await session.execute(
+                delete(Reservation)
+                .where(Reservation.id.in_(due.scalar_subquery()))
+                .returning(Reservation.product_id, Reservation.quantity)
+            )).all()
+            released: Dict[int, int] = defaultdict(int)
+            for row in rows:
+                released[row.product_id] += row.quantity
+            if released:
+                await _release(session, released)
+            await session.commit()
+        self.sweeps += 1
+        self.released += len(rows)
+        return len(rows)
+
+    async def _next_expiry(self) -> Optional[datetime]:
+        async with async_session() as session:
+            return await session.scalar(select(func.min(Reservation.expires_at)))
+
+    async def _run(self) -> None:
+        while True:
+            # Сбрасываем до чтения сроков: schedule() во время sweep не потеряется
+            self._wakeup.clear()
+            try:
+                if await self.sweep() == self.batch:
+                    # Истёкших больше пачки — уступаем циклу и берём следующую
+                    await asyncio.sleep(0)
+                    continue
+                next_at = await self._next_expiry()
+            except Exception:
+                logger.exception("reservation sweep failed")
+                next_at = None
+
+            now = datetime.utcnow()
+            self._wake_at = now + timedelta(seconds=self.interval)
+            if next_at is not None and next_at < self._wake_at:
+                self._wake_at = next_at
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, (self._wake_at - now).total_seconds()))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {"sweeps": self.sweeps, "released": self.released, "next_wake": self._wake_at}
+
+
+reservation_sweeper = ReservationSweeper(
+    batch=settings.RESERVATION_SWEEP_BATCH,
+    interval=settings.RESERVATION_SWEEP_INTERVAL,
+)
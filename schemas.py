@@ -1,8 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, Field, computed_field
+from typing import Dict, Optional, List
+from datetime import date, datetime
 from decimal import Decimal
 from pydantic import BaseModel, ConfigDict
+from images import image_urls
 
 class BaseModelWithConfig(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -37,6 +38,27 @@ class CompleteOrder(BaseModel):
 
 class CompleteProduct(BaseModel):
     id: int
+    quantity: int
+    tg_id: int
+
+class QuantityDelta(BaseModel):
+    product_id: int
+    change: int
+
+class QuantityResult(BaseModel):
+    product_id: int
+    quantity: int
+
+class QuantityRejection(BaseModel):
+    product_id: int
+    reason: str
+    quantity: Optional[int] = None
+    min_quantity: Optional[int] = None
+
+class BulkQuantityResult(BaseModel):
+    applied: bool
+    results: List[QuantityResult] = []
+    rejections: List[QuantityRejection] = []
 
 class UpdateProduct(BaseModel):
     id: int
@@ -60,14 +82,72 @@ class ProductOut(BaseModel):
     color: str
     quantity: int
     image_url: Optional[str] = None
+    image_hash: Optional[str] = Field(None, exclude=True)
+    class Config:
+        from_attributes = True
+
+    @computed_field
+    @property
+    def images(self) -> Optional[Dict[str, str]]:
+        """URL миниатюр по размерам (thumb, card, full), если картинка загружена"""
+        return image_urls(self.image_hash) if self.image_hash else None
+
+class HoldProduct(BaseModel):
+    tg_id: int
+    product_id: int
+    quantity: int
+    ttl: Optional[float] = None
+
+class ReservationOut(BaseModel):
+    product_id: int
+    quantity: int
+    expires_at: datetime
+    class Config:
+        from_attributes = True
+
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+class OrderLineOut(BaseModel):
+    product_id: int
+    quantity: int
     class Config:
         from_attributes = True
 
+class DailySales(BaseModel):
+    day: date
+    orders: int
+    revenue: Decimal
+    completed_orders: int
+    completed_revenue: Decimal
+
+class ProductSales(BaseModel):
+    product_id: int
+    category: str
+    units: int
+    revenue: Decimal
+    completed_units: int
+
+class CategorySales(BaseModel):
+    category: str
+    units: int
+    revenue: Decimal
+    completed_units: int
+
+class CitySales(BaseModel):
+    city: str
+    orders: int
+    revenue: Decimal
+    completed_orders: int
+    completed_revenue: Decimal
+
 class OrderOut(BaseModel):
     id: int
     user: int
     timestamp: date
     products: List[ProductOut]
+    lines: List[OrderLineOut] = []
     order_sum: Decimal
     shopping_address: str
     city: str
@@ -77,6 +157,57 @@ class OrderOut(BaseModel):
     phone: str
     class Config:
         from_attributes = True
+
+class OrderHistoryOut(OrderOut):
+    completed: bool
+
+class AdminOrderOut(BaseModel):
+    id: int
+    user: int
+    timestamp: date
+    completed: bool
+    completed_at: Optional[datetime] = None
+    order_sum: Decimal
+    quantity: int
+    city: str
+    payment_method: str
+    shopping_address: str
+    notes: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class AdminOrderPage(BaseModel):
+    items: List[AdminOrderOut]
+    next_cursor: Optional[str] = None
+
+class CompleteOrders(BaseModel):
+    """Закрыть заказы по списку id или открытые заказы по фильтрам, не больше limit самых старых"""
+    ids: Optional[List[int]] = Field(None, max_length=5000)
+    city: Optional[str] = None
+    payment_method: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    limit: int = Field(500, ge=1, le=5000)
+
+class CompletedOrders(BaseModel):
+    completed: List[int]
+
+class UserOut(BaseModel):
+    id: int
+    tg_id: int
+    role: str
+
+class BootstrapVersions(BaseModel):
+    catalog: str
+    orders: str
+
+class BootstrapOut(BaseModel):
+    """Стартовые данные мини-приложения; часть, чья версия совпала с присланной клиентом, — null"""
+    user: UserOut
+    isAdmin: bool
+    versions: BootstrapVersions
+    catalog: Optional[List[ProductOut]] = None
+    orders: Optional[List[OrderOut]] = None
         
 
    
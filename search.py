@@ -0,0 +1,166 @@
+"""Полнотекстовый поиск по товарам: FTS5 в SQLite, tsvector + GIN в Postgres.
+
+Индекс создаёт миграция 0008_products_search (префиксы до 8 символов — 0014).
+Таблица SQLite (products_fts) обновляется явно в тех же транзакциях, что и
+запись товаров: create_product, update_product_data и загрузка CSV вызывают
+index_products. В Postgres индекс по выражению ведёт сама БД.
+
+Ранжирование в SQLite точное: bm25 по всем совпадениям. Поэтому запрос
+стоит не меньше прохода по спискам документов его терминов — bm25 считает,
+в скольких товарах встречается каждый. Запрос, у которого все термины
+встречаются в большой доле каталога, в однозначные миллисекунды на 1M товаров
+не укладывается: на синтетическом каталоге bench.search p50 ~55 мс для
+"bla product 37" (product есть в каждом названии) и ~70 мс для цвета с
+категорией, а узкие запросы — меньше миллисекунды. Быстрее — только
+приблизительно (ранжировать первые N совпадений) или своей функцией ранга
+на C; ни то ни другое здесь не сделано.
+
+Пересборка индекса по уже существующим данным:
+
+    python search.py rebuild
+"""
+import asyncio
+import re
+import sys
+from decimal import Decimal
+from typing import Iterable, List, Optional, Union
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from models import engine, init_db, read_session, Product
+from schemas import ProductOut
+
+Executor = Union[AsyncSession, AsyncConnection]
+
+products_fts = table("products_fts", column("rowid"), column("title"), column("category"), column("color"))
+
+_PG_DOCUMENT = "to_tsvector('simple', title || ' ' || category || ' ' || color)"
+# Пачка id для DELETE/INSERT ... WHERE id IN (...)
+INDEX_CHUNK_SIZE = 500
+
+
+def _is_sqlite() -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+async def index_products(executor: Executor, product_ids: Iterable[int]) -> None:
+    """Переиндексирует товары по id; вызывать в транзакции, которая их записала"""
+    if not _is_sqlite():
+        return
+    ids = list(product_ids)
+    for start in range(0, len(ids), INDEX_CHUNK_SIZE):
+        chunk = ids[start:start + INDEX_CHUNK_SIZE]
+        await executor.execute(products_fts.delete().where(products_fts.c.rowid.in_(chunk)))
+        await executor.execute(
+            products_fts.insert().from_select(
+                ["rowid", "title", "category", "color"],
+                select(Product.id, Product.title, Product.category, Product.color).where(Product.id.in_(chunk)),
+            )
+        )
+
+
+async def rebuild_search_index(conn: AsyncConnection) -> None:
+    if not _is_sqlite():
+        await conn.execute(text("REINDEX INDEX ix_products_search"))
+        return
+    await conn.execute(products_fts.delete())
+    await conn.execute(
+        products_fts.insert().from_select(
+            ["rowid", "title", "category", "color"],
+            select(Product.id, Product.title, Product.category, Product.color),
+        )
+    )
+    # Сливает сегменты индекса в один: после полной перезаливки их десятки, и каждый
+    # запрос обходил бы все (на 1M товаров — в 2-2.5 раза медленнее)
+    await conn.execute(text("INSERT INTO products_fts (products_fts) VALUES ('optimize')"))
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _sqlite_search(
+    terms: List[str],
+    category: Optional[str],
+    min_price: Optional[Decimal],
+    max_price: Optional[Decimal],
+    limit: int,
+):
+    # CROSS JOIN фиксирует порядок: сначала FTS, потом товары по первичному ключу,
+    # иначе планировщик уходит в индекс по категории и проверяет MATCH построчно.
+    # bm25 считается по всем совпадениям, ORDER BY ... LIMIT держит только лучшие limit.
+    match = " ".join(f'"{t}"*' for t in terms)
+    where = ["products_fts MATCH :match"]
+    params = {"limit": limit}
+    if category is not None:
+        # Категория и в MATCH: bm25 считается только по товарам этой категории, а не по всем
+        # совпадениям текста; точное сравнение — по products
+        if _terms(category):
+            match += ' AND category : "' + category.replace('"', '""') + '"'
+        where.append("p.category = :category")
+        params["category"] = category
+    params["match"] = match
+    if min_price is not None:
+        where.append("p.price >= :min_price")
+        params["min_price"] = float(min_price)
+    if max_price is not None:
+        where.append("p.price <= :max_price")
+        params["max_price"] = float(max_price)
+    sql = text(
+        "SELECT p.*"
+        " FROM products_fts AS f CROSS JOIN products AS p ON p.id = f.rowid"
+        f" WHERE {' AND '.join(where)}"
+        " ORDER BY f.rank LIMIT :limit"
+    ).bindparams(**params)
+    return select(Product).from_statement(sql)
+
+
+async def search_products(
+    query: str,
+    category: Optional[str] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    limit: int = 20,
+) -> List[ProductOut]:
+    """Поиск по названию, категории и цвету с префиксным совпадением и ранжированием"""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if _is_sqlite():
+        stmt = _sqlite_search(terms, category, min_price, max_price, limit)
+    else:
+        document = literal_column(_PG_DOCUMENT)
+        tsquery = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in terms))
+        stmt = (
+            select(Product)
+            .where(document.op("@@")(tsquery))
+            .order_by(func.ts_rank(document, tsquery).desc())
+            .limit(limit)
+        )
+        if category is not None:
+            stmt = stmt.where(Product.category == category)
+        if min_price is not None:
+            stmt = stmt.where(Product.price >= min_price)
+        if max_price is not None:
+            stmt = stmt.where(Product.price <= max_price)
+
+    async with read_session() as session:
+        rows = await session.scalars(stmt)
+        return [ProductOut.model_validate(p) for p in rows]
+
+
+async def _main(argv: List[str]) -> None:
+    if argv[1:] != ["rebuild"]:
+        print("usage: python search.py rebuild")
+        sys.exit(2)
+    await init_db()
+    async with engine.begin() as conn:
+        await rebuild_search_index(conn)
+    await engine.dispose()
+    print("search index rebuilt")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,313 @@
+"""Лента изменений остатков для клиентов (Server-Sent Events).
+
+Каждое изменение количества после коммита публикуется одним событием
+{"rev": N, "q": [[product_id, quantity], ...]} с возрастающей ревизией.
+События лежат в общем кольцевом буфере; клиент держит только курсор в нём,
+поэтому публикация не зависит от числа подключений, а медленный клиент
+тормозит лишь сам себя. Отставший дальше буфера или переподключившийся со
+слишком старой ревизией получает событие reset и перечитывает каталог.
+
+Несколько воркеров uvicorn: при заданном STOCK_FEED_DIR каждый воркер слушает
+свой unix datagram-сокет в этом каталоге и рассылает события остальным.
+Ревизию выдаёт общий счётчик в файле под flock; рассылка идёт под той же
+блокировкой, так что все воркеры видят события в одном порядке и клиент
+может продолжить с Last-Event-ID на любом из них. flock берётся без
+ожидания: если его держит другой воркер, событие встаёт в очередь воркера,
+и фоновая задача повторяет попытку короткими снами, не блокируя event loop.
+"""
+import asyncio
+import errno
+import fcntl
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+
+from catalog_cache import catalog_cache
+from config import settings
+
+logger = logging.getLogger("botshop.stock_feed")
+
+# Больше товаров в одном событии — несколько событий (держим датаграмму в пределах ~30 КБ)
+MAX_EVENT_ITEMS = 1000
+RESET_EVENT = b"event: reset\ndata: {}\n\n"
+# Ждём чужую публикацию короткими снами, не блокируя event loop на flock
+LOCK_RETRY = 0.001
+
+
+class _Channel:
+    """Unix datagram-сокеты воркеров в общем каталоге и файл-счётчик ревизий"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.sock: Optional[socket.socket] = None
+        self._counter_fd: Optional[int] = None
+
+    def open(self) -> socket.socket:
+        os.makedirs(self.directory, exist_ok=True)
+        self._counter_fd = os.open(os.path.join(self.directory, "revision"), os.O_RDWR | os.O_CREAT, 0o600)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        return self.sock
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._counter_fd is not None:
+            os.close(self._counter_fd)
+            self._counter_fd = None
+
+    def lock(self, wait: bool = False) -> bool:
+        """Берёт блокировку счётчика; без wait — False, если её держит другой воркер"""
+        try:
+            fcntl.flock(self._counter_fd, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def unlock(self) -> None:
+        fcntl.flock(self._counter_fd, fcntl.LOCK_UN)
+
+    def current_revision(self) -> int:
+        raw = os.pread(self._counter_fd, 8, 0)
+        return struct.unpack("<Q", raw)[0] if len(raw) == 8 else 0
+
+    def next_revision(self) -> int:
+        """Вызывать под lock()"""
+        revision = self.current_revision() + 1
+        os.pwrite(self._counter_fd, struct.pack("<Q", revision), 0)
+        return revision
+
+    def receive(self) -> list[bytes]:
+        messages = []
+        while True:
+            try:
+                messages.append(self.sock.recv(65536))
+            except BlockingIOError:
+                return messages
+
+    def send(self, message: bytes) -> None:
+        for name in os.listdir(self.directory):
+            if not name.endswith(".sock"):
+                continue
+            path = os.path.join(self.directory, name)
+            if path == self.path:
+                continue
+            try:
+                self.sock.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет остался от упавшего воркера — никто его не слушает
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.ENOBUFS):
+                    raise
+                logger.warning("stock feed: worker %s is not reading, event %s dropped", name, message[:40])
+
+
+class StockFeed:
+    def __init__(self, buffer: int, heartbeat: float, channel_dir: Optional[str] = None):
+        self.heartbeat = heartbeat
+        self.clients = 0
+        self.published = 0
+        self.resets = 0
+        # (ревизия, готовый SSE-кадр); _total — сколько событий добавлено за всё время
+        self._log: deque[tuple[int, bytes]] = deque(maxlen=buffer)
+        self._total = 0
+        self._revision = 0
+        self._changed = asyncio.Event()
+        self._closed = False
+        self._ticks = 0
+        self._heartbeat_timer: Optional[asyncio.TimerHandle] = None
+        self._channel = _Channel(channel_dir) if channel_dir else None
+        # События, которые ждут блокировку счётчика, и задача, которая их публикует
+        self._queued: deque[list] = deque()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._closed = False
+        if self._heartbeat_timer is None:
+            self._heartbeat_timer = asyncio.get_running_loop().call_later(self.heartbeat, self._tick)
+        if self._channel is not None and self._channel.sock is None:
+            sock = self._channel.open()
+            # Клиент с текущей ревизией не должен получить reset только потому, что воркер новый
+            self._revision = self._channel.current_revision()
+            asyncio.get_running_loop().add_reader(sock.fileno(), self._receive)
+
+    def close(self) -> None:
+        """Останавливает приём и завершает открытые потоки клиентов"""
+        self._closed = True
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+        self._notify()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._channel is not None and self._channel.sock is not None:
+            # При остановке можно и подождать блокировку: иначе ждущие события пропали бы
+            while self._queued:
+                self._send_locked(self._queued.popleft(), wait=True)
+            asyncio.get_running_loop().remove_reader(self._channel.sock.fileno())
+            self._channel.close()
+
+    def publish(self, quantities: Dict[int, int]) -> None:
+        """Публикует новые остатки; вызывать после коммита"""
+        items = [[pid, qty] for pid, qty in quantities.items()]
+        for start in range(0, len(items), MAX_EVENT_ITEMS):
+            self._publish_one(items[start:start + MAX_EVENT_ITEMS])
+
+    def _publish_one(self, items: list) -> None:
+        if self._channel is None or self._channel.sock is None:
+            self._revision += 1
+            self._append(self._revision, items)
+            self._notify()
+            return
+        # Пока очередь не пуста, новые события встают за ней, чтобы не обогнать более ранние
+        if not self._queued and self._send_locked(items):
+            return
+        self._queued.append(items)
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush())
+
+    def _send_locked(self, items: list, wait: bool = False) -> bool:
+        """Публикует событие под блокировкой счётчика; False — блокировка занята"""
+        channel = self._channel
+        if not channel.lock(wait):
+            return False
+        try:
+            # Всё, что разослали до нас, уже лежит в нашем сокете — забираем, чтобы не нарушить порядок
+            self._receive_pending()
+            revision = channel.next_revision()
+            frame = self._append(revision, items)
+            channel.send(frame)
+        finally:
+            channel.unlock()
+        self._notify()
+        return True
+
+    async def _flush(self) -> None:
+        try:
+            while self._queued:
+                if self._send_locked(self._queued[0]):
+                    self._queued.popleft()
+                else:
+                    await asyncio.sleep(LOCK_RETRY)
+        finally:
+            self._flusher = None
+
+    def _append(self, revision: int, items: list) -> bytes:
+        payload = json.dumps({"rev": revision, "q": items}, separators=(",", ":"))
+        frame = f"id: {revision}\ndata: {payload}\n\n".encode()
+        self._log.append((revision, frame))
+        self._total += 1
+        self._revision = revision
+        self.published += 1
+        return frame
+
+    def _receive_pending(self) -> bool:
+        received = False
+        for frame in self._channel.receive():
+            revision = int(frame[4:frame.index(b"\n")])
+            self._log.append((revision, frame))
+            self._total += 1
+            self._revision = max(self._revision, revision)
+            received = True
+        return received
+
+    def _receive(self) -> None:
+        if self._receive_pending():
+            self._notify()
+
+    def _tick(self) -> None:
+        # Один таймер на всех клиентов вместо wait_for с таймаутом в каждом потоке
+        self._ticks += 1
+        self._notify()
+        self._heartbeat_timer = asyncio.get_running_loop().call_later(self.heartbeat, self._tick)
+
+    def _notify(self) -> None:
+        # Будим всех ждущих разом и заводим новое событие для следующего ожидания
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _resume_position(self, since: Optional[int]) -> Optional[int]:
+        """Позиция в журнале сразу после ревизии since; None — если промежуток уже вытеснен"""
+        if since is None or since == self._revision:
+            return self._total
+        if since > self._revision or not self._log or self._log[0][0] > since + 1:
+            return None
+        first = self._total - len(self._log)
+        for offset in range(len(self._log) - 1, -1, -1):
+            if self._log[offset][0] <= since:
+                return first + offset + 1
+        return first
+
+    async def stream(self, since: Optional[int] = None) -> AsyncIterator[bytes]:
+        self.clients += 1
+        try:
+            yield b"retry: 3000\n\n"
+            cursor = self._resume_position(since)
+            if cursor is None:
+                self.resets += 1
+                yield RESET_EVENT
+                cursor = self._total
+
+            while not self._closed:
+                if cursor < self._total:
+                    first = self._total - len(self._log)
+                    if cursor < first:
+                        # Клиент отстал дальше буфера: догонять нечем, пусть перечитает каталог
+                        self.resets += 1
+                        cursor = self._total
+                        yield RESET_EVENT
+                        continue
+                    batch = b"".join(frame for _, frame in itertools.islice(self._log, cursor - first, None))
+                    cursor = self._total
+                    yield batch
+                    continue
+                ticks = self._ticks
+                await self._changed.wait()
+                if self._ticks != ticks and cursor == self._total:
+                    yield b": ping\n\n"
+        finally:
+            self.clients -= 1
+
+    def stats(self) -> dict:
+        return {
+            "revision": self._revision,
+            "clients": self.clients,
+            "published": self.published,
+            "buffered": len(self._log),
+            "queued": len(self._queued),
+            "resets": self.resets,
+        }
+
+
+stock_feed = StockFeed(
+    buffer=settings.STOCK_FEED_BUFFER,
+    heartbeat=settings.STOCK_FEED_HEARTBEAT,
+    channel_dir=settings.STOCK_FEED_DIR,
+)
+
+
+def stock_changed(quantities: Dict[int, int]) -> None:
+    """Новые остатки после коммита: патчит кэш каталога и публикует событие в ленту"""
+    if not quantities:
+        return
+    catalog_cache.patch_quantities(quantities)
+    stock_feed.publish(quantities)
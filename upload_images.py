@@ -0,0 +1,21 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+
+from catalog_cache import catalog_cache
+import images
+import requests as rq
+
+router = APIRouter()
+
+
+@router.post("/upload-products/{product_id}/image")
+async def upload_product_image(product_id: int, tg_id: int = Form(...), file: UploadFile = File(...)):
+    """Загружает картинку товара: миниатюры нарежутся в пуле, товар получит image_hash"""
+    user = await rq.add_user(tg_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden: Admins only")
+
+    data = await file.read(images.MAX_UPLOAD_BYTES + 1)
+    image_hash = await images.store_image(data)
+    await images.set_product_image(product_id, image_hash)
+    catalog_cache.invalidate()
+    return {"imageHash": image_hash, "images": images.image_urls(image_hash)}
@@ -1,9 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import async_session, Product
+from models import async_session, engine, Product
+import asyncio
 import csv
+import io
 from io import StringIO
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO
+from catalog_cache import catalog_cache
+from stock_feed import stock_feed
+import requests as rq
+import search
+
+REQUIRED_FIELDS = ['title', 'category', 'price', 'size', 'color', 'quantity']
+IMPORT_CHUNK_SIZE = 1000
+# В ответе отдаём не больше стольких ошибок, остальные только считаем
+MAX_REPORTED_ERRORS = 100
+# Пределы колонок products: строка, которая в них не помещается, — ошибка строки, а не всего чанка
+_COLUMNS = Product.__table__.c
+MAX_LENGTHS = {name: _COLUMNS[name].type.length for name in ('title', 'category', 'color', 'image_url')}
+PRICE_QUANTUM = Decimal(1).scaleb(-_COLUMNS.price.type.scale)
+MAX_PRICE = Decimal(10) ** (_COLUMNS.price.type.precision - _COLUMNS.price.type.scale) - PRICE_QUANTUM
+MAX_INTEGER = 2**31 - 1
 
 router = APIRouter()
 
@@ -24,7 +44,7 @@ async def upload_products(file: UploadFile = File(...)):
         delimiter = ';' if sample.count(';') > sample.count(',') else ','
 
         reader = csv.DictReader(StringIO(decoded), delimiter=delimiter)
-        required_fields = ['title', 'category', 'price', 'size', 'color', 'quantity']
+        required_fields = REQUIRED_FIELDS
 
         products = []
         for row in reader:
@@ -50,9 +70,175 @@ async def upload_products(file: UploadFile = File(...)):
         async with async_session() as session:
             session: AsyncSession
             session.add_all(products)
+            await session.flush()
+            await search.index_products(session, [p.id for p in products])
             await session.commit()
+        catalog_cache.invalidate()
+        stock_feed.publish({p.id: p.quantity for p in products})
 
         return {"addedCount": len(products)}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обработки CSV: {e}")
+
+
+def _text(row: dict, field: str) -> str | None:
+    value = (row.get(field) or '').strip()
+    if len(value) > MAX_LENGTHS[field]:
+        raise ValueError(f"{field} длиннее {MAX_LENGTHS[field]} символов")
+    return value or None
+
+
+def _count(row: dict, field: str) -> int:
+    value = int(row[field])
+    if not 0 <= value <= MAX_INTEGER:
+        raise ValueError(f"{field} вне диапазона 0..{MAX_INTEGER}: {row[field]}")
+    return value
+
+
+def _parse_row(row: dict) -> dict:
+    parsed = {field: _text(row, field) for field in MAX_LENGTHS}
+    for field in REQUIRED_FIELDS:
+        if not (row.get(field) or '').strip():
+            raise ValueError(f"Отсутствует поле: {field}")
+    try:
+        price = Decimal(row['price'].strip())
+    except InvalidOperation:
+        raise ValueError(f"Некорректная цена: {row['price']}")
+    # NaN и Infinity — тоже Decimal, а в колонку NOT NULL они уходят как NULL
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE or price != price.quantize(PRICE_QUANTUM):
+        raise ValueError(f"Цена должна быть от 0 до {MAX_PRICE} с точностью до {PRICE_QUANTUM}: {row['price']}")
+    parsed.update(price=price, size=_count(row, 'size'), quantity=_count(row, 'quantity'))
+    return parsed
+
+
+def _read_chunk(reader: csv.DictReader, size: int) -> tuple[list[dict], list[dict]]:
+    """Читает и валидирует до size строк; ключ — (title, category, size, color)"""
+    rows: dict[tuple, dict] = {}
+    errors = []
+    for _ in range(size):
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        try:
+            parsed = _parse_row(row)
+        except (ValueError, TypeError) as e:
+            errors.append({"line": reader.line_num, "error": str(e)})
+            continue
+        # Повтор ключа внутри чанка — побеждает последняя строка
+        key = (parsed["title"], parsed["category"], parsed["size"], parsed["color"])
+        rows[key] = parsed
+    return list(rows.values()), errors
+
+
+_update_stmt = (
+    update(Product)
+    .where(Product.id == bindparam('b_id'))
+    .values(
+        price=bindparam('b_price'),
+        quantity=bindparam('b_quantity'),
+        image_url=func.coalesce(bindparam('b_image_url'), Product.image_url),
+    )
+)
+
+
+async def _upsert_chunk(rows: list[dict]) -> tuple[int, dict[int, int]]:
+    """Вставляет новые и обновляет существующие товары чанка в одной транзакции.
+
+    Возвращает число вставленных строк и новые остатки всех затронутых товаров.
+    """
+    key_columns = (Product.title, Product.category, Product.size, Product.color)
+    async with engine.begin() as conn:
+        existing = await conn.execute(
+            select(Product.id, *key_columns).where(
+                tuple_(*key_columns).in_([(r["title"], r["category"], r["size"], r["color"]) for r in rows])
+            )
+        )
+        ids: dict[tuple, list[int]] = {}
+        for row in existing:
+            ids.setdefault((row.title, row.category, row.size, row.color), []).append(row.id)
+
+        to_insert, to_update = [], []
+        for r in rows:
+            matched = ids.get((r["title"], r["category"], r["size"], r["color"]))
+            if not matched:
+                to_insert.append(r)
+                continue
+            for product_id in matched:
+                to_update.append({
+                    "b_id": product_id,
+                    "b_price": r["price"],
+                    "b_quantity": r["quantity"],
+                    "b_image_url": r["image_url"],
+                })
+
+        quantities = {u["b_id"]: u["b_quantity"] for u in to_update}
+        if to_insert:
+            result = await conn.execute(insert(Product).returning(Product.id, sort_by_parameter_order=True), to_insert)
+            quantities.update(zip(result.scalars(), (r["quantity"] for r in to_insert)))
+        if to_update:
+            await conn.execute(_update_stmt, to_update)
+        await search.index_products(conn, quantities.keys())
+    return len(to_insert), quantities
+
+
+async def import_products_csv(raw: BinaryIO, chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    """Потоково импортирует CSV: читает по строкам, пишет чанками, плохие строки пропускает"""
+    sample = raw.read(1024).decode('utf-8', errors='ignore')
+    raw.seek(0)
+    delimiter = ';' if sample.count(';') > sample.count(',') else ','
+
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text, delimiter=delimiter)
+    inserted = updated = error_count = 0
+    errors: list[dict] = []
+    try:
+        while True:
+            first_line = reader.line_num + 1
+            try:
+                rows, chunk_errors = await asyncio.to_thread(_read_chunk, reader, chunk_size)
+            except (UnicodeDecodeError, csv.Error) as e:
+                errors.append({"line": reader.line_num, "error": f"Файл не читается дальше: {e}"})
+                error_count += 1
+                break
+            error_count += len(chunk_errors)
+            errors.extend(chunk_errors[:max(0, MAX_REPORTED_ERRORS - len(errors))])
+            if rows:
+                try:
+                    added, quantities = await _upsert_chunk(rows)
+                except SQLAlchemyError as e:
+                    # Чанк откатился целиком; прежние чанки уже записаны, следующие ещё запишутся
+                    error_count += len(rows)
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({
+                            "line": first_line,
+                            "error": f"Строки {first_line}-{reader.line_num} не записаны: {getattr(e, 'orig', e)}",
+                        })
+                    continue
+                inserted += added
+                updated += len(rows) - added
+                stock_feed.publish(quantities)
+            elif not chunk_errors:
+                break
+    finally:
+        text.detach()
+        if inserted or updated:
+            catalog_cache.invalidate()
+
+    return {
+        "insertedCount": inserted,
+        "updatedCount": updated,
+        "errorCount": error_count,
+        "errors": errors,
+    }
+
+
+@router.post("/upload-products/stream")
+async def upload_products_stream(tg_id: int = Form(...), file: UploadFile = File(...)):
+    user = await rq.add_user(tg_id)
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access forbidden: Admins only")
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Файл должен быть .csv")
+    return await import_products_csv(file.file)
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from models import async_session, engine, read_session, User
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    tg_id: int
+    role: str
+
+
+class UserCache:
+    """LRU-кэш tg_id -> пользователь с ограниченным временем жизни записи
+
+    Роли меняются прямо в БД, в приложении пути смены роли нет, и кэш никто не
+    сбрасывает: новая роль видна не позже чем через USER_CACHE_TTL секунд.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[int, tuple[float, CachedUser]]" = OrderedDict()
+
+    def get(self, tg_id: int) -> Optional[CachedUser]:
+        entry = self._data.get(tg_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[tg_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(tg_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user: CachedUser) -> None:
+        self._data[user.tg_id] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(user.tg_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+        }
+
+
+user_cache = UserCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def _upsert_stmt(tg_id: int):
+    insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(User).values(tg_id=tg_id, role='user')
+    # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул и уже существующую строку
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.tg_id],
+        set_={"tg_id": stmt.excluded.tg_id},
+    )
+    return stmt.returning(User.id, User.role)
+
+
+async def resolve_user(tg_id: int) -> CachedUser:
+    """Находит или создаёт пользователя; в горячем пути обходится без обращения к БД"""
+    user = user_cache.get(tg_id)
+    if user is not None:
+        return user
+
+    # Обычно пользователь уже есть: сначала чтение, чтобы проверка роли не брала блокировку записи
+    async with read_session() as session:
+        row = (await session.execute(select(User.id, User.role).where(User.tg_id == tg_id))).one_or_none()
+    if row is None:
+        # Новый пользователь или реплика ещё не догнала — upsert на основной БД
+        async with async_session() as session:
+            row = (await session.execute(_upsert_stmt(tg_id))).one()
+            await session.commit()
+
+    user = CachedUser(id=row.id, tg_id=tg_id, role=row.role)
+    user_cache.put(user)
+    return user
+